@@ -10,13 +10,15 @@ ssh-add ~/.ssh/id_ed25519 2>/dev/null
 cd "$(dirname "$0")" || exit 1
 
 # --- 3. Check for changes ---
-if git diff --quiet data/latest/preprocessed_data_latest.csv; then
+# data/latest holds the manifest, the dataset versions it points at and the unversioned copy
+if [ -z "$(git status --porcelain data/latest)" ]; then
   echo "✅ No changes detected."
   exit 0
 fi
 
 # --- 4. Commit changes ---
-git add data/latest/preprocessed_data_latest.csv || {
+# -A also stages the removal of pruned versions
+git add -A data/latest || {
   echo "❌ Failed to 'git add'" >&2
   exit 1
 }
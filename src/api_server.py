@@ -0,0 +1,295 @@
+import argparse
+import base64
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from dataset_versions import DatasetStore
+from saved_searches import compile_searches, encode_searches, listing_columns, match_mask
+
+# Read-only JSON API over the published listings, with the same filters as the app's sidebar
+
+# Fields returned for every listing
+FIELDS = ['url', 'area', 'address', 'total_rental_price', 'size_sqm', 'rooms', 'available_from', 'energy_mark',
+          'furnished', 'creation_date', 'days_on_website', 'move_in_price', 'rent_per_person', 'expected_rent',
+          'price_delta_pct']
+
+SORT_FIELDS = ['total_rental_price', 'size_sqm', 'rooms', 'available_from', 'creation_date', 'days_on_website',
+               'move_in_price', 'rent_per_person', 'price_delta_pct']
+
+FLOAT_PARAMS = ['min_price', 'max_price', 'min_size', 'max_size', 'min_rooms', 'min_days', 'max_days', 'min_move_in',
+                'max_move_in', 'min_rent_per_person', 'max_rent_per_person', 'percentile']
+PARAMS = set(FLOAT_PARAMS) | {'area', 'available_from', 'available_to', 'include_unknown_date', 'energy_mark',
+                              'furnished', 'underpriced', 'sort', 'limit', 'cursor'}
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+# Rendered responses kept per dataset version and query
+CACHE_SIZE = 2048
+
+# How often the manifest is checked for a new dataset version
+VERSION_CHECK_SECONDS = 1.0
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class ListingIndex:
+    # Everything a query needs for one dataset version, built once: typed predicate columns, sort keys and
+    # every listing already serialized to JSON
+    def __init__(self, manifest, df):
+        self.version = manifest['version']
+        df = df.reset_index(drop=True)
+        self.columns, self.lookups = listing_columns(df)
+        self.area = df['area'].to_numpy()
+        self.price = self.columns['price']
+        self.sort_keys = {}
+        for field in SORT_FIELDS:
+            if field in df.columns:
+                if field in ('available_from', 'creation_date'):
+                    dates = pd.to_datetime(df[field], errors='coerce')
+                    keys = dates.to_numpy(dtype='datetime64[ns]').astype(np.int64).astype(float)
+                    keys[dates.isna().to_numpy()] = np.nan
+                else:
+                    keys = pd.to_numeric(df[field], errors='coerce').to_numpy(dtype=float)
+                self.sort_keys[field] = keys
+        fields = [field for field in FIELDS if field in df.columns]
+        records = df[fields].astype(object).where(df[fields].notna(), None).to_dict('records')
+        self.rows = [json.dumps(record, ensure_ascii=False) for record in records]
+
+    def query(self, params):
+        filters = query_to_filters(params)
+        # Unlike the sliders, an explicit max is always a real bound
+        compiled = encode_searches(compile_searches([{'name': 'api', 'filters': filters}], no_max={}), self.lookups)
+        s = {key: value[0] for key, value in compiled.items() if isinstance(value, np.ndarray) and key not in ('any_area',)}
+        mask = match_mask(s, self.columns)
+        if filters.get('selected_area'):
+            mask &= np.isin(self.area, filters['selected_area'])
+        positions = np.flatnonzero(mask)
+
+        # Same as the sidebar: the percentile cut is taken over what the other filters left
+        if 'percentile' in params and params['percentile'] < 100 and len(positions):
+            threshold = np.quantile(self.price[positions], params['percentile'] / 100)
+            positions = positions[self.price[positions] <= threshold]
+
+        # Stable order, unknown values last; a leading '-' sorts descending
+        sort = params.get('sort')
+        if sort:
+            field = sort.lstrip('-')
+            if field not in self.sort_keys:
+                raise ApiError(400, f"cannot sort by '{field}', use one of {', '.join(self.sort_keys)}")
+            keys = self.sort_keys[field][positions]
+            if sort.startswith('-'):
+                keys = -keys
+            positions = positions[np.lexsort((positions, keys, np.isnan(keys)))]
+        return positions
+
+
+def query_to_filters(params):
+    # API parameters in DKK and ISO dates, to the filter fields saved searches use. Missing means no constraint.
+    def range_of(low_key, high_key, scale=1):
+        low = params.get(low_key, -np.inf)
+        high = params.get(high_key, np.inf)
+        return [low / scale, high / scale]
+
+    filters = {
+        'selected_price_range_thousands': range_of('min_price', 'max_price', 1000),
+        'selected_size': range_of('min_size', 'max_size'),
+        'selected_days_on_website': range_of('min_days', 'max_days'),
+        'selected_move_in_price_thousands': range_of('min_move_in', 'max_move_in', 1000),
+        'selected_rent_per_person_thousands': range_of('min_rent_per_person', 'max_rent_per_person', 1000),
+        'include_null_available_from': params.get('include_unknown_date', True),
+        'selected_underpriced_only': params.get('underpriced', False),
+    }
+    if 'area' in params:
+        filters['selected_area'] = params['area']
+    if 'min_rooms' in params:
+        filters['selected_rooms'] = params['min_rooms']
+    if 'available_from' in params or 'available_to' in params:
+        filters['selected_available_from'] = [params.get('available_from', '1970-01-01'), params.get('available_to', '2200-01-01')]
+    if 'energy_mark' in params:
+        filters['selected_energy_mark'] = params['energy_mark']
+    if 'furnished' in params:
+        filters['selected_furnished'] = params['furnished']
+    return filters
+
+
+def parse_params(query):
+    params = {}
+    for key, value in parse_qsl(query, keep_blank_values=True):
+        if key not in PARAMS:
+            raise ApiError(400, f"unknown parameter '{key}'")
+        if key == 'area':
+            params.setdefault('area', []).append(value)
+            continue
+        try:
+            if key in FLOAT_PARAMS:
+                value = float(value)
+            elif key == 'limit':
+                value = int(value)
+            elif key in ('include_unknown_date', 'underpriced'):
+                value = value.lower() in ('1', 'true', 'yes')
+            elif key in ('available_from', 'available_to'):
+                value = pd.Timestamp(value).strftime('%Y-%m-%d')
+        except ValueError:
+            raise ApiError(400, f"invalid value for '{key}': {value}")
+        params[key] = value
+    if not 1 <= params.get('limit', DEFAULT_LIMIT) <= MAX_LIMIT:
+        raise ApiError(400, f"limit must be between 1 and {MAX_LIMIT}")
+    return params
+
+
+def canonical_query(params):
+    # Same query, same cache key and ETag, whatever the parameter order
+    return json.dumps({key: value for key, value in params.items() if key != 'cursor'}, sort_keys=True)
+
+
+def encode_cursor(version, query_hash, offset):
+    return base64.urlsafe_b64encode(json.dumps([version, query_hash, offset]).encode()).decode()
+
+
+def decode_cursor(cursor, version, query_hash):
+    # Offsets are only meaningful for the dataset version and query they were handed out for
+    try:
+        cursor_version, cursor_query, offset = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ApiError(400, 'invalid cursor')
+    if cursor_query != query_hash:
+        raise ApiError(400, 'cursor belongs to a different query')
+    if cursor_version != version:
+        raise ApiError(410, 'the dataset was updated since this cursor was issued, start again without a cursor')
+    return offset
+
+
+class ListingApi:
+    def __init__(self, store=None, cache_size=CACHE_SIZE):
+        self.store = store or DatasetStore()
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.index = None
+        self.checked_at = 0.0
+
+    def current_index(self):
+        now = time.monotonic()
+        if self.index is None or now - self.checked_at > VERSION_CHECK_SECONDS:
+            self.checked_at = now
+            dataset = self.store.get()
+            if dataset is None:
+                raise ApiError(503, 'no dataset published yet')
+            manifest, df = dataset
+            if self.index is None or self.index.version != manifest['version']:
+                # Build outside the lock, requests keep using the old index meanwhile
+                index = ListingIndex(manifest, df)
+                with self.lock:
+                    self.index = index
+                    self.cache.clear()
+        return self.index
+
+    def listings(self, query, if_none_match=None):
+        # Returns (etag, body), body is None when the client's copy is still current
+        params = parse_params(query)
+        index = self.current_index()
+        query_hash = hashlib.sha1(canonical_query(params).encode()).hexdigest()[:16]
+        cursor = params.get('cursor')
+        key = (index.version, query_hash, cursor)
+        etag = '"' + hashlib.sha1(repr(key).encode()).hexdigest()[:20] + '"'
+        if if_none_match == etag:
+            return etag, None
+
+        with self.lock:
+            body = self.cache.get(key)
+            if body is not None:
+                self.cache.move_to_end(key)
+                return etag, body
+
+        offset = decode_cursor(cursor, index.version, query_hash) if cursor else 0
+        limit = params.get('limit', DEFAULT_LIMIT)
+        positions = index.query(params)
+        page = positions[offset:offset + limit]
+        next_cursor = encode_cursor(index.version, query_hash, offset + limit) if offset + limit < len(positions) else None
+        body = ('{"version": ' + json.dumps(index.version) + ', "total": ' + str(len(positions)) +
+                ', "next_cursor": ' + json.dumps(next_cursor) +
+                ', "items": [' + ', '.join(index.rows[position] for position in page) + ']}').encode('utf-8')
+
+        with self.lock:
+            self.cache[key] = body
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return etag, body
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so clients don't pay for a new connection per request. Without TCP_NODELAY the separate
+    # header and body writes wait on delayed ACKs, about 40 ms per request.
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    api = None
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        try:
+            if parts.path == '/listings':
+                etag, body = self.api.listings(parts.query, self.headers.get('If-None-Match'))
+                if body is None:
+                    return self.respond(304, b'', etag)
+                return self.respond(200, body, etag)
+            if parts.path == '/health':
+                index = self.api.current_index()
+                return self.respond(200, json.dumps({'version': index.version, 'rows': len(index.rows)}).encode())
+            raise ApiError(404, 'not found, use /listings or /health')
+        except ApiError as e:
+            self.respond(e.status, json.dumps({'error': str(e)}).encode())
+
+    def respond(self, status, body, etag=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        if etag:
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'public, max-age=60')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Access logs would cost more than the requests themselves
+        pass
+
+
+def start_api_server(host='127.0.0.1', port=0, api=None):
+    # Starts the server in a background thread and returns (server, base url)
+    handler = type('BoundApiHandler', (ApiHandler,), {'api': api or ListingApi()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://{host}:{server.server_address[1]}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Read-only JSON API over the latest published listings')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args()
+
+    server, url = start_api_server(args.host, args.port)
+    print(f"Serving listings on {url}/listings, e.g. {url}/listings?area=Valby&max_price=15000&sort=-size_sqm&limit=20")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,11 @@ import streamlit as st
 import pandas as pd
 import os
 from datetime import datetime, timedelta
+from dataset_versions import LATEST_DIR, DatasetStore
+from filters import FILTER_KEYS, apply_filters
+from profiling import finish_rerun, start_rerun
+from saved_searches import load_saved_searches, save_search, search_to_filters
+from text_store import TEXT_COLUMNS, listing_ids, read_listing_texts
 
 # Set up page config and custom CSS for left alignment
 st.set_page_config(page_title="🏠 Apartment Finder", layout="wide")
@@ -38,16 +43,38 @@ st.markdown(
 unsafe_allow_html=True
 )
 
-# Function to get the latest CSV file from the 'data/preprocessed' folder
-def get_latest_file():
-    folder = 'data/latest'
-    files = [f for f in os.listdir(folder) if f.endswith('.csv')]
-    if files:
-        latest_file = max(files, key=lambda f: os.path.getmtime(os.path.join(folder, f)))
-        return os.path.join(folder, latest_file)
+# Time every phase of this rerun (panel with ?profile=1)
+profiler = start_rerun()
+
+# One copy of the dataset per server process, shared read-only by every session; sessions only keep their
+# filters and matching row labels. New versions named by data/latest/manifest.json load in the background.
+@st.cache_resource
+def dataset_store():
+    return DatasetStore()
+
+# Title, description and breadcrumb are fetched one listing at a time, only when a listing is opened
+@st.cache_data(max_entries=1000)
+def listing_texts(texts_path, listing_id):
+    return read_listing_texts(texts_path, listing_id)
+
+def show_listing_details(row, listing_id, manifest):
+    if all(column in row.index for column in TEXT_COLUMNS):
+        # Datasets published before the side store still carry the texts
+        texts = {column: row[column] for column in TEXT_COLUMNS}
+    elif manifest.get('texts') and not pd.isna(listing_id):
+        texts = listing_texts(os.path.join(LATEST_DIR, manifest['texts']), int(listing_id)) or {}
     else:
-        st.error("⚠️ No preprocessed CSV files found.")
-        return None
+        texts = {}
+
+    st.write(f"### 🏠 {texts.get('title') or row['address']}")
+    st.caption(f"{texts.get('breadcrumb') or row['area']}  \n{row['address']}")
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Total Rent", f"{row['total_rental_price']:.0f} kr")
+    col2.metric("Size", f"{row['size_sqm']:.0f} m²")
+    col3.metric("Rooms", f"{row['rooms']:.0f}")
+    col4.metric("Move-in Price", f"{row['move_in_price']:.0f} kr")
+    st.write(texts.get('description') or "No description available.")
+    st.link_button("🔗 View on boligportal", row['url'])
 
 # Initialize session state flags if they don't exist
 if 'initialized' not in st.session_state:
@@ -56,37 +83,17 @@ if 'initialized' not in st.session_state:
     st.session_state.reset_filters = False
     st.session_state.apply_preset = False
 
-# Load the latest CSV file
-latest_file = get_latest_file()
+# The newest fully loaded dataset version
+dataset = dataset_store().get()
+profiler.lap('load_dataset')
 
-if latest_file:
-    # Get the modification time of the latest file
-    latest_file_mtime = os.path.getmtime(latest_file)
-    latest_file_date = (datetime.fromtimestamp(latest_file_mtime) + timedelta(hours=2)).strftime("%Y-%m-%d %H:%M:%S")
+if dataset:
+    # Shared dataset, never modify it in place
+    manifest, df = dataset
+    dataset_version = manifest['version']
 
     # Big title with small last update text
-    st.markdown(f"# 🏙️ Find apartment in CPH  \n<Large>🕒 Last update {latest_file_date} CET</Large>", unsafe_allow_html=True)
-    
-    # Load data once at the beginning
-    df = pd.read_csv(latest_file)
-
-    # Calculate total rental price once
-    df['total_rental_price'] = df['monthly_rent'] + df['monthly_aconto']
-    
-    # Calculate rent per person metric: (total_monthly_rent - 900) / (number of rooms - 1)
-    # Only calculate for apartments with more than 1 room to avoid division by zero
-    df['rent_per_person'] = df.apply(lambda row: 
-        (row['total_rental_price'] - 900) / (row['rooms'] - 1) 
-        if pd.notna(row['rooms']) and row['rooms'] > 1 
-        else None, axis=1)
-    
-    # Create a new column 'move_in_price' by summing 'monthly_rent', 'monthly_aconto', 'deposit', and 'prepaid_rent'
-    try:
-        df['move_in_price'] = df[['monthly_rent', 'monthly_aconto', 'deposit', 'prepaid_rent']].sum(axis=1)
-    except Exception as e:
-        print(f"Error calculating move_in_price: {e}")
-        # Fallback if calculation fails
-        df['move_in_price'] = df['monthly_rent'] * 3  # Simple approximation
+    st.markdown(f"# 🏙️ Find apartment in CPH  \n<Large>🕒 Last update {manifest['published_at']} CET</Large>", unsafe_allow_html=True)
 
     # Get available areas from the dataset
     areas = sorted(list(df['area'].unique()))
@@ -140,30 +147,50 @@ if latest_file:
     # Furnished options
     furnished_options = ['All'] + sorted(df['furnished'].dropna().unique().tolist())
 
+    # Rent model estimates are only present in datasets preprocessed with the rent model
+    has_rent_estimates = 'price_delta_pct' in df.columns
+
+    # Default value of every filter, used on first load, on reset and for fields a saved search leaves out
+    default_filters = {
+        'selected_area': [],
+        'include_null_available_from': True,
+        'selected_available_from': [available_from_min, available_from_max],
+        'selected_price_range_thousands': (min_price_thousands, max_price_thousands),
+        'selected_rooms': 'All',
+        'selected_size': (min_size, max_size),
+        'selected_energy_mark': 'All',
+        'selected_percentile': 100,
+        'selected_furnished': 'All',
+        'selected_days_on_website': (0, 90),
+        'selected_move_in_price_thousands': (min_move_in_price_thousands, max_move_in_price_thousands),
+        'selected_rent_per_person_thousands': (min_rent_per_person_thousands, max_rent_per_person_thousands),
+        'selected_underpriced_only': False,
+    }
+    profiler.lap('slider_bounds')
+
     # Initialize session state only once
     if not st.session_state.initialized:
-        st.session_state.original_df = df.copy()
-        st.session_state.filtered_df = df.copy()
+        # None means every row matches
+        st.session_state.filtered_rows = None
+        st.session_state.filtered_rows_version = dataset_version
+
+        # Part of the listings table's key, bumped whenever the rows change so an old row selection is dropped
+        st.session_state.table_generation = 0
         
         # Initialize sorting state
         st.session_state.sort_column = None
         st.session_state.sort_direction = True  # True for ascending, False for descending
         
         # Initialize all filter values
-        st.session_state.selected_area = []
-        st.session_state.include_null_available_from = True
-        st.session_state.selected_available_from = [available_from_min, available_from_max]
-        st.session_state.selected_price_range_thousands = (min_price_thousands, max_price_thousands)
-        st.session_state.selected_rooms = 'All'
-        st.session_state.selected_size = (min_size, max_size)
-        st.session_state.selected_energy_mark = 'All'
-        st.session_state.selected_percentile = 100
-        st.session_state.selected_furnished = 'All'
-        st.session_state.selected_days_on_website = (0, 90)
-        st.session_state.selected_move_in_price_thousands = (min_move_in_price_thousands, max_move_in_price_thousands)
-        st.session_state.selected_rent_per_person_thousands = (min_rent_per_person_thousands, max_rent_per_person_thousands)
+        for key, value in default_filters.items():
+            st.session_state[key] = value
         
         st.session_state.initialized = True
+
+    # Row labels from an older dataset don't apply to this one, filter again
+    if st.session_state.filtered_rows_version != dataset_version:
+        st.session_state.apply_filters = True
+    profiler.lap('session_init')
     
     # Streamlit sidebar for filters
     st.sidebar.header("🔍 Filter Options")
@@ -171,41 +198,36 @@ if latest_file:
     # --- Pre-saved Filters Section ---
     st.sidebar.subheader("🧠 Pre-saved Filters")
 
-    # Button to apply pre-saved filter
-    preset_clicked = st.sidebar.button("🎯 Apply 'Large Apartments in CPH' Preset")
-    if preset_clicked:
-        st.session_state.apply_preset = True
-        st.rerun()
+    # Saved searches are shared with the saved search matcher that runs after each scrape
+    saved_searches = load_saved_searches()
+    saved_search_names = [search['name'] for search in saved_searches]
+
+    if saved_search_names:
+        selected_saved_search = st.sidebar.selectbox("Saved search", options=saved_search_names)
+
+        # Button to apply pre-saved filter
+        preset_clicked = st.sidebar.button("🎯 Apply Saved Search")
+        if preset_clicked:
+            st.session_state.apply_preset = selected_saved_search
+            st.rerun()
     
     # Handle preset application
     if st.session_state.apply_preset:
-        # Store preset values
-        st.session_state.selected_area = [
-            'Frederiksberg C', 'Frederiksberg', 'København K', 'København NV', 
-            'København N', 'København SV', 'København V', 'København Ø', 
-            'Nordhavn', 'Valby', 'Hellerup', 'Vanløse'
-        ]
-        st.session_state.include_null_available_from = True
-        st.session_state.selected_available_from = [datetime(2025, 8, 1).date(), datetime(2025, 9, 1).date()]
-        st.session_state.selected_price_range_thousands = (4.6, 20.1)
-        st.session_state.selected_rooms = '4'
-        st.session_state.selected_size = (80, 363)
-        st.session_state.selected_energy_mark = 'All'
-        st.session_state.selected_percentile = 100
-        st.session_state.selected_furnished = 'All'
-        st.session_state.selected_days_on_website = (0, 10)
-        st.session_state.selected_move_in_price_thousands = (6.4, 110.0)
-        st.session_state.selected_rent_per_person_thousands = (min_rent_per_person_thousands, max_rent_per_person_thousands)
+        # Store preset values, falling back to the defaults for fields the search leaves out
+        search = next((s for s in saved_searches if s['name'] == st.session_state.apply_preset), None)
+        if search is not None:
+            for key, value in search_to_filters(search, default_filters).items():
+                st.session_state[key] = value
         
         # Reset flag and trigger filter application
         st.session_state.apply_preset = False
         st.session_state.apply_filters = True
     
-    # Area filter
+    # Area filter; a saved search or an older dataset can name areas that have no listings today
     selected_area = st.sidebar.multiselect(
         "📍 Select Area", 
         options=areas,
-        default=st.session_state.selected_area
+        default=[area for area in st.session_state.selected_area if area in areas]
     )
     
     # Include null available_from checkbox
@@ -297,6 +319,16 @@ if latest_file:
     )
     st.sidebar.markdown("<small>Formula: (monthly_rent - 900) / (rooms - 1), in thousands DKK</small>", unsafe_allow_html=True)
     
+    # Underpriced checkbox (only when the dataset carries rent estimates)
+    if has_rent_estimates:
+        selected_underpriced_only = st.sidebar.checkbox(
+            "🏷️ Only show apartments cheaper than expected",
+            value=st.session_state.selected_underpriced_only
+        )
+        st.sidebar.markdown("<small>Expected rent is estimated from size, rooms, floor, furnishing and area</small>", unsafe_allow_html=True)
+    else:
+        selected_underpriced_only = False
+    
     # Apply Filters button
     apply_clicked = st.sidebar.button("✅ Apply Filters")
     if apply_clicked:
@@ -313,11 +345,19 @@ if latest_file:
         st.session_state.selected_days_on_website = selected_days_on_website
         st.session_state.selected_move_in_price_thousands = selected_move_in_price_thousands
         st.session_state.selected_rent_per_person_thousands = selected_rent_per_person_thousands
+        st.session_state.selected_underpriced_only = selected_underpriced_only
         
         # Set flag to apply filters and rerun
         st.session_state.apply_filters = True
         st.rerun()
     
+    # Save the applied filters as a standing search
+    new_search_name = st.sidebar.text_input("💾 Save applied filters as")
+    save_clicked = st.sidebar.button("💾 Save Search", disabled=not new_search_name)
+    if save_clicked:
+        save_search(new_search_name, {key: st.session_state[key] for key in FILTER_KEYS})
+        st.sidebar.success(f"Saved '{new_search_name}'. New listings matching it will be written to the outbox after each scrape.")
+    
     # Add a horizontal line to separate buttons
     st.sidebar.markdown("---")
     
@@ -330,141 +370,44 @@ if latest_file:
     # Handle reset filters action
     if st.session_state.reset_filters:
         # Reset all filter values to defaults
-        st.session_state.selected_area = []
-        st.session_state.include_null_available_from = True
-        st.session_state.selected_available_from = [available_from_min, available_from_max]
-        st.session_state.selected_price_range_thousands = (min_price_thousands, max_price_thousands)
-        st.session_state.selected_rooms = 'All'
-        st.session_state.selected_size = (min_size, max_size)
-        st.session_state.selected_energy_mark = 'All'
-        st.session_state.selected_percentile = 100
-        st.session_state.selected_furnished = 'All'
-        st.session_state.selected_days_on_website = (0, 90)
-        st.session_state.selected_move_in_price_thousands = (min_move_in_price_thousands, max_move_in_price_thousands)
-        st.session_state.selected_rent_per_person_thousands = (min_rent_per_person_thousands, max_rent_per_person_thousands)
+        for key, value in default_filters.items():
+            st.session_state[key] = value
         
         # Reset flag and trigger filter application
         st.session_state.reset_filters = False
         st.session_state.apply_filters = True
+    profiler.lap('sidebar')
     
     # Apply filters when necessary
     if st.session_state.apply_filters:
-        # Start with the original dataset
-        filtered_df = df.copy()
-        
-        # Apply area filter
-        if st.session_state.selected_area:
-            filtered_df = filtered_df[filtered_df['area'].isin(st.session_state.selected_area)]
-        
-        # Apply furnished filter
-        if st.session_state.selected_furnished != 'All':
-            filtered_df = filtered_df[filtered_df['furnished'] == st.session_state.selected_furnished]
-        
-        # Apply rooms filter
-        if st.session_state.selected_rooms != 'All':
-            filtered_df = filtered_df[filtered_df['rooms'] >= float(st.session_state.selected_rooms)]
-        
-        # Apply days on website filter
-        filtered_df = filtered_df[
-            (filtered_df['days_on_website'] >= st.session_state.selected_days_on_website[0]) &
-            (filtered_df['days_on_website'] <= st.session_state.selected_days_on_website[1])
-        ]
-
-        # Handle available_from filtering
-        try:
-            available_from_min = pd.to_datetime(st.session_state.selected_available_from[0])
-            available_from_max = pd.to_datetime(st.session_state.selected_available_from[1])
-            
-            if st.session_state.include_null_available_from:
-                filtered_df = filtered_df[
-                    ((pd.to_datetime(filtered_df['available_from'], errors='coerce') >= available_from_min) | 
-                    (filtered_df['available_from'].isnull())) &
-                    ((pd.to_datetime(filtered_df['available_from'], errors='coerce') <= available_from_max) | 
-                    (filtered_df['available_from'].isnull()))
-                ]
-            else:
-                # Filter out null available_from and apply date filter
-                filtered_df = filtered_df[
-                    pd.to_datetime(filtered_df['available_from'], errors='coerce').notna() &
-                    (pd.to_datetime(filtered_df['available_from'], errors='coerce') >= available_from_min) &
-                    (pd.to_datetime(filtered_df['available_from'], errors='coerce') <= available_from_max)
-                ]
-        except Exception as e:
-            st.warning(f"Date filtering error: {e}")
-            # If date filtering fails, keep all rows
-            pass
-            
-        # Apply price range filter
-        price_min = st.session_state.selected_price_range_thousands[0] * 1000
-        price_max = st.session_state.selected_price_range_thousands[1] * 1000
-        
-        # If user selects max value, treat it as "no maximum"
-        if price_max >= 45000:
-            filtered_df = filtered_df[filtered_df['total_rental_price'] >= price_min]
-        else:
-            filtered_df = filtered_df[(filtered_df['total_rental_price'] >= price_min) & 
-                                      (filtered_df['total_rental_price'] <= price_max)]
-        
-        # Apply move-in price filter
-        move_in_min = st.session_state.selected_move_in_price_thousands[0] * 1000
-        move_in_max = st.session_state.selected_move_in_price_thousands[1] * 1000
-        
-        if move_in_max >= 100000:
-            filtered_df = filtered_df[filtered_df['move_in_price'] >= move_in_min]
-        else:
-            filtered_df = filtered_df[(filtered_df['move_in_price'] >= move_in_min) & 
-                                     (filtered_df['move_in_price'] <= move_in_max)]
-
-        # Apply rent per person filter
-        rent_per_person_min = st.session_state.selected_rent_per_person_thousands[0] * 1000
-        rent_per_person_max = st.session_state.selected_rent_per_person_thousands[1] * 1000
-        
-        # Only apply filter to apartments where rent_per_person is not null
-        if rent_per_person_max >= 20000:
-            filtered_df = filtered_df[
-                (filtered_df['rent_per_person'].isna()) | 
-                (filtered_df['rent_per_person'] >= rent_per_person_min)
-            ]
-        else:
-            filtered_df = filtered_df[
-                (filtered_df['rent_per_person'].isna()) |
-                ((filtered_df['rent_per_person'] >= rent_per_person_min) & 
-                 (filtered_df['rent_per_person'] <= rent_per_person_max))
-            ]
-
-        # Apply size filter
-        filtered_df = filtered_df[
-            (filtered_df['size_sqm'] >= st.session_state.selected_size[0]) &
-            (filtered_df['size_sqm'] <= st.session_state.selected_size[1])
-        ]
-        
-        # Apply energy mark filter
-        if st.session_state.selected_energy_mark != 'All':
-            filtered_df = filtered_df[filtered_df['energy_mark'] == st.session_state.selected_energy_mark]
-            
-        # Apply percentile filter LAST
-        if st.session_state.selected_percentile < 100:
-            # Get the threshold price at the selected percentile
-            price_threshold = filtered_df['total_rental_price'].quantile(st.session_state.selected_percentile / 100)
-            # Apply the filter
-            filtered_df = filtered_df[filtered_df['total_rental_price'] <= price_threshold]
+        filtered_df = apply_filters(df, {key: st.session_state[key] for key in FILTER_KEYS}, warn=st.warning)
         
         # Reset sorting
         st.session_state.sort_column = None
         st.session_state.sort_direction = True
         
-        # Save the filtered dataframe to session state
-        st.session_state.filtered_df = filtered_df
+        # Keep only the labels of the matching rows in session state, the rows themselves stay in the shared dataset
+        st.session_state.filtered_rows = filtered_df.index.to_numpy()
+        st.session_state.filtered_rows_version = dataset_version
+
+        # The selected row position would point at a different listing now
+        st.session_state.table_generation += 1
         
         # Reset flag
         st.session_state.apply_filters = False
+    profiler.lap('filter')
         
     # Select the columns to display in the table
     display_columns = ['url', 'area', 'total_rental_price', 'size_sqm', 'rooms', 'available_from', 
                       'energy_mark', 'furnished', 'creation_date', 'move_in_price', 'rent_per_person']
+    if has_rent_estimates:
+        display_columns.append('price_delta_pct')
     
+    # Matching rows of the shared dataset
+    current_df = df if st.session_state.filtered_rows is None else df.loc[st.session_state.filtered_rows]
+
     # Create display dataframe
-    filtered_df_display = st.session_state.filtered_df[display_columns].copy()
+    filtered_df_display = current_df[display_columns].copy()
 
     # Convert available_from to datetime for better display
     filtered_df_display['available_from'] = pd.to_datetime(filtered_df_display['available_from'], errors='coerce')
@@ -486,15 +429,15 @@ if latest_file:
         'furnished': 'Furnished',
         'creation_date': 'Listing Date',
         'move_in_price': 'Move-in Price',
-        'rent_per_person': 'Rent Per Person'
+        'rent_per_person': 'Rent Per Person',
+        'price_delta_pct': 'vs Expected Rent'
     })
+    profiler.lap('display_format')
 
     # Display dataframe with clickable links using st.dataframe
     if not filtered_df_display.empty:
         
         # Create a table for statistics
-        current_df = st.session_state.filtered_df
-        
         rent_stats = {
             'min': current_df['total_rental_price'].min(),
             'max': current_df['total_rental_price'].max(),
@@ -535,16 +478,21 @@ if latest_file:
         stats_df = pd.DataFrame(stats_data, index=['Rent', 'Size', 'Rent Per Person'])
 
         # Display the statistics table
-        st.write(f"### 📊 Statistics on Filtered Data ({len(st.session_state.filtered_df)} entries):")
+        st.write(f"### 📊 Statistics on Filtered Data ({len(current_df)} entries):")
         st.dataframe(stats_df, use_container_width=True, hide_index=False)
+        profiler.lap('statistics')
         
         # Display listings
         st.write(f"### 🏘️ Listings")
-        st.dataframe(
+        st.caption("Select a row to see the full listing")
+        table = st.dataframe(
             filtered_df_display,
             height=600,
             use_container_width=True,
             hide_index=True,
+            key=f'listings_table_{st.session_state.table_generation}',
+            on_select='rerun',
+            selection_mode='single-row',
             column_config={
                 "URL": st.column_config.LinkColumn(label="🔗 View Listing", display_text="View Listing"),
                 "Total Rent": st.column_config.NumberColumn(format="kr %d"),
@@ -553,11 +501,22 @@ if latest_file:
                 "Listing Date": st.column_config.DateColumn(format="MMM DD, YYYY"),
                 "Move-in Price": st.column_config.NumberColumn(format="kr %d"),
                 "Rent Per Person": st.column_config.NumberColumn(format="kr %.0f"),
+                "vs Expected Rent": st.column_config.NumberColumn(format="%+.1f%%"),
             }
         )
+        profiler.lap('render_table')
+
+        # Detail view of the selected listing
+        if table.selection.rows and table.selection.rows[0] < len(current_df):
+            selected = current_df.iloc[[table.selection.rows[0]]]
+            show_listing_details(selected.iloc[0], listing_ids(selected).iloc[0], manifest)
+            profiler.lap('listing_details')
 
     else:
         st.write("❌ No apartments match the selected filters.")
 
 else:
-    st.write("❌ No data available.")
\ No newline at end of file
+    st.error("⚠️ No preprocessed CSV files found.")
+    st.write("❌ No data available.")
+
+finish_rerun(profiler)
\ No newline at end of file
@@ -0,0 +1,191 @@
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+from multiprocessing import Pool, cpu_count
+
+import pandas as pd
+from tqdm import tqdm
+
+from file_utils import atomic_write_csv, atomic_write_text, file_sha256
+from log_utils import init_worker_logging, start_log_listener
+from preprocess_scraped_data import preprocess
+from rent_model import (MODEL_PATH, TRAIN_COLUMNS, current_weights, empty_state, model_lock, partial_fit, save_state,
+                        score_listings, snapshot_date, solve)
+
+RAW_DIR = 'data/raw'
+PROCESSED_DIR = 'data/processed'
+STATS_DIR = 'outputs/stats'
+MANIFEST_PATH = os.path.join(PROCESSED_DIR, 'backfill_manifest.json')
+
+# Modules a day goes through: preprocess_scraped_data and everything it imports from src/
+PROCESSING_MODULES = ['preprocess_scraped_data.py', 'rent_model.py', 'dataset_versions.py', 'filters.py', 'text_store.py',
+                      'file_utils.py']
+
+# Restart workers now and then so memory fragmentation from big days doesn't pile up
+TASKS_PER_WORKER = 10
+
+# Rent model weights, solved once in the parent and handed to every worker
+_weights = None
+
+
+def code_hash(modules=PROCESSING_MODULES):
+    # Changing the cleaning logic must invalidate every day, so the source of every module it runs is part of the key
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    sha = hashlib.sha256()
+    for module in modules:
+        sha.update(f'{module}={file_sha256(os.path.join(src_dir, module))}\n'.encode())
+    return sha.hexdigest()
+
+
+def date_range(start, end):
+    day = datetime.strptime(start, '%Y-%m-%d')
+    last = datetime.strptime(end, '%Y-%m-%d')
+    while day <= last:
+        yield day.strftime('%Y-%m-%d')
+        day += timedelta(days=1)
+
+
+def load_manifest(path=MANIFEST_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+
+def init_worker(weights, log_queue):
+    global _weights
+    _weights = weights
+    init_worker_logging(log_queue)
+
+
+def process_day(args):
+    date, input_hash = args
+    start_time = time.time()
+    result = {'date': date, 'input_hash': input_hash, 'rows': 0, 'error': None}
+
+    # Stats go to a private folder first and are moved into place once the day succeeded
+    stats_tmp = tempfile.mkdtemp(dir=STATS_DIR, prefix=f'.tmp_{date}_')
+    try:
+        df = pd.read_csv(os.path.join(RAW_DIR, f'bolig_data_{date}.csv'))
+        result['rows'] = len(df)
+        df = preprocess(df, date, stats_dir=stats_tmp)
+        df = score_listings(df, _weights)
+        atomic_write_csv(df, os.path.join(PROCESSED_DIR, f'preprocessed_data_{date}.csv'), index=False, header=True, encoding='utf-8')
+        for name in os.listdir(stats_tmp):
+            os.replace(os.path.join(stats_tmp, name), os.path.join(STATS_DIR, name))
+    except Exception as e:
+        logging.error(f"Error reprocessing {date}: {e}")
+        result['error'] = str(e)
+    finally:
+        shutil.rmtree(stats_tmp, ignore_errors=True)
+
+    result['seconds'] = round(time.time() - start_time, 2)
+    return result
+
+
+def rebuild_model(processed_dir=PROCESSED_DIR, model_path=MODEL_PATH):
+    # Retrain the rent model from scratch on the processed snapshots, oldest first like the daily runs add
+    # them, so listings are fitted on the day they first appeared. Returns the new weights.
+    with model_lock(model_path):
+        state = empty_state()
+        for path in sorted(glob.glob(os.path.join(processed_dir, 'preprocessed_data_*.csv'))):
+            date = snapshot_date(path)
+            if date is not None:
+                partial_fit(state, pd.read_csv(path, usecols=lambda column: column in TRAIN_COLUMNS), date)
+        save_state(state, model_path)
+    return solve(state) if state['n_rows'] else None
+
+
+def rescore_day(path):
+    try:
+        df = score_listings(pd.read_csv(path), _weights)
+        atomic_write_csv(df, path, index=False, header=True, encoding='utf-8')
+    except Exception as e:
+        logging.error(f"Error rescoring {path}: {e}")
+        return path
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reprocess past days of raw scrapes in parallel')
+    parser.add_argument('--start', required=True, help='First day to reprocess (YYYY-MM-DD)')
+    parser.add_argument('--end', default=datetime.today().strftime('%Y-%m-%d'), help='Last day to reprocess (YYYY-MM-DD), defaults to today')
+    parser.add_argument('--workers', type=int, default=cpu_count(), help='Days processed at the same time, bounds peak memory')
+    parser.add_argument('--force', action='store_true', help='Reprocess even when the raw file and cleaning code are unchanged')
+    args = parser.parse_args()
+
+    today_date = datetime.today().strftime('%Y-%m-%d')
+    os.makedirs(PROCESSED_DIR, exist_ok=True)
+    os.makedirs(STATS_DIR, exist_ok=True)
+
+    manifest = load_manifest()
+    code = code_hash()
+
+    # Work out which days actually need doing
+    todo = []
+    skipped = 0
+    for date in date_range(args.start, args.end):
+        raw_path = os.path.join(RAW_DIR, f'bolig_data_{date}.csv')
+        if not os.path.exists(raw_path):
+            continue
+        input_hash = hashlib.sha256((file_sha256(raw_path) + code).encode()).hexdigest()
+        processed_exists = os.path.exists(os.path.join(PROCESSED_DIR, f'preprocessed_data_{date}.csv'))
+        if not args.force and processed_exists and manifest.get(date, {}).get('input_hash') == input_hash:
+            skipped += 1
+            continue
+        todo.append((date, input_hash))
+
+    print(f"{len(todo)} day(s) to reprocess, {skipped} unchanged day(s) skipped.")
+    if not todo:
+        return
+
+    # Workers log through one listener in this process, which owns the error log
+    log_path = f'outputs/errors/backfill_errors_{today_date}.log'
+    log_queue, listener = start_log_listener(log_path)
+
+    # Days are first cleaned and scored with the model as it is
+    start_time = time.time()
+    failed = []
+    with Pool(min(args.workers, len(todo)), initializer=init_worker, initargs=(current_weights(), log_queue), maxtasksperchild=TASKS_PER_WORKER) as pool:
+        for result in tqdm(pool.imap_unordered(process_day, todo), desc="Reprocessing days", total=len(todo)):
+            if result['error']:
+                failed.append(result['date'])
+                continue
+            # Record progress after every day so an interrupted backfill picks up where it left off
+            manifest[result['date']] = {'input_hash': result['input_hash'], 'rows': result['rows'], 'seconds': result['seconds'],
+                                        'processed_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+            atomic_write_text(json.dumps(manifest, indent=2, sort_keys=True), MANIFEST_PATH)
+        # Not terminate(), which can kill a worker holding the log queue's lock and hang listener.stop()
+        pool.close()
+        pool.join()
+    print(f"Reprocessed {len(todo) - len(failed)} day(s) in {time.time() - start_time:.2f} seconds, {len(failed)} failed.")
+
+    # The model was trained on what the old code made of these days. Retrain it on the new outputs and score
+    # every snapshot again, the estimates of untouched days move with the model too.
+    if len(failed) < len(todo):
+        start_time = time.time()
+        weights = rebuild_model()
+        paths = sorted(glob.glob(os.path.join(PROCESSED_DIR, 'preprocessed_data_*.csv')))
+        with Pool(min(args.workers, len(paths)), initializer=init_worker, initargs=(weights, log_queue), maxtasksperchild=TASKS_PER_WORKER) as pool:
+            failed_rescores = [path for path in tqdm(pool.imap_unordered(rescore_day, paths), desc="Rescoring days", total=len(paths)) if path]
+            pool.close()
+            pool.join()
+        print(f"Retrained the rent model and rescored {len(paths)} day(s) in {time.time() - start_time:.2f} seconds, {len(failed_rescores)} failed.")
+        failed.extend(snapshot_date(path) for path in failed_rescores)
+    listener.stop()
+
+    for date in sorted(set(failed)):
+        print(f"  Failed: {date} (see {log_path})")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
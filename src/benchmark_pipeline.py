@@ -0,0 +1,234 @@
+import argparse
+import glob
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+from filters import add_derived_columns, apply_filters
+from preprocess_scraped_data import preprocess
+import scrape_boligportal
+from scrape_boligportal import extract_apartment_info
+from stub_server import start_stub_server
+from synthetic_data import AREAS, ENERGY_MARKS, generate_listing_pages, generate_processed_frame, generate_raw_frame
+
+OUTPUT_DIR = 'outputs/benchmarks'
+
+# A metric is a regression when it moves the wrong way by more than this fraction
+REGRESSION_THRESHOLD = 0.2
+
+
+def percentile_ms(timings, q):
+    return round(float(np.percentile(timings, q)) * 1000, 3)
+
+
+def bench_parse(pages, seed):
+    listing_pages = generate_listing_pages(pages, seed)
+    timings = []
+    for url, html in listing_pages:
+        start = time.perf_counter()
+        extract_apartment_info(html, url)
+        timings.append(time.perf_counter() - start)
+    return {
+        'pages': pages,
+        'pages_per_second': round(pages / sum(timings), 1),
+        'p50_ms': percentile_ms(timings, 50),
+        'p95_ms': percentile_ms(timings, 95),
+    }
+
+
+def bench_preprocess(rows, seed):
+    raw = generate_raw_frame(rows, seed)
+    start = time.perf_counter()
+    preprocess(raw, '2025-06-26', stats_dir=None)
+    elapsed = time.perf_counter() - start
+    return {
+        'rows': rows,
+        'seconds': round(elapsed, 3),
+        'rows_per_second': round(rows / elapsed),
+    }
+
+
+def random_filters(rng, df):
+    # Queries shaped like what the sidebar produces
+    areas = [a[0] for a in AREAS]
+    marks = [m for m in ENERGY_MARKS if m]
+    date_from = df['available_from'].median() - np.timedelta64(int(rng.integers(0, 60)), 'D')
+    return {
+        'selected_area': list(rng.choice(areas, size=rng.choice([0, 0, 1, 3, 8]), replace=False)),
+        'include_null_available_from': bool(rng.random() < 0.5),
+        'selected_available_from': [date_from, date_from + np.timedelta64(int(rng.integers(30, 150)), 'D')],
+        'selected_price_range_thousands': (float(rng.uniform(4, 12)), float(rng.choice([15, 25, 45]))),
+        'selected_rooms': str(rng.choice(['All', 'All', '1', '2', '3', '4'])),
+        'selected_size': (int(rng.integers(15, 60)), int(rng.choice([100, 200, 360]))),
+        'selected_energy_mark': str(rng.choice(['All'] * 12 + marks)),
+        'selected_percentile': int(rng.choice([100, 100, 90, 50])),
+        'selected_furnished': str(rng.choice(['All', 'All', 'Yes', 'No'])),
+        'selected_days_on_website': (0, int(rng.choice([7, 30, 90]))),
+        'selected_move_in_price_thousands': (0.0, float(rng.choice([50, 100]))),
+        'selected_rent_per_person_thousands': (0.0, float(rng.choice([8, 20]))),
+        'selected_underpriced_only': False,
+    }
+
+
+def bench_filter(rows, queries, seed):
+    df = add_derived_columns(generate_processed_frame(rows, seed))
+    rng = np.random.default_rng(seed)
+    query_filters = [random_filters(rng, df) for _ in range(queries)]
+
+    timings = []
+    matched = 0
+    for filters in query_filters:
+        start = time.perf_counter()
+        matched += len(apply_filters(df, filters))
+        timings.append(time.perf_counter() - start)
+
+    # Peak extra memory of a single query, measured separately since tracemalloc slows things down
+    tracemalloc.start()
+    apply_filters(df, query_filters[0])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'rows': rows,
+        'queries': queries,
+        'p50_ms': percentile_ms(timings, 50),
+        'p95_ms': percentile_ms(timings, 95),
+        'max_ms': percentile_ms(timings, 100),
+        'avg_matches': round(matched / queries),
+        'dataset_mb': round(df.memory_usage(deep=True).sum() / 1e6, 1),
+        'query_peak_mb': round(peak / 1e6, 1),
+    }
+
+
+def bench_scrape(listings, latency_ms, throttle_rate, error_rate, seed):
+    # End-to-end scrape against the local stub server, nothing leaves the machine
+    server, url = start_stub_server(listings=listings, latency_ms=latency_ms, jitter_ms=latency_ms / 2,
+                                    throttle_rate=throttle_rate, error_rate=error_rate, retry_after=0, seed=seed)
+    try:
+        with tempfile.TemporaryDirectory() as output_dir:
+            stats = scrape_boligportal.main(host=url, output_dir=output_dir, run_dir=os.path.join(output_dir, 'run'))
+    finally:
+        server.shutdown()
+    return {
+        'listings': listings,
+        'latency_ms': latency_ms,
+        'throttle_rate': throttle_rate,
+        'error_rate': error_rate,
+        'fetched': stats['fetched'],
+        'seconds': round(stats['seconds'], 3),
+        'listings_per_second': round(stats['listings_per_second'], 1),
+        'fetch_p50_ms': round(stats['fetch_p50_seconds'] * 1000, 1),
+        'fetch_p95_ms': round(stats['fetch_p95_seconds'] * 1000, 1),
+        'fetch_p99_ms': round(stats['fetch_p99_seconds'] * 1000, 1),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def latest_result(output_dir):
+    files = sorted(glob.glob(os.path.join(output_dir, 'benchmark_*.json')))
+    return files[-1] if files else None
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    # Throughputs should not drop, latencies, durations and memory should not grow
+    regressions = []
+    for name, metrics in results['benchmarks'].items():
+        previous = baseline['benchmarks'].get(name)
+        if not previous:
+            continue
+        for metric, value in metrics.items():
+            old = previous.get(metric)
+            if not old or not isinstance(value, (int, float)):
+                continue
+            change = (value - old) / old
+            if metric.endswith('_per_second') and change < -threshold:
+                regressions.append((name, metric, old, value, change))
+            elif metric.endswith(('_ms', 'seconds', '_mb')) and change > threshold:
+                regressions.append((name, metric, old, value, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark parsing, preprocessing and filtering on synthetic data')
+    parser.add_argument('--pages', type=int, default=200, help='Listing pages to parse')
+    parser.add_argument('--preprocess-rows', type=int, nargs='*', default=[10000, 100000], help='Raw row counts to preprocess')
+    parser.add_argument('--filter-rows', type=int, nargs='*', default=[10000, 1000000], help='Processed row counts to filter (up to 10M)')
+    parser.add_argument('--queries', type=int, default=50, help='Filter queries per dataset size')
+    parser.add_argument('--scrape-listings', type=int, default=200, help='Listings served by the stub server for the scrape benchmark (0 to skip)')
+    parser.add_argument('--stub-latency-ms', type=float, default=50, help='Mean stub server latency')
+    parser.add_argument('--stub-throttle-rate', type=float, default=0.05, help='Fraction of stub requests answered with 429')
+    parser.add_argument('--stub-error-rate', type=float, default=0.0, help='Fraction of stub requests answered with 500')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output-dir', default=OUTPUT_DIR)
+    parser.add_argument('--baseline', help='Result file to compare against (default: most recent run)')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD, help='Relative change that counts as a regression')
+    parser.add_argument('--fail-on-regression', action='store_true', help='Exit with status 1 when a regression is found')
+    args = parser.parse_args()
+
+    # Preprocessing logs every column it fails to clean, keep that out of the timings
+    logging.disable(logging.CRITICAL)
+
+    baseline_path = args.baseline or latest_result(args.output_dir)
+
+    results = {
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'config': vars(args),
+        'benchmarks': {},
+    }
+
+    print(f"Parsing {args.pages} listing pages...")
+    results['benchmarks']['parse'] = bench_parse(args.pages, args.seed)
+    for rows in args.preprocess_rows:
+        print(f"Preprocessing {rows} rows...")
+        results['benchmarks'][f'preprocess_{rows}'] = bench_preprocess(rows, args.seed)
+    for rows in args.filter_rows:
+        print(f"Filtering {rows} rows...")
+        results['benchmarks'][f'filter_{rows}'] = bench_filter(rows, args.queries, args.seed)
+    if args.scrape_listings:
+        print(f"Scraping {args.scrape_listings} listings from the stub server...")
+        results['benchmarks'][f'scrape_{args.scrape_listings}'] = bench_scrape(
+            args.scrape_listings, args.stub_latency_ms, args.stub_throttle_rate, args.stub_error_rate, args.seed)
+    results['peak_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3, 1)
+
+    for name, metrics in results['benchmarks'].items():
+        print(f"{name}: " + ', '.join(f'{k}={v}' for k, v in metrics.items()))
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    output_path = os.path.join(args.output_dir, f"benchmark_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.json")
+    with open(output_path, 'w') as file:
+        json.dump(results, file, indent=2)
+    print(f"Results saved to {output_path}")
+
+    regressions = []
+    if baseline_path:
+        with open(baseline_path) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        print(f"Compared against {baseline_path}: {len(regressions)} regression(s).")
+        for name, metric, old, new, change in regressions:
+            print(f"  REGRESSION {name}.{metric}: {old} -> {new} ({change:+.0%})")
+
+    if regressions and args.fail_on_regression:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
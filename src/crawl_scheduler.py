@@ -0,0 +1,203 @@
+import argparse
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from multiprocessing import Pool, cpu_count
+
+import pandas as pd
+import requests
+from bs4 import BeautifulSoup
+from tqdm import tqdm
+
+from file_utils import atomic_write_csv
+from log_utils import FieldFailures, init_worker_logging, start_log_listener
+from scrape_boligportal import (BASE_HOST, MAX_RETRIES, REQUEST_TIMEOUT, extract_listing_links, is_last_page, page_url,
+                                process_apartment_info)
+
+TARGETS_PATH = 'data/crawl_targets.json'
+
+# Politeness defaults for the shared fetch pool
+DEFAULT_RATE = 5.0
+DEFAULT_CONCURRENCY = 8
+
+# Answers worth another try once the limiter has backed off, anything else (like a 404) fails right away
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RateLimiter:
+    # Spaces requests evenly at `rate` per second across all threads
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.lock = threading.Lock()
+        self.next_slot = time.monotonic()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def back_off(self, seconds):
+        # No request from any thread goes out for the next `seconds`
+        with self.lock:
+            self.next_slot = max(self.next_slot, time.monotonic() + seconds)
+
+
+def load_targets(path=TARGETS_PATH):
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def fetch(limiter, url, retries=MAX_RETRIES, timeout=REQUEST_TIMEOUT):
+    # Returns (html, None), or (None, error) once the retries are used up. A throttled or failed request pushes
+    # back the shared limiter, so every thread slows down instead of only the one that was refused.
+    error = None
+    for attempt in range(retries + 1):
+        delay = 2 ** attempt
+        limiter.acquire()
+        try:
+            response = requests.get(url, timeout=timeout)
+        except requests.RequestException as e:
+            error = str(e)
+        else:
+            if response.status_code == 200:
+                return response.text, None
+            error = f'HTTP {response.status_code}'
+            if response.status_code not in RETRY_STATUSES:
+                break
+            if response.status_code == 429:
+                delay = float(response.headers.get('Retry-After', delay))
+        if attempt < retries:
+            limiter.back_off(delay)
+    return None, error
+
+
+def crawl(targets, host=BASE_HOST, rate=DEFAULT_RATE, concurrency=DEFAULT_CONCURRENCY):
+    # Walks the result pages of every target and fetches every listing exactly once, all through one
+    # rate-limited pool. Index pages get priority so listing discovery keeps up with listing fetches.
+    # Returns ({link: html}, {link: [target names]}, {target name: {'index': failures, 'listing': failures}}).
+    limiter = RateLimiter(rate)
+    next_page = {target['name']: 0 for target in targets}
+    base_urls = {target['name']: f"{host}{target['path']}" for target in targets}
+    paging = set()                # targets with an index page in flight
+    listing_queue = deque()
+    listing_targets = {}          # link -> targets it appeared in, in discovery order
+    pages = {}
+    in_flight = {}
+    failures = {target['name']: {'index': 0, 'listing': 0} for target in targets}
+
+    progress = tqdm(desc="Crawling", unit="req")
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while next_page or listing_queue or in_flight:
+            # Fill free slots, index pages first
+            while len(in_flight) < concurrency:
+                waiting = [name for name in next_page if name not in paging]
+                if waiting:
+                    name = waiting[0]
+                    url = page_url(base_urls[name], next_page[name])
+                    in_flight[executor.submit(fetch, limiter, url)] = ('index', name)
+                    paging.add(name)
+                elif listing_queue:
+                    link = listing_queue.popleft()
+                    in_flight[executor.submit(fetch, limiter, f"{host}{link}")] = ('listing', link)
+                else:
+                    break
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                kind, key = in_flight.pop(future)
+                try:
+                    html, error = future.result()
+                except Exception as e:
+                    # One bad page must not take the whole crawl down
+                    html, error = None, str(e)
+                progress.update()
+                if kind == 'listing':
+                    if html is not None:
+                        pages[key] = html
+                    else:
+                        for name in listing_targets[key]:
+                            failures[name]['listing'] += 1
+                    continue
+
+                paging.discard(key)
+                soup = BeautifulSoup(html, 'html.parser') if html is not None else None
+                if soup is None or is_last_page(soup):
+                    # Target exhausted (or failed), stop paging it
+                    if soup is None:
+                        failures[key]['index'] += 1
+                    print(f"{key}: done after {next_page[key]} page(s)" + (f" (request failed: {error})" if soup is None else ""))
+                    del next_page[key]
+                    continue
+                for link in extract_listing_links(soup):
+                    if link not in listing_targets:
+                        listing_targets[link] = []
+                        listing_queue.append(link)
+                    if key not in listing_targets[link]:
+                        listing_targets[link].append(key)
+                next_page[key] += 1
+                # Move the target to the back so pagination is interleaved round-robin
+                next_page[key] = next_page.pop(key)
+    progress.close()
+    return pages, listing_targets, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Crawl several boligportal searches through one shared, rate-limited fetch pool')
+    parser.add_argument('--targets', default=TARGETS_PATH, help='JSON list of {"name", "path"} search targets')
+    parser.add_argument('--only', nargs='*', help='Names of the targets to crawl (default: all)')
+    parser.add_argument('--host', default=BASE_HOST)
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE, help='Maximum requests per second across all targets')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help='Requests in flight at once')
+    parser.add_argument('--output-dir', default='data/raw')
+    args = parser.parse_args()
+
+    targets = load_targets(args.targets)
+    if args.only:
+        targets = [target for target in targets if target['name'] in args.only]
+
+    start_time = time.time()
+    pages, listing_targets, fetch_failures = crawl(targets, args.host, args.rate, args.concurrency)
+    mentions = sum(len(names) for names in listing_targets.values())
+    print(f"Fetched {len(pages)}/{len(listing_targets)} unique listings ({mentions} across all targets) "
+          f"in {time.time() - start_time:.2f} seconds.")
+
+    # Parse every listing once, then hand each target its own rows
+    today_date = datetime.today().strftime('%Y-%m-%d')
+    log_queue, listener = start_log_listener(f"outputs/errors/crawl_errors_{today_date}.log")
+    links = list(pages)
+    failures = FieldFailures()
+    records = []
+    with Pool(cpu_count(), initializer=init_worker_logging, initargs=(log_queue,)) as pool:
+        for record, failed_fields in tqdm(pool.imap(process_apartment_info, [(pages[link], f"{args.host}{link}") for link in links]),
+                                          desc="Extracting apartment info", total=len(links)):
+            records.append(record)
+            failures.add_page(failed_fields, record['url'])
+        # Not terminate(), which can kill a worker holding the log queue's lock and hang listener.stop()
+        pool.close()
+        pool.join()
+    failures.log_summary()
+    listener.stop()
+    df = pd.DataFrame(records)
+    df['link'] = links
+
+    for target in targets:
+        name = target['name']
+        target_df = df[df['link'].map(lambda link: name in listing_targets[link])].drop(columns='link')
+        target_dir = os.path.join(args.output_dir, name)
+        os.makedirs(target_dir, exist_ok=True)
+        output_path = os.path.join(target_dir, f'bolig_data_{today_date}.csv')
+        atomic_write_csv(target_df, output_path, index=False, header=True, encoding='utf-8')
+        failed = fetch_failures[name]
+        print(f"{name}: {len(target_df)} listings saved to {output_path}" +
+              (f" (incomplete: {failed['index']} result page(s) and {failed['listing']} listing(s) failed)" if any(failed.values()) else ""))
+
+
+if __name__ == "__main__":
+    main()
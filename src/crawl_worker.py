@@ -0,0 +1,186 @@
+import argparse
+import os
+import queue as queue_module
+import socket
+import time
+from datetime import datetime
+from multiprocessing import Process, Queue
+
+import pandas as pd
+from bs4 import BeautifulSoup
+
+from crawl_scheduler import DEFAULT_RATE, TARGETS_PATH, load_targets
+from log_utils import FieldFailures, init_worker_logging, start_log_listener
+from scrape_boligportal import BASE_HOST, FIELD_FAILURES, extract_apartment_info, extract_listing_links, get_with_retries, is_last_page, page_url
+from work_queue import QUEUE_PATH, open_queue
+
+# A worker that holds an item longer than this is presumed dead and the item is handed to someone else
+LEASE_SECONDS = 60
+MAX_ATTEMPTS = 3
+
+# Index pages are claimed before listings so discovery stays ahead of the fetchers
+INDEX_PRIORITY = 0
+LISTING_PRIORITY = 1
+
+# How long an idle worker waits before asking the queue again
+POLL_SECONDS = 1.0
+
+
+def seed(queue, run, targets):
+    # The first result page of every target; each index item enqueues the next page and its listings
+    queue.enqueue_many(run, 'index', [(f"{t['name']}:0", {'target': t['name'], 'path': t['path'], 'page': 0}) for t in targets],
+                       priority=INDEX_PRIORITY)
+
+
+def process_index(queue, run, host, payload):
+    response = get_with_retries(page_url(f"{host}{payload['path']}", payload['page']))
+    if response.status_code != 200:
+        raise RuntimeError(f"HTTP {response.status_code}")
+    soup = BeautifulSoup(response.text, 'html.parser')
+    if is_last_page(soup):
+        return {'links': []}
+
+    links = extract_listing_links(soup)
+    next_page = dict(payload, page=payload['page'] + 1)
+    # Enqueueing is idempotent, so an index page redone after a lost lease doesn't duplicate anything
+    queue.enqueue_many(run, 'index', [(f"{payload['target']}:{next_page['page']}", next_page)], priority=INDEX_PRIORITY)
+    queue.enqueue_many(run, 'listing', [(link, {'link': link}) for link in links], priority=LISTING_PRIORITY)
+    return {'links': links}
+
+
+def process_listing(host, payload):
+    url = f"{host}{payload['link']}"
+    response = get_with_retries(url)
+    if response.status_code != 200:
+        raise RuntimeError(f"HTTP {response.status_code}")
+    return extract_apartment_info(response.text, url)
+
+
+def work(queue_location, run, host, rate, lease_seconds, max_attempts, log_queue, reports):
+    # Claim, process, report, until the run has nothing left that could still come back
+    init_worker_logging(log_queue)
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    queue = open_queue(queue_location)
+    done = failed = 0
+    while True:
+        items = queue.claim(run, owner, lease_seconds, max_attempts)
+        if not items:
+            if queue.is_drained(run):
+                break
+            time.sleep(POLL_SECONDS)
+            continue
+
+        item = items[0]
+        queue.acquire_rate_slot(host, rate)
+        try:
+            if item['kind'] == 'index':
+                result = process_index(queue, run, host, item['payload'])
+            else:
+                result = process_listing(host, item['payload'])
+        except Exception as e:
+            queue.fail(item['id'], owner, str(e), max_attempts)
+            failed += 1
+            continue
+        if queue.complete(item['id'], owner, result):
+            done += 1
+    queue.close()
+    # Counts go back to the parent, which prints one summary for all workers
+    reports.put((owner, done, failed, FIELD_FAILURES))
+
+
+def export(queue, run, targets, output_dir):
+    # Each target gets the listings its index pages pointed at, in the order they were found
+    records = {key: record for key, _, record in queue.results(run, 'listing')}
+    index_results = sorted(queue.results(run, 'index'), key=lambda item: item[1]['page'])
+    for target in targets:
+        name = target['name']
+        links = []
+        seen = set()
+        for _, payload, result in index_results:
+            if payload['target'] != name:
+                continue
+            for link in result['links']:
+                if link in records and link not in seen:
+                    seen.add(link)
+                    links.append(link)
+        target_dir = os.path.join(output_dir, name)
+        os.makedirs(target_dir, exist_ok=True)
+        output_path = os.path.join(target_dir, f'bolig_data_{run}.csv')
+        pd.DataFrame([records[link] for link in links]).to_csv(output_path, index=False, header=True, encoding='utf-8')
+        print(f"{name}: {len(links)} listings saved to {output_path}")
+
+
+def print_counts(queue, run):
+    for kind, statuses in sorted(queue.counts(run).items()):
+        print(f"{kind}: " + ', '.join(f'{status}={count}' for status, count in sorted(statuses.items())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Crawl boligportal with any number of workers sharing one durable work queue')
+    parser.add_argument('command', choices=['seed', 'work', 'status', 'export'])
+    parser.add_argument('--queue', default=QUEUE_PATH,
+                        help='SQLite queue file on a local disk of this host, or the http://host:port of a queue_server.py')
+    parser.add_argument('--run', default=datetime.today().strftime('%Y-%m-%d'), help='Crawl run id, defaults to today')
+    parser.add_argument('--targets', default=TARGETS_PATH)
+    parser.add_argument('--only', nargs='*', help='Names of the targets to seed or export (default: all)')
+    parser.add_argument('--host', default=BASE_HOST)
+    parser.add_argument('--processes', type=int, default=1, help='Worker processes to start')
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE, help='Maximum requests per second across all workers')
+    parser.add_argument('--lease-seconds', type=float, default=LEASE_SECONDS)
+    parser.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS)
+    parser.add_argument('--output-dir', default='data/raw')
+    args = parser.parse_args()
+
+    if not args.queue.startswith(('http://', 'https://')) and os.path.dirname(args.queue):
+        os.makedirs(os.path.dirname(args.queue), exist_ok=True)
+    targets = load_targets(args.targets)
+    if args.only:
+        targets = [target for target in targets if target['name'] in args.only]
+
+    if args.command == 'work':
+        start_time = time.time()
+        log_queue, listener = start_log_listener(f"outputs/errors/crawl_worker_errors_{args.run}.log")
+        reports = Queue()
+        workers = [Process(target=work, args=(args.queue, args.run, args.host, args.rate, args.lease_seconds, args.max_attempts,
+                                              log_queue, reports))
+                   for _ in range(args.processes)]
+        for worker in workers:
+            worker.start()
+
+        # Collect while waiting, a worker that died (its items go back to the queue) never reports
+        received = []
+        while len(received) < len(workers) and any(worker.is_alive() for worker in workers):
+            try:
+                received.append(reports.get(timeout=POLL_SECONDS))
+            except queue_module.Empty:
+                pass
+        for worker in workers:
+            worker.join()
+        while True:
+            try:
+                received.append(reports.get_nowait())
+            except queue_module.Empty:
+                break
+
+        failures = FieldFailures()
+        for owner, done, failed, worker_failures in received:
+            print(f"Worker {owner}: {done} item(s) done, {failed} attempt(s) failed.")
+            failures.merge(worker_failures)
+        if len(received) < len(workers):
+            print(f"{len(workers) - len(received)} worker(s) exited without reporting.")
+        failures.log_summary()
+        listener.stop()
+        print(f"Queue drained in {time.time() - start_time:.2f} seconds.")
+
+    queue = open_queue(args.queue)
+    if args.command == 'seed':
+        seed(queue, args.run, targets)
+        print(f"Seeded {len(targets)} target(s) for run {args.run} in {args.queue}")
+    elif args.command == 'export':
+        export(queue, args.run, targets, args.output_dir)
+    print_counts(queue, args.run)
+    queue.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import argparse
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from file_utils import atomic_write_csv, atomic_write_text, file_sha256
+from filters import add_derived_columns
+from text_store import TEXT_COLUMNS, texts_sha256, write_text_store
+
+# Published datasets are immutable, versioned files. The manifest names the current one and is replaced
+# atomically, so a reader sees either the old or the new version, never a half-written file.
+
+LATEST_DIR = 'data/latest'
+VERSIONS_DIR = os.path.join(LATEST_DIR, 'versions')
+MANIFEST_PATH = os.path.join(LATEST_DIR, 'manifest.json')
+
+# Older versions kept around for sessions still loading them and for rolling back by hand
+KEEP_VERSIONS = 3
+
+# Version part of a published file name
+VERSION_PATTERN = re.compile(r'_(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})\.(csv|sqlite)$')
+
+# A version that failed to load (usually a pull still in progress) is tried again after this long
+RETRY_SECONDS = 30
+
+
+def read_manifest(path=MANIFEST_PATH):
+    try:
+        with open(path, encoding='utf-8') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+def legacy_manifest(latest_dir=LATEST_DIR):
+    # Before the first versioned publish there is only the unversioned file, its mtime stands in for a version
+    path = os.path.join(latest_dir, 'preprocessed_data_latest.csv')
+    if not os.path.exists(path):
+        return None
+    mtime = os.path.getmtime(path)
+    return {
+        'version': f'mtime-{mtime}',
+        'path': 'preprocessed_data_latest.csv',
+        'sha256': None,
+        # The file's mtime is server time, shift it to CET
+        'published_at': (datetime.fromtimestamp(mtime) + timedelta(hours=2)).strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+def publish_dataset(df, latest_dir=LATEST_DIR, keep=KEEP_VERSIONS):
+    versions_dir = os.path.join(latest_dir, 'versions')
+    version = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+    filename = f'preprocessed_data_{version}.csv'
+    texts_filename = f'listing_texts_{version}.sqlite'
+    version_path = os.path.join(versions_dir, filename)
+
+    # 1. The new version, complete on disk before anything points at it. The long text fields go to the
+    # side store, the CSV only keeps what gets filtered and displayed.
+    atomic_write_csv(df.drop(columns=TEXT_COLUMNS, errors='ignore'), version_path, index=False, header=True, encoding='utf-8')
+
+    # Nothing changed, keep the current version instead of adding an identical one
+    sha256 = file_sha256(version_path)
+    texts_sha = texts_sha256(df)
+    current = read_manifest(os.path.join(latest_dir, 'manifest.json'))
+    if (current and current['sha256'] == sha256 and current.get('texts_sha256') == texts_sha
+            and os.path.exists(os.path.join(latest_dir, current['path']))):
+        os.remove(version_path)
+        return current
+
+    # The texts change far less often than the prices and dates, an unchanged side store is shared with the
+    # current version instead of being written (and pushed) again
+    if (current and current.get('texts_sha256') == texts_sha and current.get('texts')
+            and os.path.exists(os.path.join(latest_dir, current['texts']))):
+        texts_path = current['texts']
+    else:
+        texts_path = os.path.join('versions', texts_filename)
+        write_text_store(df, os.path.join(latest_dir, texts_path))
+
+    # 2. Switch the pointer
+    manifest = {
+        'version': version,
+        'path': os.path.join('versions', filename),
+        'sha256': sha256,
+        'texts': texts_path,
+        'texts_sha256': texts_sha,
+        'rows': len(df),
+        'published_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    atomic_write_text(json.dumps(manifest, indent=2), os.path.join(latest_dir, 'manifest.json'))
+
+    # The unversioned file stays, with every column, for anything that still reads it directly
+    atomic_write_csv(df, os.path.join(latest_dir, 'preprocessed_data_latest.csv'), index=False, header=True, encoding='utf-8')
+
+    # Prune whole versions (dataset and side store), names sort by publish time. The side store the new
+    # version shares stays.
+    old_versions = sorted({match.group(1) for match in map(VERSION_PATTERN.search, os.listdir(versions_dir)) if match} - {version})
+    for old_version in old_versions[:max(len(old_versions) - (keep - 1), 0)]:
+        for name in (f'preprocessed_data_{old_version}.csv', f'listing_texts_{old_version}.sqlite'):
+            if name != os.path.basename(texts_path) and os.path.exists(os.path.join(versions_dir, name)):
+                os.remove(os.path.join(versions_dir, name))
+    return manifest
+
+
+def load_version(manifest, latest_dir=LATEST_DIR):
+    # Refuses a file that doesn't match the manifest, e.g. while a git pull is still writing it
+    path = os.path.join(latest_dir, manifest['path'])
+    if manifest['sha256'] and file_sha256(path) != manifest['sha256']:
+        raise ValueError(f"{path} does not match the manifest checksum")
+    df = pd.read_csv(path)
+
+    # Calculate total rental price, rent per person and move-in price once
+    return add_derived_columns(df)
+
+
+class DatasetStore:
+    # Holds the dataset every session reads. New versions are loaded on a background thread and swapped in
+    # with a single assignment once ready, so a rerun never waits on or sees a partly loaded dataset.
+    def __init__(self, latest_dir=LATEST_DIR):
+        self.latest_dir = latest_dir
+        self.lock = threading.Lock()
+        self.first_load_lock = threading.Lock()
+        self.current = None       # (manifest, df)
+        self.loading = None       # version being loaded
+        self.failed = {}          # version -> time its load failed
+
+    def get(self):
+        # Returns (manifest, df) of the newest fully loaded version, or None when there is no data at all
+        try:
+            manifest = read_manifest(os.path.join(self.latest_dir, 'manifest.json')) or legacy_manifest(self.latest_dir)
+        except ValueError:
+            # Manifest caught mid-rewrite (a pull in progress), keep serving what we have
+            manifest = None if self.current else legacy_manifest(self.latest_dir)
+        if manifest is None:
+            return self.current
+
+        if self.current is None:
+            # Nothing to show yet, the very first load has to wait
+            with self.first_load_lock:
+                if self.current is None:
+                    self._load(manifest)
+                if self.current is None and manifest['sha256'] and legacy_manifest(self.latest_dir):
+                    self._load(legacy_manifest(self.latest_dir))
+        elif manifest['version'] != self.current[0]['version'] and time.time() - self.failed.get(manifest['version'], 0) > RETRY_SECONDS:
+            with self.lock:
+                start = self.loading is None
+                if start:
+                    self.loading = manifest['version']
+            if start:
+                threading.Thread(target=self._load, args=(manifest,), daemon=True).start()
+        return self.current
+
+    def _load(self, manifest):
+        try:
+            df = load_version(manifest, self.latest_dir)
+            self.current = (manifest, df)
+        except Exception as e:
+            logging.error(f"Error loading dataset version {manifest['version']}: {e}")
+            self.failed[manifest['version']] = time.time()
+        finally:
+            with self.lock:
+                self.loading = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Publish a processed dataset as the new version the app serves')
+    parser.add_argument('path', help='Processed CSV, e.g. data/processed/preprocessed_data_<date>.csv')
+    args = parser.parse_args()
+
+    manifest = publish_dataset(pd.read_csv(args.path))
+    print(f"Published dataset version {manifest['version']} ({manifest['rows']} rows)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import pandas as pd
+
+# Filter fields shared by the sidebar in app.py and by saved searches (same names as the session state keys)
+FILTER_KEYS = [
+    'selected_area',
+    'include_null_available_from',
+    'selected_available_from',
+    'selected_price_range_thousands',
+    'selected_rooms',
+    'selected_size',
+    'selected_energy_mark',
+    'selected_percentile',
+    'selected_furnished',
+    'selected_days_on_website',
+    'selected_move_in_price_thousands',
+    'selected_rent_per_person_thousands',
+    'selected_underpriced_only',
+]
+
+# Slider maxima that mean "no upper limit"
+MAX_PRICE = 45000
+MAX_MOVE_IN_PRICE = 100000
+MAX_RENT_PER_PERSON = 20000
+
+
+def add_derived_columns(df):
+    # Calculate total rental price once
+    df['total_rental_price'] = df['monthly_rent'] + df['monthly_aconto']
+
+    # Calculate rent per person metric: (total_monthly_rent - 900) / (number of rooms - 1)
+    # Only calculate for apartments with more than 1 room to avoid division by zero
+    rooms = pd.to_numeric(df['rooms'], errors='coerce')
+    df['rent_per_person'] = ((df['total_rental_price'] - 900) / (rooms - 1)).where(rooms > 1)
+
+    # Create a new column 'move_in_price' by summing 'monthly_rent', 'monthly_aconto', 'deposit', and 'prepaid_rent'
+    try:
+        df['move_in_price'] = df[['monthly_rent', 'monthly_aconto', 'deposit', 'prepaid_rent']].sum(axis=1)
+    except Exception as e:
+        print(f"Error calculating move_in_price: {e}")
+        # Fallback if calculation fails
+        df['move_in_price'] = df['monthly_rent'] * 3  # Simple approximation
+    return df
+
+
+def apply_filters(df, filters, warn=print):
+    # Start with the original dataset
+    filtered_df = df
+
+    # Apply area filter
+    if filters['selected_area']:
+        filtered_df = filtered_df[filtered_df['area'].isin(filters['selected_area'])]
+
+    # Apply furnished filter
+    if filters['selected_furnished'] != 'All':
+        filtered_df = filtered_df[filtered_df['furnished'] == filters['selected_furnished']]
+
+    # Apply rooms filter
+    if filters['selected_rooms'] != 'All':
+        filtered_df = filtered_df[filtered_df['rooms'] >= float(filters['selected_rooms'])]
+
+    # Apply days on website filter
+    filtered_df = filtered_df[
+        (filtered_df['days_on_website'] >= filters['selected_days_on_website'][0]) &
+        (filtered_df['days_on_website'] <= filters['selected_days_on_website'][1])
+    ]
+
+    # Handle available_from filtering
+    try:
+        available_from_min = pd.to_datetime(filters['selected_available_from'][0])
+        available_from_max = pd.to_datetime(filters['selected_available_from'][1])
+        available_from = pd.to_datetime(filtered_df['available_from'], errors='coerce')
+
+        if filters['include_null_available_from']:
+            filtered_df = filtered_df[
+                ((available_from >= available_from_min) | (filtered_df['available_from'].isnull())) &
+                ((available_from <= available_from_max) | (filtered_df['available_from'].isnull()))
+            ]
+        else:
+            # Filter out null available_from and apply date filter
+            filtered_df = filtered_df[
+                available_from.notna() &
+                (available_from >= available_from_min) &
+                (available_from <= available_from_max)
+            ]
+    except Exception as e:
+        warn(f"Date filtering error: {e}")
+        # If date filtering fails, keep all rows
+        pass
+
+    # Apply price range filter
+    price_min = filters['selected_price_range_thousands'][0] * 1000
+    price_max = filters['selected_price_range_thousands'][1] * 1000
+
+    # If user selects max value, treat it as "no maximum"
+    if price_max >= MAX_PRICE:
+        filtered_df = filtered_df[filtered_df['total_rental_price'] >= price_min]
+    else:
+        filtered_df = filtered_df[(filtered_df['total_rental_price'] >= price_min) &
+                                  (filtered_df['total_rental_price'] <= price_max)]
+
+    # Apply move-in price filter
+    move_in_min = filters['selected_move_in_price_thousands'][0] * 1000
+    move_in_max = filters['selected_move_in_price_thousands'][1] * 1000
+
+    if move_in_max >= MAX_MOVE_IN_PRICE:
+        filtered_df = filtered_df[filtered_df['move_in_price'] >= move_in_min]
+    else:
+        filtered_df = filtered_df[(filtered_df['move_in_price'] >= move_in_min) &
+                                  (filtered_df['move_in_price'] <= move_in_max)]
+
+    # Apply rent per person filter
+    rent_per_person_min = filters['selected_rent_per_person_thousands'][0] * 1000
+    rent_per_person_max = filters['selected_rent_per_person_thousands'][1] * 1000
+
+    # Only apply filter to apartments where rent_per_person is not null
+    if rent_per_person_max >= MAX_RENT_PER_PERSON:
+        filtered_df = filtered_df[
+            (filtered_df['rent_per_person'].isna()) |
+            (filtered_df['rent_per_person'] >= rent_per_person_min)
+        ]
+    else:
+        filtered_df = filtered_df[
+            (filtered_df['rent_per_person'].isna()) |
+            ((filtered_df['rent_per_person'] >= rent_per_person_min) &
+             (filtered_df['rent_per_person'] <= rent_per_person_max))
+        ]
+
+    # Apply size filter
+    filtered_df = filtered_df[
+        (filtered_df['size_sqm'] >= filters['selected_size'][0]) &
+        (filtered_df['size_sqm'] <= filters['selected_size'][1])
+    ]
+
+    # Apply energy mark filter
+    if filters['selected_energy_mark'] != 'All':
+        filtered_df = filtered_df[filtered_df['energy_mark'] == filters['selected_energy_mark']]
+
+    # Apply underpriced filter
+    if filters.get('selected_underpriced_only') and 'price_delta_pct' in filtered_df.columns:
+        filtered_df = filtered_df[filtered_df['price_delta_pct'] < 0]
+
+    # Apply percentile filter LAST
+    if filters['selected_percentile'] < 100:
+        # Get the threshold price at the selected percentile
+        price_threshold = filtered_df['total_rental_price'].quantile(filters['selected_percentile'] / 100)
+        # Apply the filter
+        filtered_df = filtered_df[filtered_df['total_rental_price'] <= price_threshold]
+
+    return filtered_df
@@ -0,0 +1,98 @@
+import logging
+import logging.handlers
+import multiprocessing
+import os
+
+# Example URLs kept per failing field, instead of one log line per occurrence
+SAMPLE_URLS = 3
+
+LOG_FORMAT = '%(asctime)s - %(processName)s - %(levelname)s - %(message)s'
+
+
+def start_log_listener(path, level=logging.ERROR):
+    # One listener thread in the parent owns the log file and every pool worker only puts records on the
+    # queue, so lines never interleave and workers never block on disk writes. The parent logs through the
+    # same handler directly, its records would otherwise be stranded on the queue once the listener stops.
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    queue = multiprocessing.Queue()
+    file_handler = logging.FileHandler(path)
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    listener = LogListener(queue, file_handler, level)
+    listener.start()
+    return queue, listener
+
+
+class LogListener(logging.handlers.QueueListener):
+    # Points the parent's root logger at the log file until stop(), which puts the original handlers back
+    def __init__(self, queue, file_handler, level):
+        super().__init__(queue, file_handler, respect_handler_level=True)
+        self.file_handler = file_handler
+        root = logging.getLogger()
+        self.saved_handlers = list(root.handlers)
+        self.saved_level = root.level
+        for handler in self.saved_handlers:
+            root.removeHandler(handler)
+        root.addHandler(file_handler)
+        root.setLevel(level)
+
+    def stop(self):
+        super().stop()
+        root = logging.getLogger()
+        root.removeHandler(self.file_handler)
+        for handler in self.saved_handlers:
+            root.addHandler(handler)
+        root.setLevel(self.saved_level)
+        self.file_handler.close()
+
+
+def init_worker_logging(queue, level=logging.ERROR):
+    # Pool initializer: route everything this worker process logs to the listener
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(queue))
+    root.setLevel(level)
+
+
+class FieldFailures:
+    # Per-field extraction failure counts with a few example URLs, mergeable across workers
+    def __init__(self):
+        self.pages = 0
+        self.counts = {}
+        self.samples = {}
+        self.errors = {}
+
+    def add_page(self, failed_fields, url):
+        # failed_fields: [(field, error message)] for one parsed page
+        self.pages += 1
+        for field, error in failed_fields:
+            self.counts[field] = self.counts.get(field, 0) + 1
+            samples = self.samples.setdefault(field, [])
+            if len(samples) < SAMPLE_URLS:
+                samples.append(url)
+            self.errors.setdefault(field, error)
+
+    def merge(self, other):
+        # Adds the counts of another worker's FieldFailures
+        self.pages += other.pages
+        for field, count in other.counts.items():
+            self.counts[field] = self.counts.get(field, 0) + count
+            samples = self.samples.setdefault(field, [])
+            samples.extend(other.samples[field][:SAMPLE_URLS - len(samples)])
+            self.errors.setdefault(field, other.errors[field])
+
+    def summary(self):
+        if not self.counts:
+            return f"No field extraction failures in {self.pages} page(s)."
+        lines = [f"Field extraction failures in {self.pages} page(s):"]
+        for field, count in sorted(self.counts.items(), key=lambda item: -item[1]):
+            lines.append(f"  {field}: {count} ({count / self.pages:.1%}), first error: {self.errors[field]}, "
+                         f"e.g. {', '.join(self.samples[field])}")
+        return '\n'.join(lines)
+
+    def log_summary(self):
+        # Once per run, on the console and in the error log
+        summary = self.summary()
+        print(summary)
+        if self.counts:
+            logging.error(summary)
@@ -0,0 +1,241 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+from file_utils import atomic_write_text, file_sha256
+
+# The daily pipeline as stages with declared inputs and outputs. A stage runs once everything it comes after
+# has finished, stages that don't depend on each other run at the same time, and a stage whose inputs hash
+# the same as on its last successful run (and whose outputs are still there) is skipped.
+
+PIPELINE_DIR = 'outputs/pipeline'
+STATE_PATH = os.path.join(PIPELINE_DIR, 'state.json')
+
+# {date} is the run's date, handed to every stage so a scrape that runs past midnight keeps one date. A
+# stage's own source files are inputs too, so changing the code reruns it; inputs may be glob patterns.
+STAGES = [
+    {
+        # The site itself can't be hashed, so this is keyed on the date (part of the command): one scrape a
+        # day unless forced. An interrupted scrape resumes from its journal in data/runs/<date>.
+        'name': 'scrape',
+        'cmd': ['src/scrape_boligportal.py', '--date', '{date}'],
+        'inputs': ['src/scrape_boligportal.py', 'src/log_utils.py', 'src/run_journal.py'],
+        'outputs': ['data/raw/bolig_data_{date}.csv'],
+        'after': [],
+    },
+    {
+        # The rent model is trained on every processed snapshot. Its state file in data/model is written by
+        # this stage, so the stage is keyed on the snapshots the model is built from instead.
+        'name': 'preprocess',
+        'cmd': ['src/preprocess_scraped_data.py', '--skip-stats', '--skip-publish', '--date', '{date}'],
+        'inputs': ['data/raw/bolig_data_{date}.csv', 'data/processed/preprocessed_data_*.csv',
+                   'src/preprocess_scraped_data.py', 'src/rent_model.py'],
+        'outputs': ['data/processed/preprocessed_data_{date}.csv'],
+        'after': ['scrape'],
+    },
+    {
+        # The stats are taken halfway through the cleaning, so this stage repeats the cleaning next to
+        # preprocess instead of waiting for it
+        'name': 'stats',
+        'cmd': ['src/preprocess_scraped_data.py', '--stats-only', '--date', '{date}'],
+        'inputs': ['data/raw/bolig_data_{date}.csv', 'src/preprocess_scraped_data.py'],
+        'outputs': ['outputs/stats/null_pcts_{date}.txt', 'outputs/stats/unique_values_{date}.txt'],
+        'after': ['scrape'],
+    },
+    {
+        'name': 'publish',
+        'cmd': ['src/dataset_versions.py', 'data/processed/preprocessed_data_{date}.csv'],
+        'inputs': ['data/processed/preprocessed_data_{date}.csv', 'src/dataset_versions.py', 'src/text_store.py'],
+        'outputs': ['data/latest/manifest.json'],
+        'after': ['preprocess'],
+    },
+    {
+        'name': 'saved_searches',
+        'cmd': ['src/saved_searches.py'],
+        'inputs': ['data/latest/preprocessed_data_latest.csv', 'data/saved_searches.json', 'src/saved_searches.py'],
+        'outputs': [],
+        'after': ['publish'],
+    },
+    {
+        'name': 'push',
+        'cmd': ['bash', 'push.sh'],
+        'inputs': ['data/latest/manifest.json', 'push.sh'],
+        'outputs': [],
+        'after': ['publish'],
+    },
+]
+
+# Statuses that let the stages after it go ahead
+DONE = ('ran', 'skipped', 'excluded')
+
+
+def load_state(path=STATE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+
+def stage_command(stage, date):
+    cmd = [part.format(date=date) for part in stage['cmd']]
+    # Python stages run with the same interpreter (and conda env) as the runner
+    return [sys.executable] + cmd if cmd[0].endswith('.py') else cmd
+
+
+def input_paths(stage, date):
+    # Glob patterns expand to the files there now, minus the stage's own outputs
+    outputs = {path.format(date=date) for path in stage['outputs']}
+    paths = []
+    for pattern in stage['inputs']:
+        pattern = pattern.format(date=date)
+        if glob.has_magic(pattern):
+            paths.extend(sorted(path for path in glob.glob(pattern) if path not in outputs))
+        else:
+            paths.append(pattern)
+    return paths
+
+
+def stage_key(stage, date):
+    # Content hash of every input plus the command, a missing input hashes as missing
+    sha = hashlib.sha256(json.dumps(stage_command(stage, date)[1:]).encode())
+    for path in input_paths(stage, date):
+        sha.update(f"{path}={file_sha256(path) if os.path.exists(path) else 'missing'}\n".encode())
+    return sha.hexdigest()
+
+
+def skip_reason(stage, date, key, state, force):
+    # Why the stage can be skipped, or None when it has to run
+    if stage['name'] in force:
+        return None
+    if state.get(stage['name'], {}).get('key') != key:
+        return None
+    if not all(os.path.exists(path.format(date=date)) for path in stage['outputs']):
+        return None
+    return 'inputs unchanged'
+
+
+class Pipeline:
+    def __init__(self, stages=STAGES, force=(), exclude=(), dry_run=False, date=None, pipeline_dir=PIPELINE_DIR):
+        self.stages = {stage['name']: stage for stage in stages}
+        self.force = set(self.stages) if force == 'all' else set(force)
+        self.exclude = set(exclude)
+        self.dry_run = dry_run
+        self.date = date or datetime.today().strftime('%Y-%m-%d')
+        self.run_id = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+        self.pipeline_dir = pipeline_dir
+        self.state_path = os.path.join(pipeline_dir, 'state.json')
+        self.log_dir = os.path.join(pipeline_dir, 'logs', self.run_id)
+        self.state = load_state(self.state_path)
+        self.state_lock = threading.Lock()
+        self.results = {}
+
+    def run_stage(self, name):
+        stage = self.stages[name]
+        key = stage_key(stage, self.date)
+        reason = skip_reason(stage, self.date, key, self.state, self.force)
+        if reason:
+            return {'status': 'skipped', 'reason': reason, 'seconds': 0.0}
+        if self.dry_run:
+            return {'status': 'would run', 'seconds': 0.0}
+
+        print(f"[{name}] started")
+        os.makedirs(self.log_dir, exist_ok=True)
+        log_path = os.path.join(self.log_dir, f'{name}.log')
+        start_time = time.time()
+        with open(log_path, 'w', encoding='utf-8') as log:
+            returncode = subprocess.call(stage_command(stage, self.date), stdout=log, stderr=subprocess.STDOUT)
+        seconds = round(time.time() - start_time, 2)
+        if returncode != 0:
+            return {'status': 'failed', 'returncode': returncode, 'seconds': seconds, 'log': log_path}
+
+        missing = [path.format(date=self.date) for path in stage['outputs'] if not os.path.exists(path.format(date=self.date))]
+        if missing:
+            return {'status': 'failed', 'reason': f"missing outputs: {', '.join(missing)}", 'seconds': seconds, 'log': log_path}
+
+        # Record success after every stage so a rerun after a failure starts at the failed stage
+        with self.state_lock:
+            self.state[name] = {'key': key, 'seconds': seconds, 'finished_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+            atomic_write_text(json.dumps(self.state, indent=2, sort_keys=True), self.state_path)
+        return {'status': 'ran', 'seconds': seconds, 'log': log_path}
+
+    def run(self):
+        start_time = time.time()
+        pending = [name for name in self.stages if name not in self.exclude]
+        for name in self.exclude:
+            self.results[name] = {'status': 'excluded', 'seconds': 0.0}
+        running = {}
+        with ThreadPoolExecutor(max_workers=len(self.stages)) as executor:
+            while pending or running:
+                for name in list(pending):
+                    after = [self.results.get(dependency, {}).get('status') for dependency in self.stages[name]['after']]
+                    if any(status is not None and status not in DONE + ('would run',) for status in after):
+                        # Nothing after a failed stage runs
+                        self.results[name] = {'status': 'blocked', 'seconds': 0.0}
+                        pending.remove(name)
+                    elif all(status is not None for status in after) and 'would run' in after:
+                        # Its inputs would change first, so a dry run can't tell it would be skipped
+                        self.results[name] = {'status': 'would run', 'reason': 'after a stage that would run', 'seconds': 0.0}
+                        pending.remove(name)
+                    elif all(status is not None for status in after):
+                        running[executor.submit(self.run_stage, name)] = name
+                        pending.remove(name)
+                if not running:
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        self.results[name] = future.result()
+                    except Exception as e:
+                        self.results[name] = {'status': 'failed', 'reason': str(e), 'seconds': 0.0}
+                    result = self.results[name]
+                    if result['status'] in ('ran', 'failed'):
+                        print(f"[{name}] {result['status']} in {result['seconds']:.2f} seconds" +
+                              (f" (see {result['log']})" if result['status'] == 'failed' and 'log' in result else ''))
+
+        record = {
+            'run_id': self.run_id,
+            'date': self.date,
+            'dry_run': self.dry_run,
+            'seconds': round(time.time() - start_time, 2),
+            'stages': {name: self.results[name] for name in self.stages},
+        }
+        if not self.dry_run:
+            atomic_write_text(json.dumps(record, indent=2), os.path.join(self.pipeline_dir, f'run_{self.run_id}.json'))
+        return record
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the daily scrape, preprocess, stats and publish stages, skipping unchanged ones')
+    parser.add_argument('--force', nargs='*', metavar='STAGE', help='Rerun these stages (all of them if none are named) even when unchanged')
+    parser.add_argument('--exclude', nargs='*', default=[], metavar='STAGE', help='Leave these stages out, e.g. push when running locally')
+    parser.add_argument('--dry-run', action='store_true', help='Only show which stages would run')
+    parser.add_argument('--date', help='Day (YYYY-MM-DD) to run the stages for, defaults to today')
+    args = parser.parse_args()
+
+    stage_names = [stage['name'] for stage in STAGES]
+    unknown = [name for name in (args.force or []) + args.exclude if name not in stage_names]
+    if unknown:
+        parser.error(f"unknown stage(s) {', '.join(unknown)}, use {', '.join(stage_names)}")
+
+    force = 'all' if args.force == [] else (args.force or [])
+    record = Pipeline(force=force, exclude=args.exclude, dry_run=args.dry_run, date=args.date).run()
+
+    print(f"\nPipeline {'dry run' if args.dry_run else 'run ' + record['run_id']} took {record['seconds']:.2f} seconds:")
+    for name, result in record['stages'].items():
+        detail = result.get('reason') or (f"exit code {result['returncode']}" if 'returncode' in result else '')
+        print(f"  {name:<15} {result['status']:<10} {result['seconds']:>8.2f}s  {detail}")
+    if any(result['status'] in ('failed', 'blocked') for result in record['stages'].values()):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
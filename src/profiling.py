@@ -0,0 +1,141 @@
+import json
+import os
+import resource
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+import pandas as pd
+import streamlit as st
+
+# Per-rerun timing of the app. The panel is shown with ?profile=1 in the URL or APP_PROFILE=1 in the
+# environment; APP_PROFILE_LOG=1 only appends the timings of every rerun to the log, for use in production.
+
+PROFILE_DIR = 'outputs/profiling'
+
+# Reruns kept in the session for the panel
+HISTORY_SIZE = 20
+
+# A rerun that never finished (its session went away) stops counting as running after this long
+STALE_SECONDS = 60
+
+# Reruns in progress in this process, across all sessions: id(profiler) -> (start time, traced)
+_running = {}
+_started = 0
+_lock = threading.Lock()
+
+
+def _forget_stale(now):
+    for key, (started_at, _) in list(_running.items()):
+        if now - started_at > STALE_SECONDS:
+            del _running[key]
+
+
+def _stop_tracing_if_idle():
+    # Tracing is process wide and slows every session, it only runs while a profiled rerun does
+    if tracemalloc.is_tracing() and not any(traced for _, traced in _running.values()):
+        tracemalloc.stop()
+
+
+def profiling_requested():
+    return st.query_params.get('profile') == '1' or os.environ.get('APP_PROFILE') == '1'
+
+
+class RerunProfiler:
+    # Splits a rerun into laps: each lap() call closes the phase that ran since the previous one
+    def __init__(self, panel=False, export=False):
+        self.panel = panel
+        self.export = export
+        self.phases = []
+        self.start = self.last = time.perf_counter()
+        # Memory is traced only during reruns with the panel on. The tracer is shared by the whole process, so
+        # when any other rerun overlaps this one its numbers mix with ours and are left out.
+        global _started
+        with _lock:
+            now = time.monotonic()
+            _forget_stale(now)
+            self.overlapped = bool(_running)
+            _started += 1
+            self.started = _started
+            _running[id(self)] = (now, panel)
+            if panel and not tracemalloc.is_tracing():
+                tracemalloc.start()
+            _stop_tracing_if_idle()
+            if panel and not self.overlapped:
+                tracemalloc.reset_peak()
+
+    def lap(self, name):
+        now = time.perf_counter()
+        phase = {'phase': name, 'ms': round((now - self.last) * 1000, 2)}
+        if self.panel:
+            with _lock:
+                # Another rerun started since this one did
+                self.overlapped = self.overlapped or _started != self.started or not tracemalloc.is_tracing()
+                if not self.overlapped:
+                    current, peak = tracemalloc.get_traced_memory()
+                    phase['current_mb'] = round(current / 1e6, 2)
+                    phase['peak_mb'] = round(peak / 1e6, 2)
+                    tracemalloc.reset_peak()
+        self.phases.append(phase)
+        self.last = now
+
+    def finish(self, status='complete'):
+        record = {
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'status': status,
+            'total_ms': round((self.last - self.start) * 1000, 2),
+            'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3, 1),
+            'phases': self.phases,
+        }
+        if self.panel and self.overlapped:
+            record['memory'] = 'not measured, other reruns overlapped'
+        with _lock:
+            _running.pop(id(self), None)
+            _stop_tracing_if_idle()
+        if self.export:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            with open(os.path.join(PROFILE_DIR, f"app_timings_{datetime.now().strftime('%Y-%m-%d')}.jsonl"), 'a') as file:
+                file.write(json.dumps(record) + '\n')
+        return record
+
+
+def start_rerun():
+    # st.rerun() stops the script before the end, the interrupted rerun is closed off here instead
+    panel = profiling_requested()
+    export = panel or os.environ.get('APP_PROFILE_LOG') == '1'
+    history = st.session_state.setdefault('profiling_history', [])
+    unfinished = st.session_state.get('profiler')
+    if unfinished is not None:
+        history.append(unfinished.finish(status='interrupted by st.rerun'))
+    profiler = RerunProfiler(panel, export)
+    st.session_state.profiler = profiler
+    return profiler
+
+
+def finish_rerun(profiler):
+    record = profiler.finish()
+    st.session_state.profiler = None
+    history = st.session_state.profiling_history
+    history.append(record)
+    del history[:-HISTORY_SIZE]
+    if profiler.panel:
+        render_panel(history)
+
+
+def render_panel(history):
+    with st.expander("⏱️ Profiling", expanded=True):
+        current = history[-1]
+        st.write(f"Last rerun: {current['total_ms']:.0f} ms, max RSS {current['max_rss_mb']:.0f} MB")
+        if 'memory' in current:
+            st.caption(f"Memory {current['memory']}.")
+        st.dataframe(pd.DataFrame(current['phases']), hide_index=True, use_container_width=True)
+
+        # One row per recent rerun, one column per phase
+        recent = pd.DataFrame([
+            dict({'timestamp': record['timestamp'], 'status': record['status'], 'total_ms': record['total_ms']},
+                 **{phase['phase']: phase['ms'] for phase in record['phases']})
+            for record in reversed(history)
+        ])
+        st.write(f"Recent reruns ({len(history)}), ms per phase:")
+        st.dataframe(recent, hide_index=True, use_container_width=True)
@@ -0,0 +1,99 @@
+import argparse
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from work_queue import QUEUE_PATH, WorkQueue
+
+# Serves a WorkQueue file over HTTP so crawl workers on other hosts can share it. The SQLite file stays on a local
+# disk of this host, which is the only way its locking can be trusted; every call is one POST /<method> with the
+# method's arguments as a JSON object, answered with {"result": ...}.
+
+# WorkQueue methods a client may call
+METHODS = {'enqueue_many', 'claim', 'complete', 'fail', 'counts', 'is_drained', 'results', 'reserve_rate_slot'}
+
+
+class QueueService:
+    def __init__(self, path=QUEUE_PATH):
+        # One connection for all handler threads, calls are serialised by the lock. Each call is a short
+        # transaction, and SQLite only takes one writer at a time anyway.
+        self.queue = WorkQueue(path, check_same_thread=False)
+        self.lock = threading.Lock()
+
+    def call(self, method, kwargs):
+        with self.lock:
+            return getattr(self.queue, method)(**kwargs)
+
+    def close(self):
+        with self.lock:
+            self.queue.close()
+
+
+class QueueHandler(BaseHTTPRequestHandler):
+    # Keep-alive, workers make one call per item
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    service = None
+
+    def do_POST(self):
+        method = urlsplit(self.path).path.strip('/')
+        try:
+            kwargs = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        except ValueError as e:
+            return self.respond(400, {'error': f'invalid JSON: {e}'})
+        if method not in METHODS:
+            return self.respond(404, {'error': f"unknown method {method}, use {', '.join(sorted(METHODS))}"})
+        try:
+            result = self.service.call(method, kwargs)
+        except TypeError as e:
+            return self.respond(400, {'error': str(e)})
+        except Exception as e:
+            return self.respond(500, {'error': str(e)})
+        self.respond(200, {'result': result})
+
+    def respond(self, status, body):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        # One line per claim would drown the console
+        pass
+
+
+def start_queue_server(path=QUEUE_PATH, host='127.0.0.1', port=0):
+    # Starts the server in a background thread and returns (server, base url)
+    handler = type('BoundQueueHandler', (QueueHandler,), {'service': QueueService(path)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://{host}:{server.server_address[1]}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Share a crawl work queue with workers on other hosts')
+    parser.add_argument('--queue', default=QUEUE_PATH, help='SQLite queue file, on a local disk of this host')
+    parser.add_argument('--host', default='0.0.0.0', help='Interface to listen on, 0.0.0.0 for every host on the network')
+    parser.add_argument('--port', type=int, default=8766)
+    args = parser.parse_args()
+
+    if os.path.dirname(args.queue):
+        os.makedirs(os.path.dirname(args.queue), exist_ok=True)
+    server, url = start_queue_server(args.queue, args.host, args.port)
+    print(f"Serving {args.queue} on {url}, start workers with: python src/crawl_worker.py work --queue http://<this host>:{args.port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        server.RequestHandlerClass.service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+import argparse
+import fcntl
+import glob
+import json
+import os
+import re
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# Where the accumulated model state lives between preprocessing runs
+MODEL_PATH = 'data/model/rent_model.npz'
+
+# Areas are one-hot encoded through a fixed number of hash buckets so the feature space never changes
+# size, which is what lets us keep accumulating the normal equations across snapshots
+N_AREA_BUCKETS = 512
+NUMERIC_FEATURES = ['intercept', 'log_size_sqm', 'rooms', 'floor', 'furnished']
+N_FEATURES = len(NUMERIC_FEATURES) + N_AREA_BUCKETS
+
+# Ridge penalty (not applied to the intercept)
+RIDGE_ALPHA = 1.0
+
+# Only plausible listings are used for training, the site has a few typos like 2.6M kr. per month
+TRAIN_RENT_RANGE = (2000, 100000)
+TRAIN_SIZE_RANGE = (8, 500)
+
+# Columns read from the processed snapshots on disk
+TRAIN_COLUMNS = ['total_monthly_rent', 'size_sqm', 'rooms', 'floor', 'furnished', 'area', 'case_number', 'days_on_website']
+
+
+def area_bucket(area):
+    # crc32 is stable across processes and Python versions, unlike hash()
+    return zlib.crc32(str(area).encode('utf-8')) % N_AREA_BUCKETS
+
+
+def build_features(df):
+    # Returns the dense numeric block and the area bucket of every row; the one-hot area block is
+    # never materialised since all products with it reduce to bincounts
+    n = len(df)
+    numeric = np.empty((n, len(NUMERIC_FEATURES)))
+    numeric[:, 0] = 1.0
+    numeric[:, 1] = np.log(pd.to_numeric(df['size_sqm'], errors='coerce').fillna(1).clip(lower=1).to_numpy())
+    numeric[:, 2] = pd.to_numeric(df['rooms'], errors='coerce').fillna(0).clip(0, 10).to_numpy()
+    numeric[:, 3] = pd.to_numeric(df['floor'], errors='coerce').fillna(0).clip(-1, 10).to_numpy()
+    numeric[:, 4] = (df['furnished'] == 'Yes').to_numpy(dtype=float)
+
+    # Hash every distinct area once instead of once per row
+    codes, uniques = pd.factorize(df['area'].fillna(''))
+    buckets = np.array([area_bucket(a) for a in uniques], dtype=np.int64)
+    return numeric, buckets[codes]
+
+
+def training_mask(df):
+    rent = pd.to_numeric(df['total_monthly_rent'], errors='coerce')
+    size = pd.to_numeric(df['size_sqm'], errors='coerce')
+    return (rent.between(*TRAIN_RENT_RANGE) & size.between(*TRAIN_SIZE_RANGE)).to_numpy()
+
+
+def first_seen(df, seen_ids):
+    # A listing stays up for weeks and is in every daily snapshot until it is rented out. Only its first
+    # appearance is fitted, or listings that don't rent (often the overpriced ones) would weigh more every day.
+    # Rows without a case number count as new on their first day on the website.
+    ids = pd.to_numeric(df['case_number'], errors='coerce') if 'case_number' in df.columns else pd.Series(np.nan, index=df.index)
+    known = ids.notna()
+    new = known & ~ids.isin(seen_ids) & ~ids.duplicated()
+    if 'days_on_website' in df.columns:
+        new |= ~known & (pd.to_numeric(df['days_on_website'], errors='coerce') == 0)
+    return new.to_numpy(), ids[new & known].to_numpy(dtype=np.int64)
+
+
+def empty_state():
+    return {
+        'xtx': np.zeros((N_FEATURES, N_FEATURES)),
+        'xty': np.zeros(N_FEATURES),
+        'n_rows': 0,
+        'snapshots': [],
+        # Case numbers already fitted
+        'seen_ids': np.zeros(0, dtype=np.int64),
+        # Contribution of the newest snapshot, kept so a rerun of the same day can replace it
+        'last': None,
+    }
+
+
+def load_state(path=MODEL_PATH):
+    if not os.path.exists(path):
+        return empty_state()
+    with np.load(path) as data:
+        if data['xtx'].shape != (N_FEATURES, N_FEATURES) or 'seen_ids' not in data.files:
+            # Feature layout changed, or the model was fitted on every row of every snapshot: start over from
+            # the snapshots on disk
+            return empty_state()
+        last = None
+        if 'last_snapshot' in data.files:
+            last = {'snapshot': str(data['last_snapshot']), 'xtx': data['last_xtx'], 'xty': data['last_xty'],
+                    'n_rows': int(data['last_n_rows']), 'ids': data['last_ids']}
+        return {
+            'xtx': data['xtx'],
+            'xty': data['xty'],
+            'n_rows': int(data['n_rows']),
+            'snapshots': [str(s) for s in data['snapshots']],
+            'seen_ids': data['seen_ids'],
+            'last': last,
+        }
+
+
+def save_state(state, path=MODEL_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp.npz'
+    last = {}
+    if state['last']:
+        last = {'last_snapshot': state['last']['snapshot'], 'last_xtx': state['last']['xtx'],
+                'last_xty': state['last']['xty'], 'last_n_rows': state['last']['n_rows'], 'last_ids': state['last']['ids']}
+    np.savez(tmp_path, xtx=state['xtx'], xty=state['xty'], n_rows=state['n_rows'],
+             snapshots=np.array(state['snapshots'], dtype=str), seen_ids=state['seen_ids'], **last)
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def model_lock(path=MODEL_PATH):
+    # Serialises load, fit and save across processes, e.g. two preprocess runs at once
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f'{path}.lock', 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def contribution(df):
+    # X'X and X'y of one snapshot's training rows
+    xtx = np.zeros((N_FEATURES, N_FEATURES))
+    xty = np.zeros(N_FEATURES)
+    mask = training_mask(df)
+    if mask.any():
+        numeric, buckets = build_features(df[mask])
+        y = np.log(pd.to_numeric(df.loc[mask, 'total_monthly_rent']).to_numpy())
+        k = len(NUMERIC_FEATURES)
+
+        xtx[:k, :k] = numeric.T @ numeric
+        for j in range(k):
+            cross = np.bincount(buckets, weights=numeric[:, j], minlength=N_AREA_BUCKETS)
+            xtx[j, k:] = cross
+            xtx[k:, j] = cross
+        xtx[np.arange(k, N_FEATURES), np.arange(k, N_FEATURES)] = np.bincount(buckets, minlength=N_AREA_BUCKETS)
+
+        xty[:k] = numeric.T @ y
+        xty[k:] = np.bincount(buckets, weights=y, minlength=N_AREA_BUCKETS)
+    return {'xtx': xtx, 'xty': xty, 'n_rows': int(mask.sum())}
+
+
+def partial_fit(state, df, snapshot=None):
+    # Accumulate X'X and X'y so a new snapshot costs one pass over its own new listings only
+    new, ids = first_seen(df, state['seen_ids'])
+    added = contribution(df[new])
+    state['xtx'] += added['xtx']
+    state['xty'] += added['xty']
+    state['n_rows'] += added['n_rows']
+    state['seen_ids'] = np.union1d(state['seen_ids'], ids)
+    if snapshot is not None:
+        state['snapshots'].append(snapshot)
+        state['last'] = dict(added, snapshot=snapshot, ids=ids)
+    return state
+
+
+def forget_last(state):
+    # Takes the newest snapshot back out, so a re-scrape of the same day replaces it instead of being ignored
+    last = state['last']
+    state['xtx'] -= last['xtx']
+    state['xty'] -= last['xty']
+    state['n_rows'] -= last['n_rows']
+    state['seen_ids'] = np.setdiff1d(state['seen_ids'], last['ids'])
+    state['snapshots'].remove(last['snapshot'])
+    state['last'] = None
+    return state
+
+
+def solve(state, alpha=RIDGE_ALPHA):
+    penalty = np.full(N_FEATURES, alpha)
+    penalty[0] = 0.0
+    return np.linalg.solve(state['xtx'] + np.diag(penalty), state['xty'])
+
+
+def score(df, weights):
+    # One matrix product plus a gather for the whole snapshot
+    numeric, buckets = build_features(df)
+    k = len(NUMERIC_FEATURES)
+    return np.exp(numeric @ weights[:k] + weights[k:][buckets])
+
+
+def snapshot_date(path):
+    match = re.search(r'(\d{4}-\d{2}-\d{2})\.csv$', path)
+    return match.group(1) if match else None
+
+
+def add_rent_estimates(df, today_date, processed_dir='data/processed', model_path=MODEL_PATH):
+    with model_lock(model_path):
+        state = load_state(model_path)
+
+        # Processing the same day again replaces that day's data. Only the newest snapshot can be replaced,
+        # an older day that is already in the model stays as it was.
+        if state['last'] and state['last']['snapshot'] == today_date:
+            forget_last(state)
+        seen = set(state['snapshots'])
+
+        # Fold in any historical snapshot the model has not seen yet (cold start, or days processed elsewhere)
+        for path in sorted(glob.glob(os.path.join(processed_dir, 'preprocessed_data_*.csv'))):
+            date = snapshot_date(path)
+            if date is None or date in seen or date == today_date:
+                continue
+            partial_fit(state, pd.read_csv(path, usecols=lambda column: column in TRAIN_COLUMNS), date)
+            seen.add(date)
+
+        if today_date not in seen:
+            partial_fit(state, df, today_date)
+
+        save_state(state, model_path)
+
+    return score_listings(df, solve(state) if state['n_rows'] else None)
+
+
+def current_weights(model_path=MODEL_PATH):
+    # Weights of the saved model without folding in anything new, None when nothing has been trained yet
+    state = load_state(model_path)
+    return solve(state) if state['n_rows'] else None
+
+
+def score_listings(df, weights):
+    if weights is None:
+        df['expected_rent'] = np.nan
+        df['price_delta_pct'] = np.nan
+        return df
+    df['expected_rent'] = score(df, weights).round(0)
+    # Negative means the listing is cheaper than comparable apartments
+    df['price_delta_pct'] = ((df['total_monthly_rent'] - df['expected_rent']) / df['expected_rent'] * 100).round(1)
+    return df
+
+
+def benchmark(rows, snapshots, source='data/latest/preprocessed_data_latest.csv'):
+    base = pd.read_csv(source, usecols=lambda column: column in TRAIN_COLUMNS)
+    sample = base.sample(n=rows, replace=True, random_state=0).reset_index(drop=True)
+
+    state = empty_state()
+    start = time.perf_counter()
+    for i in range(snapshots):
+        # New case numbers every snapshot, or only the first one would be fitted
+        sample['case_number'] = np.arange(i * rows, (i + 1) * rows)
+        partial_fit(state, sample, f'snapshot-{i}')
+    weights = solve(state)
+    train_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    score(sample, weights)
+    score_seconds = time.perf_counter() - start
+
+    return {
+        'date': datetime.today().strftime('%Y-%m-%d %H:%M:%S'),
+        'rows_per_snapshot': rows,
+        'snapshots': snapshots,
+        'train_seconds': round(train_seconds, 4),
+        'train_rows_per_second': round(rows * snapshots / train_seconds),
+        'score_seconds': round(score_seconds, 4),
+        'score_rows_per_second': round(rows / score_seconds),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rent estimation model used during preprocessing')
+    parser.add_argument('--benchmark', action='store_true', help='Time training and batch scoring on resampled listings')
+    parser.add_argument('--rows', type=int, default=100000, help='Rows per simulated snapshot')
+    parser.add_argument('--snapshots', type=int, default=30, help='Number of snapshots to train on')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        results = benchmark(args.rows, args.snapshots)
+        print(json.dumps(results, indent=2))
+        os.makedirs('outputs/stats', exist_ok=True)
+        with open(f"outputs/stats/rent_model_benchmark_{datetime.today().strftime('%Y-%m-%d')}.json", 'w') as file:
+            json.dump(results, file, indent=2)
+    else:
+        parser.print_help()
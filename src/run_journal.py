@@ -0,0 +1,87 @@
+import json
+import os
+import re
+import shutil
+
+from file_utils import atomic_write_text
+
+# Append-only journal of a scrape run. Every entry is one JSON line, flushed and fsynced before the call
+# returns, so whatever a crashed run finished is on disk and a restarted run only does what is missing.
+# Each stream is a plain JSONL file, readable mid-run with pd.read_json(path, lines=True).
+
+RUNS_DIR = 'data/runs'
+
+# Journals hold every fetched page, only the most recent days are kept
+KEEP_RUNS = 7
+RUN_DIR_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+# Written once the run's CSVs are, a journal without it belongs to a run that is still to be finished
+COMPLETE_MARKER = 'complete.json'
+
+
+class RunJournal:
+    def __init__(self, run_dir):
+        self.run_dir = run_dir
+        os.makedirs(run_dir, exist_ok=True)
+        self.files = {}
+
+    def path(self, stream):
+        return os.path.join(self.run_dir, f'{stream}.jsonl')
+
+    def append(self, stream, entry):
+        if stream not in self.files:
+            self.files[stream] = open(self.path(stream), 'a', encoding='utf-8')
+            # Start on a fresh line if the last run died halfway through writing one
+            if self.files[stream].tell() and not self._ends_with_newline(stream):
+                self.files[stream].write('\n')
+        file = self.files[stream]
+        file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        file.flush()
+        os.fsync(file.fileno())
+
+    def _ends_with_newline(self, stream):
+        with open(self.path(stream), 'rb') as file:
+            file.seek(-1, os.SEEK_END)
+            return file.read(1) == b'\n'
+
+    def read(self, stream):
+        if not os.path.exists(self.path(stream)):
+            return []
+        entries = []
+        with open(self.path(stream), encoding='utf-8') as file:
+            for line in file:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A line cut short by a crash, the work behind it simply gets redone
+                    continue
+        return entries
+
+    def close(self):
+        for file in self.files.values():
+            file.close()
+        self.files = {}
+
+    def is_complete(self):
+        return os.path.exists(os.path.join(self.run_dir, COMPLETE_MARKER))
+
+    def mark_complete(self, summary):
+        atomic_write_text(json.dumps(summary, indent=2), os.path.join(self.run_dir, COMPLETE_MARKER))
+
+    def start_over(self):
+        # Resuming a finished run would fetch nothing, a second scrape of the day starts from an empty journal
+        self.close()
+        for name in os.listdir(self.run_dir):
+            if name.endswith('.jsonl') or name == COMPLETE_MARKER:
+                os.remove(os.path.join(self.run_dir, name))
+
+
+def prune_runs(runs_dir=RUNS_DIR, keep=KEEP_RUNS):
+    # Removes all but the newest `keep` daily journals, returns the names removed
+    if not os.path.isdir(runs_dir):
+        return []
+    runs = sorted(name for name in os.listdir(runs_dir) if RUN_DIR_PATTERN.match(name))
+    removed = runs[:max(len(runs) - keep, 0)]
+    for name in removed:
+        shutil.rmtree(os.path.join(runs_dir, name))
+    return removed
@@ -0,0 +1,284 @@
+import argparse
+import json
+import os
+import time
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+from filters import FILTER_KEYS, MAX_MOVE_IN_PRICE, MAX_PRICE, MAX_RENT_PER_PERSON, add_derived_columns
+
+SAVED_SEARCHES_PATH = 'data/saved_searches.json'
+SEEN_LISTINGS_PATH = 'data/seen_listings.txt'
+OUTBOX_PATH = 'outputs/outbox/saved_search_matches.jsonl'
+
+# Filter fields that hold a (min, max) pair
+RANGE_KEYS = [
+    'selected_available_from',
+    'selected_price_range_thousands',
+    'selected_size',
+    'selected_days_on_website',
+    'selected_move_in_price_thousands',
+    'selected_rent_per_person_thousands',
+]
+
+# Upper bounds (in DKK) at which a sidebar slider means "no maximum"
+SLIDER_NO_MAX = {
+    'selected_price_range_thousands': MAX_PRICE,
+    'selected_move_in_price_thousands': MAX_MOVE_IN_PRICE,
+    'selected_rent_per_person_thousands': MAX_RENT_PER_PERSON,
+}
+
+
+def load_saved_searches(path=SAVED_SEARCHES_PATH):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def write_saved_searches(searches, path=SAVED_SEARCHES_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(searches, file, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def save_search(name, filters, path=SAVED_SEARCHES_PATH):
+    # Store only the filter fields, dates as ISO strings so the file stays plain JSON
+    stored = {}
+    for key in FILTER_KEYS:
+        if key not in filters:
+            continue
+        value = filters[key]
+        if key in RANGE_KEYS:
+            value = [v.isoformat() if isinstance(v, (date, datetime)) else v for v in value]
+        stored[key] = value
+
+    searches = [search for search in load_saved_searches(path) if search['name'] != name]
+    searches.append({'name': name, 'filters': stored})
+    write_saved_searches(searches, path)
+
+
+def search_to_filters(search, defaults):
+    # Turn a stored search back into session state values, defaults fill in whatever is missing
+    filters = dict(defaults)
+    for key, value in search['filters'].items():
+        if value is None or key not in defaults:
+            continue
+        if key == 'selected_available_from':
+            value = [pd.to_datetime(v).date() for v in value]
+        elif key in RANGE_KEYS:
+            value = tuple(value)
+        filters[key] = value
+    return filters
+
+
+def compile_searches(searches, no_max=SLIDER_NO_MAX):
+    # Stack every search's predicates into column arrays so a group of listings can be checked against
+    # all candidate searches with a handful of broadcast comparisons. Missing fields mean "no constraint".
+    # The percentile filter is relative to the whole dataset, so it has no meaning for standing searches.
+    # no_max holds the upper bounds that mean "no maximum", as on the sidebar sliders; pass {} to apply
+    # every upper bound as given.
+    n = len(searches)
+    compiled = {
+        'names': [search['name'] for search in searches],
+        'price_min': np.full(n, -np.inf), 'price_max': np.full(n, np.inf),
+        'move_in_min': np.full(n, -np.inf), 'move_in_max': np.full(n, np.inf),
+        'rpp_min': np.full(n, -np.inf), 'rpp_max': np.full(n, np.inf),
+        'size_min': np.full(n, -np.inf), 'size_max': np.full(n, np.inf),
+        'days_min': np.full(n, -np.inf), 'days_max': np.full(n, np.inf),
+        'rooms_min': np.full(n, -np.inf),
+        'date_min': np.full(n, np.iinfo(np.int64).min), 'date_max': np.full(n, np.iinfo(np.int64).max),
+        'include_null_date': np.ones(n, dtype=bool),
+        'furnished': np.full(n, '', dtype=object), 'any_furnished': np.ones(n, dtype=bool),
+        'energy_mark': np.full(n, '', dtype=object), 'any_energy_mark': np.ones(n, dtype=bool),
+        'underpriced_only': np.zeros(n, dtype=bool),
+    }
+    by_area = {}
+    any_area = []
+    date_searches, date_bounds = [], []
+
+    for i, search in enumerate(searches):
+        filters = search['filters']
+
+        def bounds(key, scale):
+            value = filters.get(key)
+            if not value:
+                return -np.inf, np.inf
+            low, high = value[0] * scale, value[1] * scale
+            return low, (np.inf if high >= no_max.get(key, np.inf) else high)
+
+        compiled['price_min'][i], compiled['price_max'][i] = bounds('selected_price_range_thousands', 1000)
+        compiled['move_in_min'][i], compiled['move_in_max'][i] = bounds('selected_move_in_price_thousands', 1000)
+        compiled['rpp_min'][i], compiled['rpp_max'][i] = bounds('selected_rent_per_person_thousands', 1000)
+        compiled['size_min'][i], compiled['size_max'][i] = bounds('selected_size', 1)
+        compiled['days_min'][i], compiled['days_max'][i] = bounds('selected_days_on_website', 1)
+
+        if filters.get('selected_rooms', 'All') != 'All':
+            compiled['rooms_min'][i] = float(filters['selected_rooms'])
+        if filters.get('selected_available_from'):
+            date_searches.append(i)
+            date_bounds.extend(filters['selected_available_from'][:2])
+        compiled['include_null_date'][i] = filters.get('include_null_available_from', True)
+        if filters.get('selected_furnished', 'All') != 'All':
+            compiled['furnished'][i] = filters['selected_furnished']
+            compiled['any_furnished'][i] = False
+        if filters.get('selected_energy_mark', 'All') != 'All':
+            compiled['energy_mark'][i] = filters['selected_energy_mark']
+            compiled['any_energy_mark'][i] = False
+        compiled['underpriced_only'][i] = bool(filters.get('selected_underpriced_only'))
+
+        # Index searches by area so each listing is only compared with searches that could match it
+        if filters.get('selected_area'):
+            for area in filters['selected_area']:
+                by_area.setdefault(area, []).append(i)
+        else:
+            any_area.append(i)
+
+    # Parse all date bounds in one go, it is by far the slowest part otherwise
+    if date_searches:
+        parsed = pd.to_datetime(pd.Series(date_bounds)).to_numpy(dtype='datetime64[ns]').astype(np.int64)
+        compiled['date_min'][date_searches] = parsed[0::2]
+        compiled['date_max'][date_searches] = parsed[1::2]
+
+    compiled['by_area'] = {area: np.array(ids, dtype=np.int64) for area, ids in by_area.items()}
+    compiled['any_area'] = np.array(any_area, dtype=np.int64)
+    return compiled
+
+
+def listing_columns(listings):
+    # Listing side of the predicates as flat arrays, categories as integer codes so comparisons run on ints
+    # instead of Python strings. Returns the columns and the code of every category value.
+    furnished_codes, furnished_values = pd.factorize(listings['furnished'])
+    energy_mark_codes, energy_mark_values = pd.factorize(listings['energy_mark'])
+    dates = pd.to_datetime(listings['available_from'], errors='coerce')
+    columns = {
+        'price': listings['total_rental_price'].to_numpy(dtype=float),
+        'move_in': listings['move_in_price'].to_numpy(dtype=float),
+        'rpp': listings['rent_per_person'].to_numpy(dtype=float),
+        'size': listings['size_sqm'].to_numpy(dtype=float),
+        'days': listings['days_on_website'].to_numpy(dtype=float),
+        'rooms': pd.to_numeric(listings['rooms'], errors='coerce').to_numpy(dtype=float),
+        'date': dates.to_numpy(dtype='datetime64[ns]').astype(np.int64),
+        'date_null': dates.isna().to_numpy(),
+        'furnished': furnished_codes,
+        'energy_mark': energy_mark_codes,
+        'underpriced': (listings['price_delta_pct'] < 0).to_numpy() if 'price_delta_pct' in listings.columns else np.ones(len(listings), dtype=bool),
+    }
+    lookups = {
+        'furnished': {value: code for code, value in enumerate(furnished_values)},
+        'energy_mark': {value: code for code, value in enumerate(energy_mark_values)},
+    }
+    return columns, lookups
+
+
+def encode_searches(compiled, lookups):
+    # Search side of the categories in the listings' codes, -2 for values no listing has
+    compiled = dict(compiled)
+    for key, lookup in lookups.items():
+        compiled[key] = np.array([lookup.get(value, -2) for value in compiled[key]], dtype=np.int64)
+    return compiled
+
+
+def match_mask(s, l):
+    # Broadcasts search predicates (s) against listing columns (l)
+    return (
+        (l['price'] >= s['price_min']) & (l['price'] <= s['price_max']) &
+        (l['move_in'] >= s['move_in_min']) & (l['move_in'] <= s['move_in_max']) &
+        (np.isnan(l['rpp']) | ((l['rpp'] >= s['rpp_min']) & (l['rpp'] <= s['rpp_max']))) &
+        (l['size'] >= s['size_min']) & (l['size'] <= s['size_max']) &
+        (l['days'] >= s['days_min']) & (l['days'] <= s['days_max']) &
+        ((s['rooms_min'] == -np.inf) | (l['rooms'] >= s['rooms_min'])) &
+        (np.where(l['date_null'], s['include_null_date'], (l['date'] >= s['date_min']) & (l['date'] <= s['date_max']))) &
+        (s['any_furnished'] | (l['furnished'] == s['furnished'])) &
+        (s['any_energy_mark'] | (l['energy_mark'] == s['energy_mark'])) &
+        (~s['underpriced_only'] | l['underpriced'])
+    )
+
+
+def match_listings(compiled, listings):
+    # Returns (search index, listing position) pairs for every match
+    listings = listings.reset_index(drop=True)
+    columns, lookups = listing_columns(listings)
+    compiled = encode_searches(compiled, lookups)
+
+    matches = []
+    # Listings without an area can still match the searches that don't filter on one
+    for area, positions in listings.groupby('area', sort=False, dropna=False).indices.items():
+        candidates = np.concatenate([compiled['by_area'].get(area, np.empty(0, dtype=np.int64)), compiled['any_area']])
+        if len(candidates) == 0:
+            continue
+
+        # Searches along the rows, listings along the columns
+        s = {key: value[candidates][:, None] for key, value in compiled.items() if isinstance(value, np.ndarray) and key != 'any_area'}
+        l = {key: value[positions][None, :] for key, value in columns.items()}
+
+        search_idx, listing_idx = np.nonzero(match_mask(s, l))
+        matches.extend(zip(candidates[search_idx], positions[listing_idx]))
+    return matches
+
+
+def load_seen_listings(path=SEEN_LISTINGS_PATH):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as file:
+        return set(line.strip() for line in file if line.strip())
+
+
+def notification(search_name, row, matched_at):
+    # One outbox line; missing numbers become null, the raw data has listings without rooms or size
+    def number(value, cast):
+        return cast(value) if pd.notna(value) else None
+
+    return {
+        'search': search_name,
+        'url': row['url'],
+        'area': row['area'],
+        'total_rental_price': number(row['total_rental_price'], float),
+        'size_sqm': number(row['size_sqm'], float),
+        'rooms': number(row['rooms'], int),
+        'matched_at': matched_at,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Match newly seen listings against all saved searches')
+    parser.add_argument('--data', default='data/latest/preprocessed_data_latest.csv', help='Processed listings to check')
+    args = parser.parse_args()
+
+    df = add_derived_columns(pd.read_csv(args.data))
+
+    seen = load_seen_listings()
+    if seen is None:
+        # First run: remember what is already on the site instead of reporting every listing as new
+        new_listings = df.iloc[0:0]
+        print(f"No seen listings yet, marking {len(df)} listings as seen.")
+    else:
+        new_listings = df[~df['url'].isin(seen)]
+
+    searches = load_saved_searches()
+    start_time = time.time()
+    matches = match_listings(compile_searches(searches), new_listings) if searches and len(new_listings) else []
+    print(f"Matched {len(new_listings)} new listings against {len(searches)} saved searches in {time.time() - start_time:.3f} seconds: {len(matches)} matches.")
+
+    if matches:
+        os.makedirs(os.path.dirname(OUTBOX_PATH), exist_ok=True)
+        matched_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        listings = new_listings.reset_index(drop=True)
+        with open(OUTBOX_PATH, 'a', encoding='utf-8') as file:
+            for search_idx, position in matches:
+                file.write(json.dumps(notification(searches[search_idx]['name'], listings.iloc[position], matched_at),
+                                      ensure_ascii=False) + '\n')
+
+    # Remember everything we have now seen so tomorrow only the new listings are checked
+    os.makedirs(os.path.dirname(SEEN_LISTINGS_PATH), exist_ok=True)
+    with open(SEEN_LISTINGS_PATH, 'a', encoding='utf-8') as file:
+        for url in (df['url'] if seen is None else new_listings['url']):
+            file.write(f'{url}\n')
+
+
+if __name__ == "__main__":
+    main()
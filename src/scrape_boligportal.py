@@ -1,3 +1,4 @@
+import argparse
 import requests
 from bs4 import BeautifulSoup
 import pandas as pd 
@@ -6,29 +7,57 @@ from tqdm import tqdm
 import time
 import os
 from multiprocessing import Pool, cpu_count
-import logging
-
-# Configure logging
-logging.basicConfig(
-    level=logging.ERROR, 
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(f"outputs/errors/scrape_errors_{datetime.today().strftime('%Y-%m-%d')}.log")
-    ]
-)
-
-def fetch_html_content(link):
-        full_url = f"https://www.boligportal.dk{link}"
-        response = requests.get(full_url)
+from functools import partial
+import numpy as np
+
+from file_utils import atomic_write_csv
+from log_utils import FieldFailures, init_worker_logging, start_log_listener
+from run_journal import KEEP_RUNS, RUNS_DIR, RunJournal, prune_runs
+
+# Failures of extract_apartment_info calls made in this process
+FIELD_FAILURES = FieldFailures()
+
+# The site to scrape, can be pointed at the local stub server (src/stub_server.py) for load tests
+BASE_HOST = os.environ.get('BOLIGPORTAL_HOST', 'https://www.boligportal.dk')
+SEARCH_PATH = '/lejligheder/k%C3%B8benhavn/?include_units=1'
+
+# How often to retry a request that was throttled with 429
+MAX_RETRIES = 3
+
+# Seconds to wait for the server to answer, a stalled connection would otherwise hold its worker forever
+REQUEST_TIMEOUT = 30
+
+# Listings per search result page
+PAGE_SIZE = 18
+
+def get_with_retries(url):
+    # Back off on 429, honouring Retry-After when the server sends it
+    for attempt in range(MAX_RETRIES + 1):
+        response = requests.get(url, timeout=REQUEST_TIMEOUT)
+        if response.status_code != 429 or attempt == MAX_RETRIES:
+            return response
+        time.sleep(float(response.headers.get('Retry-After', 2 ** attempt)))
+
+def fetch_html_content(link, host=BASE_HOST):
+        # The page, or {'url', 'error'} when it couldn't be fetched
+        full_url = f"{host}{link}"
+        start_time = time.time()
+        try:
+            response = get_with_retries(full_url)
+        except requests.RequestException as e:
+            print(f"Failed to retrieve content from {full_url}: {e}")
+            return {'url': full_url, 'error': str(e)}
         if response.status_code == 200:
-            return {'url': full_url, 'html_code': response.text}
+            return {'url': full_url, 'html_code': response.text, 'fetch_seconds': time.time() - start_time}
         else:
             print(f"Failed to retrieve content from {full_url}")
-            return None
+            return {'url': full_url, 'error': f'HTTP {response.status_code}'}
         
-def extract_apartment_info(html_content, url):
+def parse_apartment_info(html_content, url):
+    # Returns the apartment info and the fields that failed to extract, as [(field, error)]
     soup = BeautifulSoup(html_content, 'html.parser')
     apartment_info = {'url': url}  # Include the URL in the apartment info
+    failed_fields = []
 
     try:
         # Extract the breadcrumb (location) information
@@ -36,7 +65,7 @@ def extract_apartment_info(html_content, url):
         apartment_info['breadcrumb'] = breadcrumb
     except Exception as e:
         apartment_info['breadcrumb'] = None
-        logging.error(f"Error extracting breadcrumb for URL {url}: {e}")
+        failed_fields.append(('breadcrumb', str(e)))
 
     try:
         # Extract the title of the apartment
@@ -44,7 +73,7 @@ def extract_apartment_info(html_content, url):
         apartment_info['title'] = title
     except Exception as e:
         apartment_info['title'] = None
-        logging.error(f"Error extracting title for URL {url}: {e}")
+        failed_fields.append(('title', str(e)))
 
     try:
         # Extract the main description
@@ -52,7 +81,7 @@ def extract_apartment_info(html_content, url):
         apartment_info['description'] = description
     except Exception as e:
         apartment_info['description'] = None
-        logging.error(f"Error extracting description for URL {url}: {e}")
+        failed_fields.append(('description', str(e)))
 
     try:
         # Extract the address
@@ -60,7 +89,7 @@ def extract_apartment_info(html_content, url):
         apartment_info['address'] = address
     except Exception as e:
         apartment_info['address'] = None
-        logging.error(f"Error extracting address for URL {url}: {e}")
+        failed_fields.append(('address', str(e)))
 
     try:
         # Extract rent details
@@ -68,21 +97,21 @@ def extract_apartment_info(html_content, url):
         apartment_info['monthly_rent'] = monthly_rent
     except Exception as e:
         apartment_info['monthly_rent'] = None
-        logging.error(f"Error extracting monthly rent for URL {url}: {e}")
+        failed_fields.append(('monthly_rent', str(e)))
 
     try:
         monthly_aconto = soup.select_one('.css-30nv8k').get_text(strip=True)
         apartment_info['monthly_aconto'] = monthly_aconto
     except Exception as e:
         apartment_info['monthly_aconto'] = None
-        logging.error(f"Error extracting monthly aconto for URL {url}: {e}")
+        failed_fields.append(('monthly_aconto', str(e)))
 
     try:
         move_in_price = soup.select('.css-30nv8k')[1].get_text(strip=True)
         apartment_info['move_in_price'] = move_in_price
     except Exception as e:
         apartment_info['move_in_price'] = None
-        logging.error(f"Error extracting move-in price for URL {url}: {e}")
+        failed_fields.append(('move_in_price', str(e)))
 
     try:
         # Extract availability
@@ -90,21 +119,21 @@ def extract_apartment_info(html_content, url):
         apartment_info['available_from'] = available_from
     except Exception as e:
         apartment_info['available_from'] = None
-        logging.error(f"Error extracting available from for URL {url}: {e}")
+        failed_fields.append(('available_from', str(e)))
 
     try:
         rental_period = soup.select('.css-30nv8k')[1].get_text(strip=True)
         apartment_info['rental_period'] = rental_period
     except Exception as e:
         apartment_info['rental_period'] = None
-        logging.error(f"Error extracting rental period for URL {url}: {e}")
+        failed_fields.append(('rental_period', str(e)))
 
     try:
         # Extract detailed characteristics
         details = {item.select_one('.css-1td16zm').get_text(strip=True): item.select_one('.css-1f8murc').get_text(strip=True) for item in soup.select('.css-1n6wxiw') if item.select_one('.css-1f8murc')}
         apartment_info.update(details)
     except Exception as e:
-        logging.error(f"Error extracting detailed characteristics for URL {url}: {e}")
+        failed_fields.append(('detailed_characteristics', str(e)))
 
     try:
         if soup.select_one('img.css-rdsunt'):
@@ -113,32 +142,64 @@ def extract_apartment_info(html_content, url):
             apartment_info['energy_mark_src'] = None
     except Exception as e:
         apartment_info['energy_mark_src'] = None
-        logging.error(f"Error extracting energy mark source for URL {url}: {e}")
+        failed_fields.append(('energy_mark_src', str(e)))
+
+    return apartment_info, failed_fields
 
+def extract_apartment_info(html_content, url):
+    apartment_info, failed_fields = parse_apartment_info(html_content, url)
+    FIELD_FAILURES.add_page(failed_fields, url)
     return apartment_info
 
+def page_url(base_url, page):
+    # Search urls may or may not already carry a query string
+    separator = '&' if '?' in base_url else '?'
+    return f"{base_url}{separator}offset={PAGE_SIZE*page}"
+
+def is_last_page(soup):
+    # The element with class 'css-16snok8' only shows up once we are past the last page of results
+    return soup.find(class_='css-16snok8') is not None
+
+def extract_listing_links(soup):
+    # Find all div elements with class "css-krvsu4" and extract the href from each
+    divs = soup.find_all('div', class_='css-krvsu4')
+    return [div.find('a')['href'] for div in divs if div.find('a')]
+
 def process_apartment_info(args):
+    # Pool version: failures travel back with the result and are merged in the parent
     html_code, url = args
-    return extract_apartment_info(html_code, url)
+    return parse_apartment_info(html_code, url)
 
-def main():
+def main(host=BASE_HOST, output_dir='data/raw', run_dir=None, today_date=None, keep_runs=KEEP_RUNS):
     # Base URL for the website
-    base_url = "https://www.boligportal.dk/lejligheder/k%C3%B8benhavn/?include_units=1"
-
-    # Dictionary to store the HTML content with page numbers as keys
-    html_dict = {}
-
-    # Iterate through the pages by modifying the offset
-    i = 0
-    print("Scraping pages...")
+    base_url = f"{host}{SEARCH_PATH}"
+
+    # Get today's date in YYYY-MM-DD format, unless the caller fixed the date the outputs are named after
+    today_date = today_date or datetime.today().strftime('%Y-%m-%d')
+
+    # Workers send log records to a single listener that writes the error log
+    log_queue, listener = start_log_listener(f"outputs/errors/scrape_errors_{today_date}.log")
+
+    # Everything that completes is journaled right away, a restarted run picks up where the last one stopped
+    journal = RunJournal(run_dir or os.path.join(RUNS_DIR, today_date))
+    if journal.is_complete():
+        print(f"The run in {journal.run_dir} already finished, scraping again from the start.")
+        journal.start_over()
+    index_entries = journal.read('index')
+    index_done = any(entry.get('last_page') for entry in index_entries)
+    html_pages = [entry for entry in index_entries if 'page' in entry]
+
+    # Iterate through the pages by modifying the offset, starting after the last journaled page
+    i = len(html_pages)
+    print("Scraping pages..." if not i else f"Resuming after {i} journaled page(s)...")
     start_time = time.time()  # Record the start time of the entire scraping process
-    while True:
+    while not index_done:
                 
         # Construct the URL for the current page
-        url = f"{base_url}&offset={18*i}"
+        url = page_url(base_url, i)
         
         # Send a GET request to the URL
-        response = requests.get(url)
+        response = get_with_retries(url)
         
         # Check if the request was successful
         if response.status_code == 200:
@@ -146,14 +207,20 @@ def main():
             soup = BeautifulSoup(response.text, 'html.parser')
             
             # Check if the element with class 'css-16snok8' exists
-            if soup.find(class_='css-16snok8'):
+            if is_last_page(soup):
                 print(f"Stopping at page {i + 1} as 'css-16snok8' element was found.")
+                journal.append('index', {'last_page': i + 1})
+                index_done = True
                 break
             
-            # Store the HTML content in the dictionary with the page number as the key
-            html_dict[i + 1] = response.text
+            # Journal the listing links found on the page
+            entry = {'page': i + 1, 'links': extract_listing_links(soup)}
+            journal.append('index', entry)
+            html_pages.append(entry)
         else:
+            # Left open in the journal, so the next run retries from this page
             print(f"Failed to retrieve page {i + 1}")
+            journal.append('failures', {'url': url, 'page': i + 1, 'error': f'HTTP {response.status_code}'})
             break
         
         total_elapsed_time = time.time() - start_time  # Calculate the total elapsed time
@@ -161,67 +228,120 @@ def main():
         
         i += 1
         
-    # Optionally, you can print or save the html_dict to a file
-    print(f"Scraped {len(html_dict)} pages successfully.")
-
-    # To access the HTML content of a specific page
-    # page_1_html = html_dict[1]
-
-    links = []
-
-    # Iterate through the HTML pages stored in html_dict
-    for page_number, html_content in tqdm(html_dict.items(), desc="Extracting links from HTML pages"):
-        # Parse the HTML content using BeautifulSoup
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
-        # Find all div elements with class "css-krvsu4"
-        divs = soup.find_all('div', class_='css-krvsu4')
-        
-        # Extract the href from each div and store it in a list
-        hrefs = [div.find('a')['href'] for div in divs if div.find('a')]
-        
-        for href in hrefs:
-            # Store the hrefs in the dictionary with the page number as the key
-            links.append(href)
-
-    data = []
-
-    with Pool(cpu_count()) as pool:
-        results = list(tqdm(pool.imap(fetch_html_content, links), desc="Fetching HTML content for each URL", total=len(links)))
-
-    # Filter out None results and extend the data list
-    data.extend([result for result in results if result is not None])
-
-    # Convert the list of dictionaries into a DataFrame
-    df = pd.DataFrame(data, columns=['url', 'html_code'])
-    # Get today's date in YYYY-MM-DD format
-    today_date = datetime.today().strftime('%Y-%m-%d')
-
-    # Ensure the directory exists, otherwise create it
-    output_dir = 'data/raw'
-    os.makedirs(output_dir, exist_ok=True)
-
-    # Add the date to the filename
-    output_path = os.path.join(output_dir, f'boligportal_pages_{today_date}.csv')
-
-    # Save the DataFrame to a CSV file
-    df.to_csv(output_path, index=False)
-
-    with Pool(cpu_count()) as pool:
-        df_list = list(tqdm(pool.imap(process_apartment_info, zip(df.html_code, df.url)), desc="Extracting apartment info", total=len(df)))
-
-    new_df = pd.DataFrame(df_list)
-
-    # Get today's date in YYYY-MM-DD format
-    today_date = datetime.today().strftime('%Y-%m-%d')
-
-    # Ensure the directory exists, otherwise save in the current folder
-    output_dir = 'data/raw'
-    os.makedirs(output_dir, exist_ok=True)
-
-    # Add the date to the filename
-    output_path = os.path.join(output_dir, f'bolig_data_{today_date}.csv')
-    new_df.to_csv(output_path, index=False, header=True, encoding='utf-8')
+    print(f"Scraped {len(html_pages)} pages successfully.")
+
+    # Listing links in page order, without the repeats that show up when listings shift between pages
+    links = list(dict.fromkeys(link for entry in html_pages for link in entry['links']))
+
+    # Fetch only what earlier attempts of this run didn't get, journaling each page as it arrives
+    data = journal.read('pages')
+    fetched_urls = {result['url'] for result in data}
+    todo = [link for link in links if f"{host}{link}" not in fetched_urls]
+    if data:
+        print(f"{len(data)} listing(s) already fetched in this run, {len(todo)} to go.")
+
+    failed = []
+    with Pool(cpu_count(), initializer=init_worker_logging, initargs=(log_queue,)) as pool:
+        for result in tqdm(pool.imap_unordered(partial(fetch_html_content, host=host), todo), desc="Fetching HTML content for each URL", total=len(todo)):
+            # Failed fetches go to their own stream, they are not in pages so the next run retries them
+            if 'error' in result:
+                journal.append('failures', result)
+                failed.append(result)
+            else:
+                journal.append('pages', result)
+                data.append(result)
+        # Let the workers exit on their own. terminate() can kill one while it holds the log queue's write
+        # lock, and then the listener never gets the sentinel that stops it.
+        pool.close()
+        pool.join()
+
+    # Fetch latency including retries, useful when load testing against the stub server
+    fetch_seconds = [result['fetch_seconds'] for result in data]
+    if fetch_seconds:
+        print(f"Fetched {len(data)}/{len(links)} listings. Latency p50 {np.percentile(fetch_seconds, 50):.3f}s, "
+              f"p95 {np.percentile(fetch_seconds, 95):.3f}s, p99 {np.percentile(fetch_seconds, 99):.3f}s")
+
+    # Keep the link order of the search results
+    link_order = {f"{host}{link}": position for position, link in enumerate(links)}
+    data.sort(key=lambda result: link_order.get(result['url'], len(link_order)))
+
+    # Parse only the pages that have no journaled record yet
+    records = {record['url']: record for record in journal.read('records')}
+    to_parse = [(result['html_code'], result['url']) for result in data if result['url'] not in records]
+    failures = FieldFailures()
+    with Pool(cpu_count(), initializer=init_worker_logging, initargs=(log_queue,)) as pool:
+        for record, failed_fields in tqdm(pool.imap_unordered(process_apartment_info, to_parse), desc="Extracting apartment info", total=len(to_parse)):
+            journal.append('records', record)
+            records[record['url']] = record
+            failures.add_page(failed_fields, record['url'])
+        pool.close()
+        pool.join()
+
+    # One summary of the fields that failed to extract instead of a line per occurrence
+    failures.log_summary()
+    listener.stop()
+
+    # A partial day must not look like a finished scrape to the pipeline, which would skip it from then on.
+    # What was fetched stays in the journal and the next run picks up from there.
+    incomplete = []
+    if not index_done:
+        incomplete.append(f"the result pages stopped at page {len(html_pages) + 1}")
+    if failed:
+        incomplete.append(f"{len(failed)} listing(s) could not be fetched")
+    if incomplete:
+        journal.close()
+        print(f"Scrape incomplete, {' and '.join(incomplete)}. No CSVs written, run again to resume from {journal.run_dir}.")
+    else:
+        # Convert the list of dictionaries into a DataFrame
+        df = pd.DataFrame(data, columns=['url', 'html_code'])
+
+        # Ensure the directory exists, otherwise create it
+        os.makedirs(output_dir, exist_ok=True)
+
+        # Add the date to the filename
+        output_path = os.path.join(output_dir, f'boligportal_pages_{today_date}.csv')
+
+        # Save the DataFrame to a CSV file
+        atomic_write_csv(df, output_path, index=False)
+
+        new_df = pd.DataFrame([records[result['url']] for result in data])
+
+        # Add the date to the filename
+        output_path = os.path.join(output_dir, f'bolig_data_{today_date}.csv')
+        atomic_write_csv(new_df, output_path, index=False, header=True, encoding='utf-8')
+        journal.mark_complete({'pages': len(html_pages), 'links': len(links), 'fetched': len(data),
+                               'finished_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')})
+        journal.close()
+
+        # The run is safely in the CSVs now, drop the journals of old days so data/runs doesn't grow forever
+        if run_dir is None:
+            removed = prune_runs(RUNS_DIR, keep_runs)
+            if removed:
+                print(f"Removed {len(removed)} old run journal(s): {', '.join(removed)}")
+
+    total_elapsed_time = time.time() - start_time
+    return {
+        'pages': len(html_pages),
+        'links': len(links),
+        'fetched': len(data),
+        'failed': len(failed),
+        'complete': not incomplete,
+        'seconds': total_elapsed_time,
+        'listings_per_second': len(data) / total_elapsed_time if total_elapsed_time else 0,
+        'fetch_p50_seconds': float(np.percentile(fetch_seconds, 50)) if fetch_seconds else None,
+        'fetch_p95_seconds': float(np.percentile(fetch_seconds, 95)) if fetch_seconds else None,
+        'fetch_p99_seconds': float(np.percentile(fetch_seconds, 99)) if fetch_seconds else None,
+        'field_failures': failures.counts,
+    }
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Scrape apartment listings from boligportal.dk')
+    parser.add_argument('--host', default=BASE_HOST, help='Site to scrape, e.g. http://127.0.0.1:8765 for the local stub server')
+    parser.add_argument('--output-dir', default='data/raw')
+    parser.add_argument('--run-dir', help='Journal of the run to resume, defaults to data/runs/<date>')
+    parser.add_argument('--date', help='Date (YYYY-MM-DD) the outputs are named after, defaults to today')
+    parser.add_argument('--keep-runs', type=int, default=KEEP_RUNS, help='Daily run journals to keep in data/runs')
+    args = parser.parse_args()
+    stats = main(args.host, args.output_dir, args.run_dir, args.date, args.keep_runs)
+    if not stats['complete']:
+        raise SystemExit(1)
\ No newline at end of file
@@ -0,0 +1,154 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from scrape_boligportal import PAGE_SIZE
+from synthetic_data import BASE_PATH, FIRST_LISTING_ID, generate_raw_frame, render_index_html, render_listing_html
+
+LISTING_ID_PATTERN = re.compile(r'-id-(\d+)$')
+
+
+class StubState:
+    # Everything the request handler needs, shared by all handler threads
+    def __init__(self, listings=1000, latency_ms=50, jitter_ms=20, error_rate=0.0, throttle_rate=0.0,
+                 rate_limit=None, retry_after=1, seed=0):
+        self.listings = generate_raw_frame(listings, seed).set_index('Sagsnr.', drop=False)
+        self.paths = [url.replace('https://www.boligportal.dk', '') for url in self.listings['url']]
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.window_start = time.monotonic()
+        self.window_count = 0
+        self.html_cache = {}
+        self.counts = {'index': 0, 'listing': 0, 'not_found': 0, 'errors': 0, 'throttled': 0}
+
+    def count(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+    def over_rate_limit(self):
+        # Fixed one second window, like most simple API throttles
+        if not self.rate_limit:
+            return False
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_start >= 1:
+                self.window_start = now
+                self.window_count = 0
+            self.window_count += 1
+            return self.window_count > self.rate_limit
+
+    def index_page(self, offset, path=BASE_PATH):
+        # The default search returns every listing. Any other search path returns its own window of half the
+        # listings, so different searches overlap like categories and municipalities do on the real site.
+        if path == BASE_PATH:
+            links = self.paths[offset:offset + PAGE_SIZE]
+        else:
+            size = len(self.paths) // 2
+            start = zlib.crc32(path.encode('utf-8')) % len(self.paths)
+            links = [self.paths[(start + i) % len(self.paths)] for i in range(offset, min(offset + PAGE_SIZE, size))]
+        return render_index_html(links, last_page=not links)
+
+    def listing_page(self, listing_id):
+        if listing_id not in self.html_cache:
+            self.html_cache[listing_id] = render_listing_html(self.listings.loc[listing_id])
+        return self.html_cache[listing_id]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    state = None
+
+    def do_GET(self):
+        state = self.state
+        delay = max(0.0, state.random.gauss(state.latency_ms, state.jitter_ms)) / 1000
+        time.sleep(delay)
+
+        parts = urlsplit(self.path)
+        if parts.path == '/__stats':
+            return self.respond(200, json.dumps(state.counts), 'application/json')
+
+        if state.over_rate_limit() or state.random.random() < state.throttle_rate:
+            state.count('throttled')
+            return self.respond(429, 'Too Many Requests', headers={'Retry-After': str(state.retry_after)})
+        if state.random.random() < state.error_rate:
+            state.count('errors')
+            return self.respond(500, 'Internal Server Error')
+
+        match = LISTING_ID_PATTERN.search(parts.path)
+        if match and int(match.group(1)) in state.listings.index:
+            state.count('listing')
+            return self.respond(200, state.listing_page(int(match.group(1))))
+
+        if parts.path.endswith('/'):
+            state.count('index')
+            offset = int(parse_qs(parts.query).get('offset', ['0'])[0])
+            return self.respond(200, state.index_page(offset, parts.path))
+
+        state.count('not_found')
+        self.respond(404, 'Not Found')
+
+    def respond(self, status, body, content_type='text/html; charset=utf-8', headers=None):
+        payload = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        # Keep the console quiet under load
+        pass
+
+
+def start_stub_server(host='127.0.0.1', port=0, **options):
+    # Starts the server in a background thread and returns (server, base url)
+    handler = type('BoundStubHandler', (StubHandler,), {'state': StubState(**options)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://{host}:{server.server_address[1]}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for boligportal.dk to load-test the scraper')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--listings', type=int, default=1000, help=f'Number of listings, {PAGE_SIZE} per index page')
+    parser.add_argument('--latency-ms', type=float, default=50, help='Mean response latency')
+    parser.add_argument('--jitter-ms', type=float, default=20, help='Standard deviation of the latency')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 500')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Fraction of requests answered with 429')
+    parser.add_argument('--rate-limit', type=int, help='Requests per second before answering 429')
+    parser.add_argument('--retry-after', type=int, default=1, help='Retry-After seconds sent with 429')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    server, url = start_stub_server(
+        args.host, args.port, listings=args.listings, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate, throttle_rate=args.throttle_rate, rate_limit=args.rate_limit,
+        retry_after=args.retry_after, seed=args.seed,
+    )
+    print(f"Serving {args.listings} listings on {url} (first listing id {FIRST_LISTING_ID}). Stats on {url}/__stats")
+    print(f"Point the scraper at it with: python src/scrape_boligportal.py --host {url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
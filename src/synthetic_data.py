@@ -0,0 +1,216 @@
+import numpy as np
+import pandas as pd
+
+# Synthetic boligportal data for benchmarks and the local stub server. Distributions are rough fits of
+# data/latest/preprocessed_data_latest.csv; the markup mirrors what extract_apartment_info expects.
+
+# (area, postcode, relative weight, price level vs. the median area)
+AREAS = [
+    ('København S', '2300', 301, 1.05),
+    ('København V', '1799', 112, 1.15),
+    ('København K', '1150', 105, 1.35),
+    ('Valby', '2500', 103, 0.95),
+    ('København SV', '2450', 87, 1.10),
+    ('København Ø', '2100', 81, 1.25),
+    ('København NV', '2400', 79, 0.95),
+    ('Brønshøj', '2700', 60, 0.90),
+    ('Hedehusene', '2640', 59, 0.75),
+    ('Frederiksberg', '2000', 57, 1.20),
+    ('Brøndby', '2605', 53, 0.80),
+    ('Rødovre', '2610', 49, 0.85),
+    ('Herlev', '2730', 47, 0.85),
+    ('Søborg', '2860', 47, 0.90),
+    ('Glostrup', '2600', 44, 0.85),
+    ('Ballerup', '2750', 44, 0.80),
+    ('Albertslund', '2620', 38, 0.75),
+    ('Vallensbæk Strand', '2665', 38, 0.85),
+    ('Hellerup', '2900', 38, 1.30),
+    ('København N', '2200', 35, 1.15),
+]
+STREETS = ['Georg Marshalls Vej', 'Orla Lehmanns Vej', 'Ægirsgade', 'Lundtoftegade', 'Granskoven',
+           'Amagerbrogade', 'Vesterbrogade', 'Nørrebrogade', 'Østerbrogade', 'Valby Langgade']
+FLOORS = ['Stuen', '1.', '2.', '3.', '4.', '5.', 'Kælder', '-']
+ENERGY_MARKS = ['A20', 'A15', 'A10', 'B', 'C', 'D', 'E', 'F', 'G', None]
+ENERGY_MARK_WEIGHTS = [207, 355, 84, 61, 163, 93, 17, 3, 1, 714]
+DANISH_MONTHS = ['januar', 'februar', 'marts', 'april', 'maj', 'juni', 'juli', 'august',
+                 'september', 'oktober', 'november', 'december']
+YES_NO_FIELDS = ['Delevenlig', 'Husdyr tilladt', 'Elevator', 'Seniorvenlig', 'Kun for studerende',
+                 'Altan/terrasse', 'Parkering', 'Opvaskemaskine', 'Vaskemaskine', 'Ladestander', 'Tørretumbler']
+RENTAL_PERIODS = ['Ubegrænset', '24+ måneder', '12-23 måneder', '1-11 måneder']
+
+BASE_PATH = '/lejligheder/k%C3%B8benhavn/'
+FIRST_LISTING_ID = 5000000
+
+
+def format_kr(value):
+    # 13500 -> '13.500 kr.'
+    return f"{int(value):,}".replace(',', '.') + ' kr.'
+
+
+def _draw_columns(n, seed, scrape_date):
+    # Vectorised draw of every listing attribute, shared by the raw, processed and HTML generators
+    rng = np.random.default_rng(seed)
+    weights = np.array([a[2] for a in AREAS], dtype=float)
+    area_idx = rng.choice(len(AREAS), size=n, p=weights / weights.sum())
+    rooms = rng.choice([1, 2, 3, 4, 5, 6], size=n, p=[0.24, 0.21, 0.31, 0.19, 0.04, 0.01])
+    size_sqm = np.clip(rng.normal(22 + rooms * 24, 12), 15, 360).round()
+    level = np.array([a[3] for a in AREAS])[area_idx]
+    monthly_rent = (np.exp(rng.normal(0, 0.15, n)) * level * (2500 + 150 * size_sqm)).round(-2)
+    monthly_aconto = rng.choice([0, 350, 500, 585, 700, 850, 1000, 1150, 1500], size=n)
+    deposit = monthly_rent * rng.choice([1, 2, 3], size=n, p=[0.2, 0.3, 0.5])
+    prepaid_rent = np.where(rng.random(n) < 0.3, 0, monthly_rent * rng.choice([1, 2, 3], size=n))
+    days_on_website = rng.geometric(0.08, size=n) - 1
+    creation_date = pd.Timestamp(scrape_date) - pd.to_timedelta(days_on_website, unit='D')
+    available_in_days = rng.integers(0, 120, size=n)
+    available_from = creation_date + pd.to_timedelta(available_in_days, unit='D')
+    energy_weights = np.array(ENERGY_MARK_WEIGHTS, dtype=float)
+    energy_idx = rng.choice(len(ENERGY_MARKS), size=n, p=energy_weights / energy_weights.sum())
+
+    return {
+        'listing_id': FIRST_LISTING_ID + np.arange(n),
+        'area_idx': area_idx,
+        'street_idx': rng.integers(0, len(STREETS), size=n),
+        'floor_idx': rng.choice(len(FLOORS), size=n, p=[0.25, 0.2, 0.2, 0.15, 0.1, 0.05, 0.02, 0.03]),
+        'rooms': rooms,
+        'size_sqm': size_sqm,
+        'monthly_rent': monthly_rent,
+        'monthly_aconto': monthly_aconto,
+        'deposit': deposit,
+        'prepaid_rent': prepaid_rent,
+        'creation_date': creation_date,
+        'available_from': available_from,
+        'available_asap': rng.random(n) < 0.25,
+        'days_on_website': days_on_website,
+        'furnished': rng.random(n) < 0.18,
+        'yes_no': rng.random((n, len(YES_NO_FIELDS))) < 0.3,
+        'rental_period_idx': rng.integers(0, len(RENTAL_PERIODS), size=n),
+        'energy_idx': energy_idx,
+        'hours_ago': rng.integers(1, 23, size=n),
+    }
+
+
+def listing_paths(columns):
+    ids = pd.Series(columns['listing_id']).astype(str)
+    sizes = pd.Series(columns['size_sqm']).astype(int).astype(str)
+    rooms = pd.Series(columns['rooms']).astype(str)
+    return BASE_PATH + sizes + 'm2-' + rooms + '-vaer-id-' + ids
+
+
+def generate_raw_frame(n, seed=0, scrape_date='2025-06-26'):
+    # Rows shaped like the output of extract_apartment_info, i.e. data/raw/bolig_data_<date>.csv
+    c = _draw_columns(n, seed, scrape_date)
+    areas = np.array([a[0] for a in AREAS], dtype=object)[c['area_idx']]
+    postcodes = np.array([a[1] for a in AREAS], dtype=object)[c['area_idx']]
+    floors = np.array(FLOORS, dtype=object)[c['floor_idx']]
+    streets = np.array(STREETS, dtype=object)[c['street_idx']]
+    rooms = pd.Series(c['rooms']).astype(str)
+
+    rent = pd.Series(c['monthly_rent']).map(format_kr)
+    aconto = pd.Series(c['monthly_aconto']).map(format_kr)
+    move_in = pd.Series(c['monthly_rent'] + c['monthly_aconto'] + c['deposit'] + c['prepaid_rent']).map(format_kr)
+    available = (pd.Series(c['available_from'].day).astype(str) + '. ' +
+                 pd.Series(np.array(DANISH_MONTHS, dtype=object)[c['available_from'].month - 1]) + ' ' +
+                 pd.Series(c['available_from'].year).astype(str))
+    available = available.where(~c['available_asap'], 'Snarest muligt')
+    breadcrumb = 'Hjem > Lejligheder > København > ' + rooms + ' værelses > ' + areas
+    energy = np.array(ENERGY_MARKS, dtype=object)[c['energy_idx']]
+    energy_src = pd.Series(energy).map(lambda mark: f'/static/images/energy_labels/{mark}_str2.png' if mark else None)
+    rental_period = pd.Series(np.array(RENTAL_PERIODS, dtype=object)[c['rental_period_idx']])
+
+    df = pd.DataFrame({
+        'url': 'https://www.boligportal.dk' + listing_paths(c),
+        'breadcrumb': breadcrumb + ' > ' + breadcrumb,
+        'title': rooms + '-værelses lejlighed i ' + areas,
+        'description': 'Lys og rummelig lejlighed med ' + rooms + ' værelser, tæt på offentlig transport og indkøb.',
+        'address': (pd.Series(c['hours_ago']).astype(str) + ' timer siden, ' + streets + ', ' + postcodes +
+                    ' København, ' + areas + '  - ' + np.where(floors == 'Stuen', 'Stuen', floors + ' sal')),
+        'monthly_rent': rent,
+        'monthly_aconto': aconto,
+        'move_in_price': move_in,
+        'available_from': available,
+        'rental_period': rental_period,
+        'Boligtype': 'Lejlighed',
+        'Størrelse': pd.Series(c['size_sqm']).astype(int).astype(str) + ' m²',
+        'Værelser': c['rooms'],
+        'Etage': floors,
+        'Møbleret': np.where(c['furnished'], 'Ja', 'Nej'),
+    })
+    for i, field in enumerate(YES_NO_FIELDS):
+        df[field] = np.where(c['yes_no'][:, i], 'Ja', 'Nej')
+    df['Lejeperiode'] = rental_period
+    df['Ledig fra'] = available
+    df['Månedlig leje'] = rent
+    df['Aconto'] = aconto
+    df['Depositum'] = pd.Series(c['deposit']).map(format_kr)
+    df['Forudbetalt husleje'] = pd.Series(c['prepaid_rent']).map(lambda v: format_kr(v) if v else None)
+    df['Indflytningspris'] = move_in
+    df['Oprettelsesdato'] = c['creation_date'].strftime('%d.%m.%Y')
+    df['Sagsnr.'] = c['listing_id']
+    df['Energimærke'] = '-'
+    df['energy_mark_src'] = energy_src
+    return df
+
+
+def generate_processed_frame(n, seed=0, scrape_date='2025-06-26'):
+    # Rows shaped like data/processed/preprocessed_data_<date>.csv, only the columns the app and API use,
+    # built with column operations only so 10M rows stay feasible
+    c = _draw_columns(n, seed, scrape_date)
+    days = c['days_on_website'].astype(float)
+    return pd.DataFrame({
+        'url': 'https://www.boligportal.dk' + listing_paths(c),
+        'monthly_rent': c['monthly_rent'],
+        'monthly_aconto': c['monthly_aconto'].astype(float),
+        'available_from': c['available_from'].where(~c['available_asap'], pd.Timestamp(scrape_date)),
+        'size_sqm': c['size_sqm'],
+        'rooms': c['rooms'],
+        'floor': np.array([0, 1, 2, 3, 4, 5, -1, 0])[c['floor_idx']],
+        'furnished': pd.Categorical(np.where(c['furnished'], 'Yes', 'No')),
+        'deposit': c['deposit'],
+        'prepaid_rent': c['prepaid_rent'],
+        'creation_date': c['creation_date'],
+        'case_number': c['listing_id'],
+        'energy_mark': pd.Categorical(np.array(ENERGY_MARKS, dtype=object)[c['energy_idx']]),
+        'area': pd.Categorical.from_codes(c['area_idx'], [a[0] for a in AREAS]),
+        'days_on_website': days,
+        'total_monthly_rent': c['monthly_rent'] + c['monthly_aconto'],
+    })
+
+
+def render_listing_html(row):
+    # Markup for a single listing page, using the css classes extract_apartment_info looks for
+    crumbs = ''.join(f'<a href="#">{part}</a>' for part in row['breadcrumb'].split(' > ')[:5])
+    details = {key: row[key] for key in ['Boligtype', 'Størrelse', 'Værelser', 'Etage', 'Møbleret'] + YES_NO_FIELDS +
+               ['Lejeperiode', 'Ledig fra', 'Månedlig leje', 'Aconto', 'Depositum', 'Forudbetalt husleje',
+                'Indflytningspris', 'Oprettelsesdato', 'Sagsnr.', 'Energimærke']}
+    detail_items = ''.join(
+        f'<div class="css-1n6wxiw"><span class="css-1td16zm">{key}</span><span class="css-1f8murc">{value}</span></div>'
+        for key, value in details.items() if value is not None and value == value
+    )
+    street, area = row['address'].rsplit(', ', 1)
+    energy = f'<img class="css-rdsunt" src="{row["energy_mark_src"]}"/>' if row['energy_mark_src'] else ''
+    return (
+        '<html><body>'
+        f'<nav class="css-7kp13n">{crumbs}</nav>'
+        f'<h3 class="css-1o5zkyw">{row["title"]}</h3>'
+        f'<div class="css-o9y6d5">{street}</div><div class="css-o9y6d5">{area}</div>'
+        f'<div class="css-woykcw"><span class="css-1fhvb05">{row["monthly_rent"][:-4]}</span></div>'
+        f'<div class="css-30nv8k">{row["monthly_aconto"]}</div>'
+        f'<div class="css-30nv8k">{row["rental_period"]}</div>'
+        f'<div class="css-2kngtw">{row["available_from"]}</div>'
+        f'<div class="css-1f7mpex">{row["description"]}</div>'
+        f'{detail_items}{energy}'
+        '</body></html>'
+    )
+
+
+def generate_listing_pages(n, seed=0, scrape_date='2025-06-26'):
+    # [(url, html)] for n listings
+    df = generate_raw_frame(n, seed, scrape_date)
+    return [(row['url'], render_listing_html(row)) for row in df.to_dict('records')]
+
+
+def render_index_html(links, last_page=False):
+    # Search result page: one css-krvsu4 div per listing, the css-16snok8 element marks the end of the results
+    cards = ''.join(f'<div class="css-krvsu4"><a href="{link}">Lejlighed</a></div>' for link in links)
+    terminator = '<div class="css-16snok8">Ingen flere resultater</div>' if last_page else ''
+    return f'<html><body>{cards}{terminator}</body></html>'
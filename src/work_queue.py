@@ -0,0 +1,226 @@
+import json
+import socket
+import sqlite3
+import time
+
+import requests
+
+# Durable work queue with time-limited leases, backed by a single SQLite file. Every worker process opens the
+# same file; a claimed item is invisible to others until its lease expires, so a crashed worker's items are
+# picked up again automatically.
+#
+# Single host only: WAL mode needs shared memory between the processes, and SQLite's locking is unreliable on
+# network filesystems (NFS, SMB), so a queue on a shared disk could hand one item to two workers or get corrupted.
+# The queue records the host that created it and refuses to open anywhere else. Workers on other hosts go through
+# queue_server.py on the queue's host instead, with RemoteWorkQueue as the client.
+
+QUEUE_PATH = 'data/queue/crawl.db'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY,
+    run TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    payload TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    lease_owner TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    updated REAL,
+    UNIQUE (run, kind, key)
+);
+CREATE INDEX IF NOT EXISTS items_claim ON items (run, status, priority, id);
+CREATE TABLE IF NOT EXISTS rate_limits (
+    name TEXT PRIMARY KEY,
+    next_slot REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+# Seconds a client waits for the queue service to answer one call
+REMOTE_TIMEOUT = 30
+
+
+class WorkQueue:
+    def __init__(self, path=QUEUE_PATH, timeout=30, check_same_thread=True):
+        self.conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=check_same_thread)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        host = socket.gethostname()
+        with self._transaction():
+            self.conn.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('host', ?)", (host,))
+            owner_host = self.conn.execute("SELECT value FROM meta WHERE name = 'host'").fetchone()[0]
+        if owner_host != host:
+            self.conn.close()
+            raise RuntimeError(f"{path} belongs to host {owner_host}, the queue can only be shared by processes on one host. "
+                               f"Run queue_server.py on {owner_host} and pass --queue http://{owner_host}:<port> instead")
+
+    def close(self):
+        self.conn.close()
+
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front so two workers can never claim the same item
+        return _Transaction(self.conn)
+
+    def enqueue_many(self, run, kind, items, priority=0):
+        # items: [(key, payload)], duplicates of an existing (run, kind, key) are ignored
+        now = time.time()
+        with self._transaction():
+            self.conn.executemany(
+                'INSERT OR IGNORE INTO items (run, kind, key, priority, payload, updated) VALUES (?, ?, ?, ?, ?, ?)',
+                [(run, kind, key, priority, json.dumps(payload), now) for key, payload in items],
+            )
+
+    def claim(self, run, owner, lease_seconds, max_attempts, limit=1):
+        # Lower priority values are handed out first
+        now = time.time()
+        with self._transaction():
+            # An item whose lease keeps expiring probably kills its worker, stop handing it out
+            self.conn.execute(
+                "UPDATE items SET status = 'failed', error = 'lease expired ' || attempts || ' time(s)', "
+                "lease_owner = NULL, lease_expires = NULL, updated = ? "
+                "WHERE run = ? AND status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (now, run, now, max_attempts),
+            )
+            rows = self.conn.execute(
+                """SELECT id, kind, key, payload, attempts FROM items
+                   WHERE run = ? AND (status = 'pending' OR (status = 'leased' AND lease_expires < ?))
+                   ORDER BY priority, id LIMIT ?""",
+                (run, now, limit),
+            ).fetchall()
+            self.conn.executemany(
+                "UPDATE items SET status = 'leased', lease_owner = ?, lease_expires = ?, attempts = attempts + 1, updated = ? WHERE id = ?",
+                [(owner, now + lease_seconds, now, row[0]) for row in rows],
+            )
+        return [{'id': row[0], 'kind': row[1], 'key': row[2], 'payload': json.loads(row[3]), 'attempts': row[4] + 1}
+                for row in rows]
+
+    def complete(self, item_id, owner, result=None):
+        # Returns False when the lease was lost in the meantime, the result is then dropped
+        with self._transaction():
+            cursor = self.conn.execute(
+                "UPDATE items SET status = 'done', result = ?, lease_owner = NULL, lease_expires = NULL, updated = ? "
+                "WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+                (json.dumps(result), time.time(), item_id, owner),
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, item_id, owner, error, max_attempts):
+        # Give the item back for a retry, or park it as failed once it ran out of attempts
+        with self._transaction():
+            self.conn.execute(
+                "UPDATE items SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "error = ?, lease_owner = NULL, lease_expires = NULL, updated = ? "
+                "WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+                (max_attempts, error, time.time(), item_id, owner),
+            )
+
+    def counts(self, run):
+        rows = self.conn.execute('SELECT kind, status, COUNT(*) FROM items WHERE run = ? GROUP BY kind, status', (run,))
+        counts = {}
+        for kind, status, count in rows:
+            counts.setdefault(kind, {})[status] = count
+        return counts
+
+    def is_drained(self, run):
+        # Nothing left to claim now or later (leased items may still come back if their worker dies)
+        row = self.conn.execute("SELECT COUNT(*) FROM items WHERE run = ? AND status IN ('pending', 'leased')", (run,)).fetchone()
+        return row[0] == 0
+
+    def results(self, run, kind):
+        rows = self.conn.execute("SELECT key, payload, result FROM items WHERE run = ? AND kind = ? AND status = 'done' ORDER BY id", (run, kind))
+        return [(key, json.loads(payload), json.loads(result)) for key, payload, result in rows]
+
+    def reserve_rate_slot(self, name, rate):
+        # Global rate limit shared by every worker process: reserves the next free slot and returns the seconds
+        # until it starts
+        if not rate:
+            return 0.0
+        now = time.time()
+        with self._transaction():
+            row = self.conn.execute('SELECT next_slot FROM rate_limits WHERE name = ?', (name,)).fetchone()
+            slot = max(now, row[0]) if row else now
+            self.conn.execute('INSERT OR REPLACE INTO rate_limits (name, next_slot) VALUES (?, ?)', (name, slot + 1.0 / rate))
+        return slot - now
+
+    def acquire_rate_slot(self, name, rate):
+        wait = self.reserve_rate_slot(name, rate)
+        if wait > 0:
+            time.sleep(wait)
+
+
+class RemoteWorkQueue:
+    # Same calls as WorkQueue, answered by a queue_server.py over HTTP, so workers on any host can share one queue.
+    # The service applies every call in its own transaction, claims stay exclusive.
+    def __init__(self, url, timeout=REMOTE_TIMEOUT):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def close(self):
+        self.session.close()
+
+    def _call(self, method, **kwargs):
+        response = self.session.post(f'{self.url}/{method}', json=kwargs, timeout=self.timeout)
+        body = response.json()
+        if response.status_code != 200:
+            raise RuntimeError(f"Queue service {self.url} failed {method}: {body.get('error')}")
+        return body['result']
+
+    def enqueue_many(self, run, kind, items, priority=0):
+        self._call('enqueue_many', run=run, kind=kind, items=[list(item) for item in items], priority=priority)
+
+    def claim(self, run, owner, lease_seconds, max_attempts, limit=1):
+        return self._call('claim', run=run, owner=owner, lease_seconds=lease_seconds, max_attempts=max_attempts, limit=limit)
+
+    def complete(self, item_id, owner, result=None):
+        return self._call('complete', item_id=item_id, owner=owner, result=result)
+
+    def fail(self, item_id, owner, error, max_attempts):
+        self._call('fail', item_id=item_id, owner=owner, error=error, max_attempts=max_attempts)
+
+    def counts(self, run):
+        return self._call('counts', run=run)
+
+    def is_drained(self, run):
+        return self._call('is_drained', run=run)
+
+    def results(self, run, kind):
+        return [tuple(row) for row in self._call('results', run=run, kind=kind)]
+
+    def reserve_rate_slot(self, name, rate):
+        return self._call('reserve_rate_slot', name=name, rate=rate)
+
+    def acquire_rate_slot(self, name, rate):
+        # The service only hands out the slot, the wait happens here so it doesn't hold a service thread
+        wait = self.reserve_rate_slot(name, rate)
+        if wait > 0:
+            time.sleep(wait)
+
+
+def open_queue(location=QUEUE_PATH):
+    # A queue_server.py URL, or the path of a queue file on this host
+    if location.startswith(('http://', 'https://')):
+        return RemoteWorkQueue(location)
+    return WorkQueue(location)
+
+
+class _Transaction:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+        return False
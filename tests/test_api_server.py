@@ -0,0 +1,89 @@
+import io
+import json
+
+import pandas as pd
+import pytest
+
+from api_server import ApiError, ListingApi
+from filters import MAX_PRICE, add_derived_columns
+from synthetic_data import generate_processed_frame
+
+
+class FakeStore:
+    def __init__(self, version='v1', rows=500):
+        self.set(version, rows)
+
+    def set(self, version, rows=500):
+        # Through a CSV, like a published version
+        csv = generate_processed_frame(rows, seed=1).to_csv(index=False)
+        self.dataset = ({'version': version}, add_derived_columns(pd.read_csv(io.StringIO(csv))))
+
+    def get(self):
+        return self.dataset
+
+
+@pytest.fixture
+def api():
+    return ListingApi(store=FakeStore())
+
+
+def query(api, q, if_none_match=None):
+    etag, body = api.listings(q, if_none_match)
+    return etag, (json.loads(body) if body is not None else None)
+
+
+def test_max_price_at_slider_max_is_enforced(api):
+    # On the slider 45000 means "no maximum", through the API it is a real bound
+    api.store.dataset[1].loc[0, 'total_rental_price'] = 2680180
+    _, page = query(api, f'max_price={MAX_PRICE}&sort=-total_rental_price&limit=1')
+    _, everything = query(api, 'limit=1')
+    assert page['items'][0]['total_rental_price'] <= MAX_PRICE
+    assert page['total'] < everything['total']
+
+
+def test_filters_and_sort(api):
+    _, page = query(api, 'min_price=10000&max_price=15000&sort=-size_sqm&limit=500')
+    prices = [item['total_rental_price'] for item in page['items']]
+    sizes = [item['size_sqm'] for item in page['items']]
+    assert page['total'] == len(prices) > 0
+    assert all(10000 <= price <= 15000 for price in prices)
+    assert sizes == sorted(sizes, reverse=True)
+
+
+def test_cursor_pages_cover_the_result_once(api):
+    _, everything = query(api, 'max_price=20000&sort=total_rental_price&limit=500')
+    urls, cursor = [], None
+    while True:
+        _, page = query(api, 'max_price=20000&sort=total_rental_price&limit=7' + (f'&cursor={cursor}' if cursor else ''))
+        urls += [item['url'] for item in page['items']]
+        cursor = page['next_cursor']
+        if not cursor:
+            break
+    assert urls == [item['url'] for item in everything['items']]
+
+
+def test_etag_revalidation_and_parameter_order(api):
+    etag, page = query(api, 'area=Valby&max_price=15000')
+    assert page is not None
+    same_etag, not_modified = query(api, 'max_price=15000&area=Valby', if_none_match=etag)
+    assert same_etag == etag and not_modified is None
+    other_etag, _ = query(api, 'area=Valby&max_price=16000')
+    assert other_etag != etag
+
+
+def test_new_version_changes_etag_and_expires_cursors(api, monkeypatch):
+    monkeypatch.setattr('api_server.VERSION_CHECK_SECONDS', 0)
+    etag, page = query(api, 'limit=5')
+    api.store.set('v2')
+    new_etag, _ = query(api, 'limit=5')
+    assert new_etag != etag
+    with pytest.raises(ApiError) as error:
+        query(api, f"limit=5&cursor={page['next_cursor']}")
+    assert error.value.status == 410
+
+
+@pytest.mark.parametrize('q', ['colour=red', 'max_price=cheap', 'limit=0', 'sort=url'])
+def test_bad_requests(api, q):
+    with pytest.raises(ApiError) as error:
+        query(api, q)
+    assert error.value.status == 400
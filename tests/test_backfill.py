@@ -0,0 +1,77 @@
+import ast
+import glob
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+import backfill
+from backfill import PROCESSING_MODULES, code_hash
+from rent_model import MODEL_PATH, TRAIN_COLUMNS, empty_state, load_state, partial_fit, score, solve
+from synthetic_data import generate_raw_frame
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+
+def local_imports(module):
+    with open(os.path.join(SRC_DIR, module)) as file:
+        tree = ast.parse(file.read())
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ImportFrom) and node.module:
+            names.add(node.module)
+        elif isinstance(node, ast.Import):
+            names.update(alias.name for alias in node.names)
+    return {f'{name}.py' for name in names if os.path.exists(os.path.join(SRC_DIR, f'{name}.py'))}
+
+
+def test_every_module_on_the_processing_path_is_hashed():
+    reachable, todo = set(), ['preprocess_scraped_data.py']
+    while todo:
+        module = todo.pop()
+        if module not in reachable:
+            reachable.add(module)
+            todo.extend(local_imports(module))
+    assert reachable == set(PROCESSING_MODULES)
+
+
+def test_code_hash_changes_with_any_module():
+    assert code_hash() != code_hash(PROCESSING_MODULES[:-1])
+
+
+def run_backfill(monkeypatch, *args):
+    monkeypatch.setattr(sys, 'argv', ['backfill.py', *args])
+    backfill.main()
+
+
+def test_backfill_rebuilds_the_model_in_date_order_and_rescores_every_day(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for folder in ('data/raw', 'outputs/errors', 'outputs/stats'):
+        os.makedirs(folder)
+    dates = ['2025-06-01', '2025-06-02', '2025-06-03']
+    # Later days repeat the earlier listings (same case numbers) next to new ones
+    for date, n in zip(dates, (50, 80, 100)):
+        generate_raw_frame(n, seed=1, scrape_date=date).to_csv(f'data/raw/bolig_data_{date}.csv', index=False)
+    run_backfill(monkeypatch, '--start', dates[0], '--end', dates[-1], '--workers', '2')
+
+    expected = empty_state()
+    for date in dates:
+        df = pd.read_csv(f'data/processed/preprocessed_data_{date}.csv', usecols=lambda column: column in TRAIN_COLUMNS)
+        partial_fit(expected, df, date)
+    state = load_state(MODEL_PATH)
+    assert state['snapshots'] == dates
+    assert state['n_rows'] == expected['n_rows']
+    np.testing.assert_allclose(state['xtx'], expected['xtx'])
+
+    assert state['n_rows'] > 0
+    weights = solve(state)
+    for path in glob.glob('data/processed/preprocessed_data_*.csv'):
+        df = pd.read_csv(path)
+        assert df['expected_rent'].notna().any()
+        np.testing.assert_allclose(df['expected_rent'], score(df, weights).round(0))
+
+    # Nothing changed, so the second run neither reprocesses nor retrains
+    mtime = os.path.getmtime(MODEL_PATH)
+    run_backfill(monkeypatch, '--start', dates[0], '--end', dates[-1], '--workers', '2')
+    assert os.path.getmtime(MODEL_PATH) == mtime
@@ -0,0 +1,92 @@
+import time
+
+import pytest
+
+import crawl_scheduler
+from crawl_scheduler import crawl
+from stub_server import start_stub_server
+from synthetic_data import BASE_PATH
+
+# The default search returns all 40 stub listings over 3 pages, every other search its own window of 20
+TARGETS = [
+    {'name': 'all', 'path': BASE_PATH},
+    {'name': 'rooms', 'path': '/vaerelser/k%C3%B8benhavn/'},
+    {'name': 'houses', 'path': '/huse/k%C3%B8benhavn/'},
+]
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(**options):
+        server, url = start_stub_server(port=0, listings=40, latency_ms=0, jitter_ms=0, **options)
+        servers.append(server)
+        return server.RequestHandlerClass.state, url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+def test_listings_found_by_several_targets_are_fetched_once(stub):
+    state, url = stub()
+    pages, listing_targets, failures = crawl(TARGETS, url, rate=0, concurrency=8)
+
+    assert len(pages) == len(listing_targets) == 40
+    assert state.counts['listing'] == 40
+    assert sum(len(names) for names in listing_targets.values()) == 80
+    assert all(len(names) == len(set(names)) for names in listing_targets.values())
+    assert failures == {target['name']: {'index': 0, 'listing': 0} for target in TARGETS}
+
+
+def test_targets_are_paged_round_robin(stub, monkeypatch):
+    _, url = stub()
+    index_pages = []
+
+    def fetch(limiter, page):
+        if '?offset=' in page:
+            index_pages.append(next(target['name'] for target in TARGETS if page.startswith(url + target['path'] + '?')))
+        return original(limiter, page)
+
+    original = crawl_scheduler.fetch
+    monkeypatch.setattr(crawl_scheduler, 'fetch', fetch)
+    crawl(TARGETS, url, rate=0, concurrency=1)
+
+    # Each target's index pages, including the one that ends it: 3 + 1 for all, 2 + 1 for the others
+    assert index_pages == ['all', 'rooms', 'houses'] * 3 + ['all']
+
+
+def test_shared_rate_limit_avoids_throttling(stub):
+    state, url = stub(rate_limit=30)
+    start_time = time.monotonic()
+    pages, _, _ = crawl(TARGETS, url, rate=25, concurrency=8)
+    elapsed = time.monotonic() - start_time
+
+    requests = sum(state.counts.values())
+    assert len(pages) == 40
+    assert state.counts['throttled'] == 0
+    assert elapsed >= (requests - 1) / 25
+
+
+def test_failures_are_counted_per_target(stub):
+    _, url = stub()
+    targets = TARGETS[:2] + [{'name': 'missing', 'path': '/lejligheder/nowhere'}]
+    pages, _, failures = crawl(targets, url, rate=0, concurrency=4)
+
+    assert len(pages) == 40
+    assert failures == {'all': {'index': 0, 'listing': 0}, 'rooms': {'index': 0, 'listing': 0},
+                        'missing': {'index': 1, 'listing': 0}}
+
+
+def test_throttled_request_is_retried_after_the_shared_back_off(stub):
+    state, url = stub(rate_limit=1, retry_after=1)
+    limiter = crawl_scheduler.RateLimiter(0)
+    assert crawl_scheduler.fetch(limiter, f'{url}{BASE_PATH}')[1] is None
+
+    # Over the limit: the 429 holds back every thread for Retry-After, then the retry goes through
+    start_time = time.monotonic()
+    html, error = crawl_scheduler.fetch(limiter, f'{url}{BASE_PATH}')
+    assert html is not None and error is None
+    assert state.counts['throttled'] == 1
+    assert time.monotonic() - start_time >= 1
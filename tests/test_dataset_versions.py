@@ -0,0 +1,160 @@
+import io
+import os
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+import dataset_versions
+from dataset_versions import DatasetStore, load_version, publish_dataset, read_manifest
+from synthetic_data import generate_processed_frame
+from text_store import read_listing_texts
+
+
+class Clock(datetime):
+    # A second later on every call, versions are named by the second
+    now_value = datetime(2025, 6, 1, 8, 0, 0)
+
+    @classmethod
+    def now(cls, tz=None):
+        cls.now_value += timedelta(seconds=1)
+        return cls.now_value
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    monkeypatch.setattr(dataset_versions, 'datetime', Clock)
+
+
+def frame(seed, rows=50):
+    df = generate_processed_frame(rows, seed=seed)
+    df['title'] = [f'Lejlighed {seed}-{i}' for i in range(rows)]
+    df['description'] = [f'Lys lejlighed nummer {i} med altan' for i in range(rows)]
+    df['breadcrumb'] = 'Lejligheder > København > Lejligheder > København'
+    return pd.read_csv(io.StringIO(df.to_csv(index=False)))
+
+
+def test_publish_writes_version_side_store_and_manifest(tmp_path):
+    latest = str(tmp_path)
+    df = frame(1)
+    manifest = publish_dataset(df, latest)
+
+    assert read_manifest(os.path.join(latest, 'manifest.json')) == manifest
+    assert manifest['rows'] == len(df)
+    loaded = load_version(manifest, latest)
+    assert 'description' not in loaded.columns and len(loaded) == len(df)
+    texts = read_listing_texts(os.path.join(latest, manifest['texts']), df['case_number'].iloc[0])
+    assert texts['description'] == df['description'].iloc[0]
+    assert texts['breadcrumb'] == 'Lejligheder > København'
+    assert len(pd.read_csv(os.path.join(latest, 'preprocessed_data_latest.csv')).columns) == len(df.columns)
+
+
+def test_identical_data_is_a_no_op(tmp_path):
+    latest = str(tmp_path)
+    first = publish_dataset(frame(1), latest)
+    assert publish_dataset(frame(1), latest) == first
+    assert len(os.listdir(os.path.join(latest, 'versions'))) == 2
+
+    # A text-only change is a new version
+    changed = frame(1)
+    changed.loc[0, 'description'] = 'changed'
+    assert publish_dataset(changed, latest)['version'] != first['version']
+
+
+def test_old_versions_are_pruned(tmp_path):
+    latest = str(tmp_path)
+    manifests = [publish_dataset(frame(seed), latest, keep=2) for seed in range(4)]
+    names = sorted(os.listdir(os.path.join(latest, 'versions')))
+    assert names == sorted(os.path.basename(m[key]) for m in manifests[-2:] for key in ('path', 'texts'))
+
+
+def test_unchanged_texts_share_the_side_store(tmp_path):
+    latest = str(tmp_path)
+    first = publish_dataset(frame(1), latest, keep=2)
+    # New prices every day, same texts
+    repriced = [frame(1).assign(monthly_rent=lambda df, day=day: df['monthly_rent'] + day) for day in (1, 2, 3)]
+    manifests = [publish_dataset(df, latest, keep=2) for df in repriced]
+
+    assert all(manifest['texts'] == first['texts'] for manifest in manifests)
+    names = sorted(os.listdir(os.path.join(latest, 'versions')))
+    assert names == sorted([os.path.basename(first['texts'])] + [os.path.basename(m['path']) for m in manifests[-2:]])
+    texts = read_listing_texts(os.path.join(latest, manifests[-1]['texts']), repriced[-1]['case_number'].iloc[3])
+    assert texts['title'] == 'Lejlighed 1-3'
+
+
+def test_store_refuses_a_file_that_does_not_match_the_manifest(tmp_path):
+    latest = str(tmp_path)
+    manifest = publish_dataset(frame(1), latest)
+    with open(os.path.join(latest, manifest['path']), 'a') as file:
+        file.write('half written')
+    with pytest.raises(ValueError):
+        load_version(manifest, latest)
+
+    # The store falls back to the unversioned file instead of serving nothing
+    store = DatasetStore(latest)
+    current_manifest, df = store.get()
+    assert current_manifest['path'] == 'preprocessed_data_latest.csv' and len(df) == 50
+
+
+def test_store_swaps_in_a_new_version_in_the_background(tmp_path):
+    latest = str(tmp_path)
+    first = publish_dataset(frame(1), latest)
+    store = DatasetStore(latest)
+    assert store.get()[0]['version'] == first['version']
+
+    second = publish_dataset(frame(2, rows=60), latest)
+    store.get()
+    deadline = time.time() + 10
+    while store.get()[0]['version'] != second['version'] and time.time() < deadline:
+        time.sleep(0.01)
+    manifest, df = store.get()
+    assert manifest['version'] == second['version'] and len(df) == 60
+
+
+def wait_for_load(store):
+    deadline = time.time() + 10
+    while store.loading is not None and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def test_store_returns_the_same_object_until_a_new_version(tmp_path):
+    latest = str(tmp_path)
+    publish_dataset(frame(1), latest)
+    store = DatasetStore(latest)
+    first = store.get()
+    second = store.get()
+    assert second is first and second[1] is first[1]
+
+
+def test_failed_load_keeps_the_old_version_until_the_retry(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(dataset_versions, 'time', SimpleNamespace(time=lambda: now[0]))
+    latest = str(tmp_path)
+    first = publish_dataset(frame(1), latest)
+    store = DatasetStore(latest)
+    served = store.get()
+
+    # The new version's file is still being pulled when the store first sees the manifest
+    second = publish_dataset(frame(2, rows=60), latest)
+    path = os.path.join(latest, second['path'])
+    with open(path, 'rb') as file:
+        content = file.read()
+    with open(path, 'wb') as file:
+        file.write(content[:len(content) // 2])
+    assert store.get() is served
+    wait_for_load(store)
+    assert store.get() is served and second['version'] in store.failed
+
+    # Once the pull completes, the version is only retried after RETRY_SECONDS
+    with open(path, 'wb') as file:
+        file.write(content)
+    now[0] += dataset_versions.RETRY_SECONDS - 1
+    assert store.get() is served and store.loading is None
+
+    now[0] += 2
+    store.get()
+    wait_for_load(store)
+    manifest, df = store.get()
+    assert manifest['version'] == second['version'] != first['version'] and len(df) == 60
@@ -0,0 +1,44 @@
+import logging
+from multiprocessing import Pool
+
+from log_utils import FieldFailures, init_worker_logging, start_log_listener
+
+
+def log_from_worker(message):
+    logging.error(message)
+
+
+def test_listener_collects_parent_and_worker_records_then_restores_handlers(tmp_path):
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    path = tmp_path / 'errors.log'
+
+    log_queue, listener = start_log_listener(str(path))
+    logging.error('from the parent')
+    with Pool(2, initializer=init_worker_logging, initargs=(log_queue,)) as pool:
+        pool.map(log_from_worker, ['from worker a', 'from worker b'])
+        pool.close()
+        pool.join()
+    listener.stop()
+
+    assert root.handlers == handlers and root.level == level
+    logging.error('after stop')
+    text = path.read_text()
+    for message in ('from the parent', 'from worker a', 'from worker b'):
+        assert message in text
+    assert 'after stop' not in text
+
+
+def test_merge_adds_counts_and_caps_samples():
+    first, second = FieldFailures(), FieldFailures()
+    for i in range(2):
+        first.add_page([('rooms', 'no rooms')], f'a{i}')
+    for i in range(3):
+        second.add_page([('rooms', 'other error'), ('floor', 'no floor')], f'b{i}')
+    second.add_page([], 'b3')
+
+    first.merge(second)
+    assert first.pages == 6
+    assert first.counts == {'rooms': 5, 'floor': 3}
+    assert first.samples['rooms'] == ['a0', 'a1', 'b0']
+    assert first.errors['rooms'] == 'no rooms'
@@ -0,0 +1,151 @@
+import json
+import os
+
+import pytest
+
+from pipeline import Pipeline
+from run_journal import RunJournal
+from stub_server import start_stub_server
+
+SCRAPER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src', 'scrape_boligportal.py')
+
+# A fake stage: concatenates its input files into its output and notes that it ran. Fails when the
+# first input contains "fail", sleeps when it contains "slow".
+STEP = """
+import sys, time
+name, output, inputs = sys.argv[1], sys.argv[2], sys.argv[3:]
+text = ''.join(open(path).read() for path in inputs)
+if 'fail' in text.split('|')[0]:
+    sys.exit(3)
+if 'slow' in text:
+    time.sleep(0.5)
+open('calls.log', 'a').write(name + '\\n')
+open(output, 'w').write(text + '|' + name)
+"""
+
+
+def stage(name, inputs, after=(), output=None):
+    output = output or f'{name}.out'
+    return {'name': name, 'cmd': ['step.py', name, output] + inputs, 'inputs': inputs + ['step.py'],
+            'outputs': [output], 'after': list(after)}
+
+
+# a -> b -> d, a -> c
+STAGES = [
+    stage('a', ['source.txt']),
+    stage('b', ['a.out'], after=['a']),
+    stage('c', ['a.out'], after=['a']),
+    stage('d', ['b.out'], after=['b']),
+]
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'step.py').write_text(STEP)
+    (tmp_path / 'source.txt').write_text('data')
+    return tmp_path
+
+
+def run(stages=STAGES, **kwargs):
+    record = Pipeline(stages=stages, pipeline_dir='pipeline', **kwargs).run()
+    return {name: result['status'] for name, result in record['stages'].items()}
+
+
+def calls(workdir):
+    path = workdir / 'calls.log'
+    calls = path.read_text().split() if path.exists() else []
+    path.unlink(missing_ok=True)
+    return sorted(calls)
+
+
+def test_unchanged_inputs_are_skipped(workdir):
+    assert run() == {'a': 'ran', 'b': 'ran', 'c': 'ran', 'd': 'ran'}
+    assert calls(workdir) == ['a', 'b', 'c', 'd']
+    assert run() == {'a': 'skipped', 'b': 'skipped', 'c': 'skipped', 'd': 'skipped'}
+    assert calls(workdir) == []
+
+
+def test_changed_input_reruns_the_stage_and_what_its_output_changes(workdir):
+    run()
+    calls(workdir)
+    (workdir / 'source.txt').write_text('new data')
+    assert run() == {'a': 'ran', 'b': 'ran', 'c': 'ran', 'd': 'ran'}
+
+    # Rewriting an output with the same content doesn't propagate
+    calls(workdir)
+    assert run(force=['b']) == {'a': 'skipped', 'b': 'ran', 'c': 'skipped', 'd': 'skipped'}
+
+
+def test_missing_output_reruns_the_stage(workdir):
+    run()
+    calls(workdir)
+    (workdir / 'c.out').unlink()
+    assert run()['c'] == 'ran'
+    assert calls(workdir) == ['c']
+
+
+def test_failure_blocks_only_what_comes_after_it(workdir):
+    stages = [stage('a', ['source.txt']), stage('b', ['flag.txt'], after=['a']), stage('c', ['a.out'], after=['a']),
+              stage('d', ['b.out'], after=['b'])]
+    (workdir / 'flag.txt').write_text('fail')
+    assert run(stages) == {'a': 'ran', 'b': 'failed', 'c': 'ran', 'd': 'blocked'}
+
+    # The next run picks up at the failed stage
+    calls(workdir)
+    (workdir / 'flag.txt').write_text('fixed')
+    assert run(stages) == {'a': 'skipped', 'b': 'ran', 'c': 'skipped', 'd': 'ran'}
+    assert calls(workdir) == ['b', 'd']
+
+
+def test_dry_run_marks_everything_after_a_changed_stage(workdir):
+    run()
+    calls(workdir)
+    (workdir / 'source.txt').write_text('new data')
+    assert run(dry_run=True) == {'a': 'would run', 'b': 'would run', 'c': 'would run', 'd': 'would run'}
+    assert calls(workdir) == []
+    assert run(dry_run=True, force=['b']) == {'a': 'would run', 'b': 'would run', 'c': 'would run', 'd': 'would run'}
+
+
+def test_excluded_stage_does_not_block(workdir):
+    run()
+    calls(workdir)
+    (workdir / 'a.out').write_text('edited by hand')
+    assert run(exclude=['a']) == {'a': 'excluded', 'b': 'ran', 'c': 'ran', 'd': 'ran'}
+
+
+def test_independent_stages_run_concurrently(workdir):
+    (workdir / 'source.txt').write_text('slow')
+    stages = [stage('a', ['source.txt']), stage('b', ['source.txt']), stage('c', ['source.txt'])]
+    record = Pipeline(stages=stages, pipeline_dir='pipeline').run()
+    seconds = [result['seconds'] for result in record['stages'].values()]
+    assert record['seconds'] < sum(seconds) * 0.8
+
+
+def test_date_is_passed_to_stages_and_durations_are_recorded(workdir):
+    stages = [stage('a', ['source.txt'], output='a_{date}.out')]
+    assert run(stages, date='2025-01-31') == {'a': 'ran'}
+    assert (workdir / 'a_2025-01-31.out').exists()
+    record = json.loads(next((workdir / 'pipeline').glob('run_*.json')).read_text())
+    assert record['date'] == '2025-01-31'
+    assert record['stages']['a']['seconds'] > 0
+
+
+def test_incomplete_scrape_fails_the_stage_and_is_resumed(workdir):
+    server, url = start_stub_server(port=0, listings=40, latency_ms=0, jitter_ms=0, error_rate=0.3)
+    scrape = {'name': 'scrape', 'cmd': [SCRAPER, '--host', url, '--output-dir', 'raw', '--run-dir', 'run', '--date', '{date}'],
+              'inputs': [SCRAPER], 'outputs': ['raw/bolig_data_{date}.csv'], 'after': []}
+    stages = [scrape, stage('preprocess', ['raw/bolig_data_2025-06-01.csv'], after=['scrape'])]
+    try:
+        # Some index or listing pages answer 500: no CSV, and nothing after the scrape runs
+        assert run(stages, date='2025-06-01') == {'scrape': 'failed', 'preprocess': 'blocked'}
+        assert not (workdir / 'raw').exists()
+        assert len(RunJournal('run').read('pages')) < 40
+
+        # The site recovers, the next run resumes the journal and finishes the day
+        server.RequestHandlerClass.state.error_rate = 0.0
+        assert run(stages, date='2025-06-01') == {'scrape': 'ran', 'preprocess': 'ran'}
+        assert (workdir / 'raw' / 'bolig_data_2025-06-01.csv').read_text().count('-id-') == 40
+        assert run(stages, date='2025-06-01') == {'scrape': 'skipped', 'preprocess': 'skipped'}
+    finally:
+        server.shutdown()
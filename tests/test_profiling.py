@@ -0,0 +1,41 @@
+import tracemalloc
+
+import profiling
+from profiling import RerunProfiler
+
+
+def test_tracing_runs_only_during_a_profiled_rerun():
+    plain = RerunProfiler()
+    assert not tracemalloc.is_tracing()
+    plain.finish()
+
+    profiled = RerunProfiler(panel=True)
+    assert tracemalloc.is_tracing()
+    data = [0] * 100000
+    profiled.lap('work')
+    record = profiled.finish()
+    assert not tracemalloc.is_tracing()
+    assert record['phases'][0]['peak_mb'] > 0
+    assert 'memory' not in record
+    del data
+
+
+def test_overlapping_reruns_report_no_memory():
+    profiled = RerunProfiler(panel=True)
+    other = RerunProfiler()
+    profiled.lap('work')
+    other.finish()
+    record = profiled.finish()
+    assert 'peak_mb' not in record['phases'][0]
+    assert record['memory'].startswith('not measured')
+    assert not tracemalloc.is_tracing()
+
+
+def test_stale_rerun_stops_counting(monkeypatch):
+    abandoned = RerunProfiler(panel=True)
+    monkeypatch.setattr(profiling, 'STALE_SECONDS', -1)
+    plain = RerunProfiler()
+    assert not plain.overlapped
+    assert not tracemalloc.is_tracing()
+    plain.finish()
+    abandoned.finish()
@@ -0,0 +1,71 @@
+import threading
+import time
+
+import pytest
+
+from queue_server import start_queue_server
+from work_queue import RemoteWorkQueue
+
+
+@pytest.fixture
+def server_url(tmp_path):
+    server, url = start_queue_server(str(tmp_path / 'crawl.db'))
+    yield url
+    server.shutdown()
+    server.RequestHandlerClass.service.close()
+
+
+def test_two_clients_never_claim_the_same_item(server_url):
+    # The clients only share the service, not the queue file
+    seeder = RemoteWorkQueue(server_url)
+    seeder.enqueue_many('run', 'listing', [(str(i), {'link': str(i)}) for i in range(200)])
+    claimed = {}
+
+    def drain(owner):
+        client = RemoteWorkQueue(server_url)
+        claimed[owner] = []
+        while True:
+            items = client.claim('run', owner, lease_seconds=60, max_attempts=3, limit=3)
+            if not items:
+                break
+            for item in items:
+                claimed[owner].append(item['key'])
+                assert client.complete(item['id'], owner, {'owner': owner})
+        client.close()
+
+    threads = [threading.Thread(target=drain, args=(owner,)) for owner in ('host-a', 'host-b')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    keys = claimed['host-a'] + claimed['host-b']
+    assert sorted(keys, key=int) == [str(i) for i in range(200)]
+    assert claimed['host-a'] and claimed['host-b']
+    assert seeder.is_drained('run')
+    assert seeder.counts('run') == {'listing': {'done': 200}}
+    assert {result['owner'] for _, _, result in seeder.results('run', 'listing')} == {'host-a', 'host-b'}
+
+
+def test_clients_share_the_rate_limit_and_lost_leases(server_url):
+    first, second = RemoteWorkQueue(server_url), RemoteWorkQueue(server_url)
+    waits = [client.reserve_rate_slot('stub', 10) for client in (first, second, first, second)]
+    # Four requests at 10 per second across both clients take 0.3 seconds of slots
+    assert waits[0] == pytest.approx(0, abs=0.05)
+    assert waits[3] == pytest.approx(0.3, abs=0.05)
+
+    first.enqueue_many('run', 'listing', [('a', {})])
+    item = first.claim('run', 'w1', lease_seconds=0.01, max_attempts=3)[0]
+    time.sleep(0.02)
+    assert second.claim('run', 'w2', lease_seconds=60, max_attempts=3)[0]['id'] == item['id']
+    assert not first.complete(item['id'], 'w1')
+    second.fail(item['id'], 'w2', 'HTTP 500', max_attempts=3)
+    assert second.counts('run') == {'listing': {'pending': 1}}
+
+
+def test_bad_calls_are_reported(server_url):
+    client = RemoteWorkQueue(server_url)
+    with pytest.raises(RuntimeError, match='claim'):
+        client._call('claim', run='run')
+    with pytest.raises(RuntimeError, match='unknown method'):
+        client._call('close')
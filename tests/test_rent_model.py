@@ -0,0 +1,70 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+from rent_model import add_rent_estimates, load_state
+from synthetic_data import generate_processed_frame as synthetic_frame
+
+
+def generate_processed_frame(n, seed):
+    # Through a CSV, like preprocess reads and writes it. Every seed gets its own listings.
+    df = pd.read_csv(io.StringIO(synthetic_frame(n, seed=seed).to_csv(index=False)))
+    df['case_number'] += seed * 100000
+    return df
+
+
+def test_same_day_rerun_replaces_the_snapshot(tmp_path):
+    processed_dir = tmp_path / 'processed'
+    processed_dir.mkdir()
+    generate_processed_frame(300, seed=1).to_csv(processed_dir / 'preprocessed_data_2025-06-01.csv', index=False)
+    first_scrape = generate_processed_frame(300, seed=2)
+    re_scrape = generate_processed_frame(200, seed=3)
+
+    model = str(tmp_path / 'model.npz')
+    add_rent_estimates(first_scrape.copy(), '2025-06-02', str(processed_dir), model)
+    rescored = add_rent_estimates(re_scrape.copy(), '2025-06-02', str(processed_dir), model)
+
+    fresh_model = str(tmp_path / 'fresh.npz')
+    expected = add_rent_estimates(re_scrape.copy(), '2025-06-02', str(processed_dir), fresh_model)
+
+    state, fresh = load_state(model), load_state(fresh_model)
+    assert state['snapshots'] == ['2025-06-01', '2025-06-02']
+    assert state['n_rows'] == fresh['n_rows']
+    assert np.allclose(state['xtx'], fresh['xtx']) and np.allclose(state['xty'], fresh['xty'])
+    assert np.allclose(rescored['expected_rent'], expected['expected_rent'], equal_nan=True)
+
+
+def test_older_day_is_not_refit(tmp_path):
+    processed_dir = tmp_path / 'processed'
+    processed_dir.mkdir()
+    model = str(tmp_path / 'model.npz')
+    add_rent_estimates(generate_processed_frame(100, seed=1), '2025-06-01', str(processed_dir), model)
+    add_rent_estimates(generate_processed_frame(100, seed=2), '2025-06-02', str(processed_dir), model)
+    n_rows = load_state(model)['n_rows']
+
+    add_rent_estimates(generate_processed_frame(100, seed=3), '2025-06-01', str(processed_dir), model)
+    assert load_state(model)['n_rows'] == n_rows
+
+
+def test_listings_are_fitted_on_their_first_day_only(tmp_path):
+    processed_dir = tmp_path / 'processed'
+    processed_dir.mkdir()
+    model = str(tmp_path / 'model.npz')
+    snapshot = generate_processed_frame(300, seed=1)
+    add_rent_estimates(snapshot.copy(), '2025-06-01', str(processed_dir), model)
+    snapshot.to_csv(processed_dir / 'preprocessed_data_2025-06-01.csv', index=False)
+    before = load_state(model)
+
+    # The same listings a day later, still up and a day older, add nothing
+    snapshot['days_on_website'] += 1
+    add_rent_estimates(snapshot.copy(), '2025-06-02', str(processed_dir), model)
+    after = load_state(model)
+    assert after['snapshots'] == ['2025-06-01', '2025-06-02']
+    assert after['n_rows'] == before['n_rows']
+    assert np.array_equal(after['xtx'], before['xtx']) and np.array_equal(after['xty'], before['xty'])
+
+    # A new listing next to them is fitted, once
+    new = generate_processed_frame(1, seed=2)
+    add_rent_estimates(pd.concat([snapshot, new, new]), '2025-06-03', str(processed_dir), model)
+    assert load_state(model)['n_rows'] == before['n_rows'] + 1
@@ -0,0 +1,46 @@
+import os
+
+from run_journal import RunJournal, prune_runs
+
+
+def test_resume_reads_back_entries_and_skips_a_torn_line(tmp_path):
+    journal = RunJournal(str(tmp_path / 'run'))
+    journal.append('pages', {'url': 'a', 'html_code': '<html>å</html>'})
+    journal.append('pages', {'url': 'b', 'html_code': '<html></html>'})
+    journal.close()
+
+    # The process died halfway through writing an entry
+    with open(journal.path('pages'), 'a', encoding='utf-8') as file:
+        file.write('{"url": "c", "html_')
+
+    resumed = RunJournal(str(tmp_path / 'run'))
+    assert [entry['url'] for entry in resumed.read('pages')] == ['a', 'b']
+    resumed.append('pages', {'url': 'c', 'html_code': ''})
+    resumed.close()
+    assert [entry['url'] for entry in resumed.read('pages')] == ['a', 'b', 'c']
+    assert resumed.read('records') == []
+
+
+def test_prune_keeps_the_newest_days(tmp_path):
+    for name in ['2025-06-01', '2025-06-02', '2025-06-03', '2025-06-04', 'benchmark']:
+        RunJournal(str(tmp_path / name)).append('index', {'page': 1})
+
+    assert prune_runs(str(tmp_path), keep=2) == ['2025-06-01', '2025-06-02']
+    assert sorted(os.listdir(tmp_path)) == ['2025-06-03', '2025-06-04', 'benchmark']
+    assert prune_runs(str(tmp_path / 'missing')) == []
+
+
+def test_start_over_clears_a_finished_run(tmp_path):
+    journal = RunJournal(str(tmp_path / 'run'))
+    journal.append('pages', {'url': 'a', 'html_code': ''})
+    journal.append('failures', {'url': 'b', 'error': 'HTTP 500'})
+    assert not journal.is_complete()
+    journal.mark_complete({'fetched': 1})
+
+    resumed = RunJournal(str(tmp_path / 'run'))
+    assert resumed.is_complete()
+    resumed.start_over()
+    assert not resumed.is_complete()
+    assert resumed.read('pages') == [] and resumed.read('failures') == []
+    resumed.append('pages', {'url': 'c', 'html_code': ''})
+    assert [entry['url'] for entry in resumed.read('pages')] == ['c']
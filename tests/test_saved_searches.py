@@ -0,0 +1,61 @@
+import io
+import json
+
+import numpy as np
+import pandas as pd
+
+from benchmark_pipeline import random_filters
+from filters import MAX_PRICE, add_derived_columns, apply_filters
+from saved_searches import compile_searches, match_listings, notification
+from synthetic_data import generate_processed_frame
+
+
+def test_notification_with_missing_numbers_is_valid_json():
+    row = pd.Series({'url': '/a-id-1', 'area': 'Valby', 'total_rental_price': 12000.0, 'size_sqm': np.nan, 'rooms': np.nan})
+    line = json.dumps(notification('cheap', row, '2025-06-01 08:00:00'), allow_nan=False)
+    record = json.loads(line)
+    assert record['rooms'] is None and record['size_sqm'] is None
+    assert record['total_rental_price'] == 12000.0
+
+
+def test_notification_keeps_numbers():
+    row = pd.Series({'url': '/a-id-1', 'area': 'Valby', 'total_rental_price': 12000, 'size_sqm': 55.5, 'rooms': 2.0})
+    record = notification('cheap', row, '2025-06-01 08:00:00')
+    assert record['rooms'] == 2 and isinstance(record['rooms'], int)
+    assert record['size_sqm'] == 55.5
+
+
+def listings_with_gaps(n, seed):
+    # Processed listings as read from the CSV, with the gaps the real data has
+    df = pd.read_csv(io.StringIO(generate_processed_frame(n, seed=seed).to_csv(index=False)), parse_dates=['available_from'])
+    rng = np.random.default_rng(seed)
+    df.loc[rng.random(n) < 0.1, 'area'] = np.nan
+    df.loc[rng.random(n) < 0.05, 'rooms'] = np.nan
+    df.loc[rng.random(n) < 0.05, 'available_from'] = np.nan
+    df.loc[rng.random(n) < 0.05, 'monthly_rent'] = 2680180
+    df['price_delta_pct'] = np.where(rng.random(n) < 0.1, np.nan, rng.normal(0, 15, n))
+    return add_derived_columns(df)
+
+
+def test_matcher_agrees_with_the_sidebar_filters():
+    df = listings_with_gaps(2000, seed=1)
+    rng = np.random.default_rng(1)
+    searches = []
+    for i in range(200):
+        filters = random_filters(rng, df)
+        # The percentile depends on the whole dataset, saved searches ignore it
+        filters['selected_percentile'] = 100
+        filters['selected_underpriced_only'] = bool(rng.random() < 0.2)
+        if i % 10 == 0:
+            # A maximum at the top of the slider means no maximum
+            filters['selected_price_range_thousands'] = (5.0, MAX_PRICE / 1000)
+        searches.append({'name': f'search {i}', 'filters': filters})
+
+    matched = {}
+    for search_idx, position in match_listings(compile_searches(searches), df):
+        matched.setdefault(search_idx, set()).add(position)
+    for i, search in enumerate(searches):
+        expected = set(np.flatnonzero(df.index.isin(apply_filters(df, search['filters']).index)))
+        assert matched.get(i, set()) == expected, search['name']
+    assert any(df.loc[list(positions), 'area'].isna().any() for positions in matched.values())
+    assert any(df.loc[list(positions), 'total_rental_price'].gt(MAX_PRICE).any() for positions in matched.values())
@@ -0,0 +1,36 @@
+import pandas as pd
+from bs4 import BeautifulSoup
+
+import scrape_boligportal
+from run_journal import RunJournal
+from scrape_boligportal import SEARCH_PATH, extract_listing_links, get_with_retries, is_last_page, page_url
+from stub_server import start_stub_server
+
+
+def test_scraper_walks_every_stub_listing_once():
+    server, url = start_stub_server(port=0, listings=40, latency_ms=0, jitter_ms=0)
+    try:
+        links, page = [], 0
+        while True:
+            soup = BeautifulSoup(get_with_retries(page_url(f'{url}{SEARCH_PATH}', page)).text, 'html.parser')
+            if is_last_page(soup):
+                break
+            links += extract_listing_links(soup)
+            page += 1
+    finally:
+        server.shutdown()
+    assert len(links) == len(set(links)) == 40
+    assert page == 3
+
+
+def test_scrape_of_a_finished_day_starts_over(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    server, url = start_stub_server(port=0, listings=30, latency_ms=0, jitter_ms=0)
+    try:
+        first = scrape_boligportal.main(url, 'raw', run_dir='run', today_date='2025-06-01')
+        second = scrape_boligportal.main(url, 'raw', run_dir='run', today_date='2025-06-01')
+    finally:
+        server.shutdown()
+    assert first['fetched'] == second['fetched'] == 30
+    assert RunJournal('run').is_complete()
+    assert len(pd.read_csv('raw/bolig_data_2025-06-01.csv')) == 30
@@ -0,0 +1,46 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+from benchmark_pipeline import random_filters
+from filters import add_derived_columns, apply_filters
+from preprocess_scraped_data import preprocess
+from synthetic_data import AREAS, generate_processed_frame, generate_raw_frame
+from text_store import listing_ids
+
+
+def through_csv(df, **kwargs):
+    return pd.read_csv(io.StringIO(df.to_csv(index=False)), **kwargs)
+
+
+def fail_on_warning(message):
+    raise AssertionError(message)
+
+
+def test_raw_frame_goes_through_preprocessing_and_filters():
+    raw = through_csv(generate_raw_frame(500, seed=1))
+    df = preprocess(raw, '2025-06-26', stats_dir=None)
+
+    assert len(df) == 500
+    assert set(df['area']) <= {area[0] for area in AREAS}
+    assert (df['monthly_rent'] > 0).all() and (df['size_sqm'] > 0).all()
+    assert df['available_from'].notna().all() and df['creation_date'].notna().all()
+    assert set(df['furnished']) <= {'Yes', 'No'}
+    assert (listing_ids(df.drop(columns='case_number')) == df['case_number']).all()
+
+    df = add_derived_columns(df)
+    rng = np.random.default_rng(0)
+    matched = [len(apply_filters(df, random_filters(rng, df), warn=fail_on_warning)) for _ in range(50)]
+    assert any(matched)
+
+
+def test_processed_frame_matches_preprocessing_output():
+    raw = through_csv(generate_raw_frame(200, seed=2))
+    preprocessed = preprocess(raw, '2025-06-26', stats_dir=None)
+    synthetic = through_csv(generate_processed_frame(200, seed=2))
+
+    assert set(synthetic.columns) <= set(preprocessed.columns)
+    for column in ['url', 'case_number', 'rooms', 'size_sqm', 'monthly_rent', 'floor', 'area', 'days_on_website']:
+        assert synthetic[column].tolist() == preprocessed[column].tolist(), column
+    assert (listing_ids(synthetic.drop(columns='case_number')) == synthetic['case_number']).all()
@@ -0,0 +1,67 @@
+import time
+
+import pytest
+
+import work_queue
+from work_queue import WorkQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = WorkQueue(str(tmp_path / 'crawl.db'))
+    yield queue
+    queue.close()
+
+
+def test_claim_hands_out_by_priority_and_only_once(queue):
+    queue.enqueue_many('run', 'listing', [('b', {'link': 'b'})], priority=1)
+    queue.enqueue_many('run', 'index', [('a', {'page': 0})], priority=0)
+    queue.enqueue_many('run', 'index', [('a', {'page': 0})], priority=0)
+
+    first = queue.claim('run', 'w1', lease_seconds=60, max_attempts=3)
+    second = queue.claim('run', 'w2', lease_seconds=60, max_attempts=3)
+    assert [item['key'] for item in first] == ['a']
+    assert [item['key'] for item in second] == ['b']
+    assert queue.claim('run', 'w3', lease_seconds=60, max_attempts=3) == []
+
+
+def test_expired_lease_is_reclaimed_and_old_owner_loses_it(queue):
+    queue.enqueue_many('run', 'listing', [('a', {})])
+    item = queue.claim('run', 'w1', lease_seconds=0.01, max_attempts=3)[0]
+    time.sleep(0.02)
+
+    reclaimed = queue.claim('run', 'w2', lease_seconds=60, max_attempts=3)
+    assert [r['id'] for r in reclaimed] == [item['id']]
+    assert reclaimed[0]['attempts'] == 2
+    assert not queue.complete(item['id'], 'w1', {'stale': True})
+    assert queue.complete(item['id'], 'w2', {'ok': True})
+    assert queue.results('run', 'listing') == [('a', {}, {'ok': True})]
+    assert queue.is_drained('run')
+
+
+def test_item_whose_lease_keeps_expiring_is_failed(queue):
+    queue.enqueue_many('run', 'listing', [('a', {})])
+    for _ in range(2):
+        assert queue.claim('run', 'w', lease_seconds=0.01, max_attempts=2)
+        time.sleep(0.02)
+
+    assert queue.claim('run', 'w', lease_seconds=60, max_attempts=2) == []
+    assert queue.counts('run') == {'listing': {'failed': 1}}
+    assert queue.is_drained('run')
+
+
+def test_fail_retries_until_max_attempts(queue):
+    queue.enqueue_many('run', 'listing', [('a', {})])
+    item = queue.claim('run', 'w', lease_seconds=60, max_attempts=2)[0]
+    queue.fail(item['id'], 'w', 'HTTP 500', max_attempts=2)
+    item = queue.claim('run', 'w', lease_seconds=60, max_attempts=2)[0]
+    queue.fail(item['id'], 'w', 'HTTP 500', max_attempts=2)
+    assert queue.counts('run') == {'listing': {'failed': 1}}
+
+
+def test_queue_refuses_another_host(tmp_path, monkeypatch):
+    path = str(tmp_path / 'crawl.db')
+    WorkQueue(path).close()
+    monkeypatch.setattr(work_queue.socket, 'gethostname', lambda: 'some-other-host')
+    with pytest.raises(RuntimeError, match='one host'):
+        WorkQueue(path)